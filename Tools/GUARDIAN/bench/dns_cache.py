@@ -0,0 +1,39 @@
+# bench/dns_cache.py
+# Lookup latency of the egress resolver: uncached (every call goes to the
+# system resolver / dnspython) versus the TTL cache the gateway uses.
+#
+#   python bench/dns_cache.py localhost httpbin.org
+import argparse, asyncio, statistics, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "detectors"))
+from egress_resolver import Resolver, ResolveError
+
+async def timed(fn, n: int) -> list[float]:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        try:
+            await fn()
+        except ResolveError:
+            pass
+        out.append((time.perf_counter() - t0) * 1e6)
+    return out
+
+async def main(args):
+    r = Resolver()
+    print(f"engine={r.engine}")
+    for host in args.hosts:
+        def uncached():
+            r.cache.pop(host, None)
+            return r.resolve(host)
+        cold = await timed(uncached, args.n)
+        warm = await timed(lambda: r.resolve(host), args.n)
+        print(f"{host:24} uncached p50={statistics.median(cold):9.1f} us  "
+              f"cached p50={statistics.median(warm):6.2f} us")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Egress resolver cache latency")
+    p.add_argument("hosts", nargs="*", default=["localhost"])
+    p.add_argument("--n", type=int, default=200)
+    asyncio.run(main(p.parse_args()))
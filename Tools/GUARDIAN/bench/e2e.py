@@ -0,0 +1,332 @@
+# bench/e2e.py
+# Whole stack on one machine: OOBSC, the honeytoken detector, the egress
+# gateway and the runtime supervisor run as local subprocesses, and a local
+# stand-in answers for httpbin.org. Paced load (ingest bytes/s, fetch req/s,
+# heartbeats/s) runs for --duration while tripwires fire every
+# --trip-interval; the report has throughput, p50/p99 and
+# tripwire-to-child-kill latency, and --json writes it for comparison
+# between commits (--baseline prints the deltas).
+#
+#   python bench/e2e.py --agents 8 --ingest-mbps 50 --fetch-rps 200 --hb-rps 5000
+#
+# Load is open loop: each request has a scheduled send time and its latency
+# counts from then, so a stalled service shows up as latency, not as a
+# politely lower rate. Kill latency is taken with pidfds on the agent
+# processes (Linux).
+import argparse, asyncio, json, os, shutil, subprocess, sys, tempfile, time
+from pathlib import Path
+import httpx
+from loadgen import Conn, percentile
+
+ROOT = Path(__file__).resolve().parent.parent
+DECOY = "E2E-DECOY-" + os.urandom(8).hex()
+
+# Agent stand-in: records its pid under its agent id, then idles.
+AGENT = ("import os, sys, time; "
+         "open(os.path.join(sys.argv[1], os.environ['GUARDIAN_AGENT_ID']), 'w').write(str(os.getpid())); "
+         "time.sleep(10**9)")
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+class Stack:
+    def __init__(self, args, tmp: Path):
+        self.args = args
+        self.tmp = tmp
+        self.procs: list[tuple[str, subprocess.Popen]] = []
+        self.oobsc = f"http://127.0.0.1:{args.port}"
+        self.detector = f"http://127.0.0.1:{args.port + 1}"
+        self.egress = f"http://127.0.0.1:{args.port + 2}"
+        self.upstream_port = args.port + 3
+        self.pids = tmp / "pids"
+        self.pids.mkdir()
+        decoys = tmp / "decoys"
+        decoys.mkdir()
+        (decoys / "e2e.txt").write_text(DECOY)
+        self.env = dict(os.environ, OOBSC_URL=self.oobsc, DECOY_DIR=str(decoys), AUTH_TOKEN="",
+                        METRICS_PORT="0", PYTHONUNBUFFERED="1", PYTHONPATH=str(ROOT / "common"))
+
+    def spawn(self, name: str, cwd: str, cmd: list[str], **env):
+        log = open(self.tmp / f"{name}.log", "w")
+        proc = subprocess.Popen(cmd, cwd=ROOT / cwd, env={**self.env, **env}, stdout=log, stderr=subprocess.STDOUT)
+        self.procs.append((name, proc))
+
+    def uvicorn(self, name: str, cwd: str, app: str, url: str, **env):
+        port = url.rsplit(":", 1)[1]
+        self.spawn(name, cwd, [sys.executable, "-m", "uvicorn", app, "--host", "127.0.0.1", "--port", port,
+                               "--log-level", "warning"], **env)
+
+    async def start(self):
+        a = self.args
+        self.uvicorn("oobsc", "oobsc", "app:app", self.oobsc)
+        await self.ready(self.oobsc)
+        self.uvicorn("detector", "detectors", "honeytoken_detector:app", self.detector)
+        self.uvicorn("egress", "detectors", "egress_gateway:app", self.egress,
+                     ALLOWED_DOMAINS="127.0.0.1", EGRESS_BLOCK_PRIVATE="0")
+        await self.ready(self.detector)
+        await self.ready(self.egress)
+        self.spawn("runtime", "runtime", [sys.executable, "supervisor.py"], GUARDED_AGENTS=str(a.agents),
+                   AGENT_CMD=f"{sys.executable} -c \"{AGENT}\" {self.pids}", HEARTBEAT_SOURCE="e2e")
+        await self.agents_up(set())
+
+    async def ready(self, url: str, timeout: float = 20):
+        deadline = time.monotonic() + timeout
+        async with httpx.AsyncClient() as c:
+            while time.monotonic() < deadline:
+                try:
+                    if (await c.get(f"{url}/health")).is_success:
+                        return
+                except httpx.HTTPError:
+                    pass
+                await asyncio.sleep(0.1)
+        raise SystemExit(f"{url} did not start; logs in {self.tmp}")
+
+    async def agents_up(self, old: set[int], timeout: float = 20) -> dict[str, int]:
+        """Wait until every agent is running with a pid not in `old`."""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            pids = {}
+            for f in self.pids.iterdir():
+                try:
+                    pids[f.name] = int(f.read_text())
+                except ValueError:
+                    continue  # being written
+            if len(pids) == self.args.agents and not old & set(pids.values()) and all(map(alive, pids.values())):
+                return pids
+            await asyncio.sleep(0.02)
+        raise SystemExit(f"agents did not (re)start; logs in {self.tmp}")
+
+    def stop(self):
+        for _name, proc in reversed(self.procs):
+            proc.terminate()
+        for name, proc in self.procs:
+            try:
+                proc.wait(10)
+            except subprocess.TimeoutExpired:
+                print(f"[e2e] {name} ignored SIGTERM; killing", flush=True)
+                proc.kill()
+
+def alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+async def exited(pid: int):
+    """Resolves when pid terminates; works for processes we did not spawn."""
+    try:
+        fd = os.pidfd_open(pid)
+    except ProcessLookupError:
+        return
+    loop = asyncio.get_running_loop()
+    done = loop.create_future()
+    loop.add_reader(fd, lambda: done.done() or done.set_result(None))
+    try:
+        await done
+    finally:
+        loop.remove_reader(fd)
+        os.close(fd)
+
+async def upstream(delay: float, size: int):
+    """Stand-in for httpbin.org: keep-alive HTTP/1.1, fixed body."""
+    body = b"x" * size
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        await reader.readexactly(int(line.split(b":")[1]))
+                if delay:
+                    await asyncio.sleep(delay)
+                writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: application/json\r\n"
+                             b"content-length: %d\r\n\r\n" % len(body) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    return handle
+
+async def paced(url: str, rate: float, concurrency: int, stop: asyncio.Event, request) -> dict:
+    """Issue `await request(conn, i) -> units` at `rate` requests/s from up to
+    `concurrency` keep-alive connections until `stop` is set."""
+    lat, errors, units = [], 0, 0
+    slot = 0
+    t0 = time.perf_counter()
+
+    async def worker():
+        nonlocal slot, errors, units
+        conn = Conn(url)
+        try:
+            while not stop.is_set():
+                i, slot = slot, slot + 1
+                due = t0 + i / rate
+                wait = due - time.perf_counter()
+                if wait > 0:
+                    try:
+                        await asyncio.wait_for(stop.wait(), wait)
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                try:
+                    n = await request(conn, i)  # not `units += await ...` (see loadgen.run_load)
+                except (OSError, asyncio.IncompleteReadError, ValueError):
+                    errors += 1
+                    conn.close()
+                    continue
+                units += n
+                lat.append(time.perf_counter() - due)
+        finally:
+            conn.close()
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    return {"target_rps": rate, "rps": len(lat) / elapsed, "units_per_sec": units / elapsed,
+            "requests": len(lat), "errors": errors,
+            "p50_ms": percentile(lat, 50) * 1000, "p99_ms": percentile(lat, 99) * 1000}
+
+def expect(status: int, want: int = 200):
+    if status != want:
+        raise ValueError(f"HTTP {status}")
+
+def load_streams(stack: Stack, args) -> dict:
+    filler = (os.urandom(args.ingest_kb * 512).hex().encode())[: args.ingest_kb * 1024]
+    fetch = {"url": f"http://127.0.0.1:{stack.upstream_port}/anything", "method": "POST",
+             "headers": {"content-type": "application/json"}, "body": '{"q": "status"}'}
+
+    async def ingest(conn, i):
+        status, _ = await conn.request("POST", "/ingest", body=filler)
+        expect(status)
+        return len(filler)
+
+    async def fetch_one(conn, i):
+        status, _ = await conn.request("POST", "/fetch", json_body=fetch)
+        expect(status)
+        return 1
+
+    async def beat(conn, i):
+        names = [f"load-{(i * args.hb_batch + j) % args.hb_agents}" for j in range(args.hb_batch)]
+        status, _ = await conn.request("POST", "/heartbeat/batch", json_body=names)
+        expect(status)
+        return len(names)
+
+    streams = {}
+    if args.ingest_mbps:
+        streams["ingest"] = (stack.detector, args.ingest_mbps * 1024 * 1024 / len(filler), ingest)
+    if args.fetch_rps:
+        streams["fetch"] = (stack.egress, args.fetch_rps, fetch_one)
+    if args.hb_rps:
+        streams["heartbeat"] = (stack.oobsc, args.hb_rps / args.hb_batch, beat)
+    return streams
+
+async def trips(stack: Stack, args, stop: asyncio.Event) -> list[dict]:
+    """Fire a tripwire, time until every agent process is gone, clear
+    inhibit, wait for the relaunch; repeat until `stop`."""
+    out = []
+    pids = await stack.agents_up(set())
+    async with httpx.AsyncClient(timeout=10) as c:
+        while not stop.is_set():
+            try:
+                await asyncio.wait_for(stop.wait(), args.trip_interval)
+                break
+            except asyncio.TimeoutError:
+                pass
+            t0 = time.perf_counter()
+            r = await c.post(f"{stack.detector}/ingest", content=f"payload {DECOY} payload".encode())
+            detected = time.perf_counter()
+            if not r.json().get("matched"):
+                raise SystemExit("tripwire was not detected")
+            await asyncio.wait_for(asyncio.gather(*(exited(p) for p in pids.values())), 30)
+            killed = time.perf_counter()
+            out.append({"detect_ms": (detected - t0) * 1000, "kill_ms": (killed - t0) * 1000})
+            await c.post(f"{stack.oobsc}/inhibit", json={"inhibit": False})
+            pids = await stack.agents_up(set(pids.values()))
+    return out
+
+def summarize_trips(rows: list[dict]) -> dict:
+    kill = sorted(r["kill_ms"] for r in rows)
+    detect = sorted(r["detect_ms"] for r in rows)
+    return {"trips": len(rows),
+            "detect_p50_ms": percentile(detect, 50), "detect_p99_ms": percentile(detect, 99),
+            "kill_p50_ms": percentile(kill, 50), "kill_p99_ms": percentile(kill, 99),
+            "kill_max_ms": kill[-1] if kill else 0.0}
+
+async def run(args) -> dict:
+    tmp = Path(tempfile.mkdtemp(prefix="guardian-e2e-"))
+    stack = Stack(args, tmp)
+    server = await asyncio.start_server(await upstream(args.upstream_delay_ms / 1000, args.upstream_kb * 1024),
+                                        "127.0.0.1", stack.upstream_port)
+    try:
+        await stack.start()
+        stop = asyncio.Event()
+        streams = load_streams(stack, args)
+        tasks = {name: asyncio.create_task(paced(url, rate, args.concurrency, stop, fn))
+                 for name, (url, rate, fn) in streams.items()}
+        tripper = asyncio.create_task(trips(stack, args, stop))
+        await asyncio.sleep(args.duration)
+        stop.set()
+        result = {"rev": git_rev(), "ts": time.time(), "config": vars(args),
+                  "load": {name: await t for name, t in tasks.items()},
+                  "kill": summarize_trips(await tripper)}
+    finally:
+        stack.stop()
+        await asyncio.sleep(0.2)  # let the upstream's connections see EOF
+        server.close()
+    if args.keep_logs:
+        print(f"[e2e] logs in {tmp}", flush=True)
+    else:
+        shutil.rmtree(tmp, ignore_errors=True)
+    return result
+
+def report(result: dict, baseline: dict | None):
+    def vs(now: float, *path) -> str:
+        base = baseline
+        for key in path:
+            base = base.get(key) if isinstance(base, dict) else None
+        return f" ({(now - base) / base * 100:+.1f}%)" if base else ""
+    for name, r in result["load"].items():
+        at = ("load", name)
+        print(f"{name:9} {r['rps']:9,.0f} req/s of {r['target_rps']:,.0f}{vs(r['rps'], *at, 'rps')}  "
+              f"{r['units_per_sec']:12,.0f} units/s  p50 {r['p50_ms']:7.2f} ms{vs(r['p50_ms'], *at, 'p50_ms')}  "
+              f"p99 {r['p99_ms']:7.2f} ms{vs(r['p99_ms'], *at, 'p99_ms')}  errors {r['errors']}", flush=True)
+    k = result["kill"]
+    print(f"tripwire  {k['trips']} trips  detect p50 {k['detect_p50_ms']:.1f} ms  "
+          f"kill p50 {k['kill_p50_ms']:.1f} ms{vs(k['kill_p50_ms'], 'kill', 'kill_p50_ms')}  "
+          f"p99 {k['kill_p99_ms']:.1f} ms{vs(k['kill_p99_ms'], 'kill', 'kill_p99_ms')}  "
+          f"max {k['kill_max_ms']:.1f} ms", flush=True)
+
+def main(args):
+    baseline = json.loads(Path(args.baseline).read_text()) if args.baseline else None
+    result = asyncio.run(run(args))
+    report(result, baseline)
+    if args.json:
+        Path(args.json).write_text(json.dumps(result, indent=2))
+    if not result["kill"]["trips"]:
+        raise SystemExit("no tripwire completed; raise --duration or lower --trip-interval")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="End-to-end GUARDIAN load and kill latency")
+    p.add_argument("--port", type=int, default=8740, help="first of four consecutive local ports")
+    p.add_argument("--duration", type=float, default=20.0)
+    p.add_argument("--agents", type=int, default=4, help="guarded agent processes under the supervisor")
+    p.add_argument("--concurrency", type=int, default=16, help="connections per load stream")
+    p.add_argument("--ingest-mbps", type=float, default=20.0, help="clean ingest MiB/s (0 = off)")
+    p.add_argument("--ingest-kb", type=int, default=64, help="ingest body size")
+    p.add_argument("--fetch-rps", type=float, default=100.0, help="/fetch requests/s (0 = off)")
+    p.add_argument("--hb-rps", type=float, default=2000.0, help="heartbeats/s (0 = off)")
+    p.add_argument("--hb-batch", type=int, default=100, help="heartbeats per /heartbeat/batch call")
+    p.add_argument("--hb-agents", type=int, default=1000, help="distinct synthetic heartbeat agents")
+    p.add_argument("--upstream-delay-ms", type=float, default=5.0)
+    p.add_argument("--upstream-kb", type=int, default=4)
+    p.add_argument("--trip-interval", type=float, default=2.0, help="seconds between tripwires")
+    p.add_argument("--json", default=None, help="write results to this file")
+    p.add_argument("--baseline", default=None, help="earlier --json output to compare against")
+    p.add_argument("--keep-logs", action="store_true")
+    main(p.parse_args())
@@ -0,0 +1,88 @@
+# bench/egress_pool.py
+# Upstream latency of the egress gateway: a fresh client per fetch (what
+# /fetch used to do) versus the pooled per-origin clients, plus a check that
+# a saturated slow origin does not delay fetches to another one.
+#
+#   python bench/egress_pool.py                          # local stand-in upstreams
+#   python bench/egress_pool.py --url https://httpbin.org/get
+import argparse, asyncio, os, statistics, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "detectors"))
+os.environ.setdefault("UPSTREAM_HOST_CONCURRENCY", "4")
+import httpx
+from upstream_pool import UpstreamPools, PoolBusy
+
+async def upstream(reader, writer, delay: float = 0.0):
+    try:
+        while True:
+            await reader.readuntil(b"\r\n\r\n")
+            if delay:
+                await asyncio.sleep(delay)
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-length: 2\r\n\r\nok")
+            await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+
+def summary(name: str, ms: list[float]):
+    ms = sorted(ms)
+    print(f"{name:8} n={len(ms)} p50={statistics.median(ms):.2f} ms "
+          f"p99={ms[int(len(ms) * 0.99) - 1]:.2f} ms mean={statistics.fmean(ms):.2f} ms")
+
+async def cold(url: str, n: int) -> list[float]:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        async with httpx.AsyncClient(timeout=10, follow_redirects=True) as c:
+            (await c.get(url)).raise_for_status()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+async def pooled(pools: UpstreamPools, url: str, n: int) -> list[float]:
+    out = []
+    for _ in range(n):
+        t0 = time.perf_counter()
+        async with pools.slot(url) as c:
+            (await c.get(url)).raise_for_status()
+        out.append((time.perf_counter() - t0) * 1000)
+    return out
+
+async def isolation(pools: UpstreamPools, fast: str, slow: str, n: int):
+    async def hit_slow():
+        try:
+            async with pools.slot(slow) as c:
+                await c.get(slow)
+        except PoolBusy:
+            pass
+    hogs = [asyncio.create_task(hit_slow()) for _ in range(40)]
+    await asyncio.sleep(0.1)  # slow origin saturated, its queue filling
+    summary("isolated", await pooled(pools, fast, n))
+    print(f"slow origin while measuring: {pools.stats()['origins']}")
+    await asyncio.gather(*hogs)
+
+async def main(args):
+    servers = []
+    if args.url:
+        fast = slow = None
+        url = args.url
+    else:
+        servers.append(await asyncio.start_server(upstream, "127.0.0.1", 0))
+        servers.append(await asyncio.start_server(lambda r, w: upstream(r, w, delay=1.0), "127.0.0.1", 0))
+        fast = url = f"http://127.0.0.1:{servers[0].sockets[0].getsockname()[1]}/"
+        slow = f"http://127.0.0.1:{servers[1].sockets[0].getsockname()[1]}/"
+    pools = UpstreamPools(timeout=10)
+    try:
+        summary("cold", await cold(url, args.n))
+        summary("pooled", await pooled(pools, url, args.n))
+        if slow:
+            await isolation(pools, fast, slow, args.n)
+    finally:
+        await pools.close()
+        for s in servers:
+            s.close()
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Egress gateway cold vs pooled upstream latency")
+    p.add_argument("--n", type=int, default=200, help="fetches per mode")
+    p.add_argument("--url", default=None, help="real upstream instead of the local stand-in")
+    asyncio.run(main(p.parse_args()))
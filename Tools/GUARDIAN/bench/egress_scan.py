@@ -0,0 +1,43 @@
+# bench/egress_scan.py
+# Cost the inline decoy scan adds to /fetch: scan_outbound() on a typical
+# API request (URL with query, a few headers, JSON body) for several body
+# sizes and decoy-set sizes.
+#
+#   python bench/egress_scan.py --decoys 1 100 1000
+import argparse, os, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "detectors"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))  # metrics.py
+os.environ.setdefault("OOBSC_URL", "http://127.0.0.1:1")
+import egress_gateway
+from honeytoken_matcher import Matcher
+
+def per_call_us(fn, n: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(n):
+        fn()
+    return (time.perf_counter() - t0) / n * 1e6
+
+def main(args):
+    for decoys in args.decoys:
+        tokens = {f"decoy_{i}.txt": f"DECOY-{i:06d}-{os.urandom(8).hex()}" for i in range(decoys)}
+        egress_gateway.MATCHER = matcher = Matcher(tokens)
+        for size in args.sizes:
+            req = egress_gateway.FetchReq(
+                url="https://api.example.com/v1/search?q=python+asyncio&page=2",
+                method="POST",
+                headers={"Accept": "application/json", "User-Agent": "agent/1.0",
+                         "Content-Type": "application/json"},
+                body='{"q": "' + "a" * size + '"}',
+            )
+            assert egress_gateway.scan_outbound(req) is None
+            us = per_call_us(lambda: egress_gateway.scan_outbound(req), args.n)
+            print(f"engine={matcher.engine} decoys={decoys:5} body={size:7} B  {us:8.2f} us/request")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Inline outbound decoy scan cost")
+    p.add_argument("--decoys", type=int, nargs="+", default=[1, 100, 1000])
+    p.add_argument("--sizes", type=int, nargs="+", default=[0, 1024, 16 * 1024])
+    p.add_argument("--n", type=int, default=20000)
+    main(p.parse_args())
@@ -0,0 +1,107 @@
+# bench/egress_stream.py
+# Throughput of the egress gateway relaying a large download.
+#
+#   python bench/egress_stream.py --mb 256
+#
+# Starts a local stand-in upstream and a gateway (uvicorn) that allows
+# 127.0.0.1, then downloads the same body directly, through /fetch in
+# stream mode, and through /fetch in summary mode. The gateway's peak RSS
+# (VmHWM) is reported to show memory stays bounded by the chunk size.
+import argparse, asyncio, json, os, subprocess, sys, time
+from pathlib import Path
+
+DETECTORS = Path(__file__).resolve().parent.parent / "detectors"
+COMMON = DETECTORS.parent / "common"  # metrics.py
+BLOCK = os.urandom(1024 * 1024)  # binary on purpose: must survive byte-exact
+
+async def upstream(reader, writer):
+    # GET /<n> -> n MiB of BLOCK, with a content-length; keep-alive
+    try:
+        while True:
+            head = await reader.readuntil(b"\r\n\r\n")
+            mb = int(head.split(b" ")[1].strip(b"/") or 1)
+            writer.write(b"HTTP/1.1 200 OK\r\ncontent-type: application/octet-stream\r\n"
+                         b"content-length: %d\r\n\r\n" % (mb * len(BLOCK)))
+            for _ in range(mb):
+                writer.write(BLOCK)
+                await writer.drain()
+    except (asyncio.IncompleteReadError, ConnectionError):
+        writer.close()
+
+async def download(port: int, method: str, path: str, body: bytes = b"") -> tuple[int, float, bool]:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    head = f"{method} {path} HTTP/1.1\r\nhost: bench\r\ncontent-type: application/json\r\ncontent-length: {len(body)}\r\n\r\n"
+    t0 = time.perf_counter()
+    writer.write(head.encode() + body)
+    hdrs = (await reader.readuntil(b"\r\n\r\n")).lower()
+    n, intact, pos = 0, True, 0
+    if b"transfer-encoding: chunked" in hdrs:
+        while True:
+            size = int((await reader.readuntil(b"\r\n")).strip(), 16)
+            data = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            intact &= check(data[:-2], pos)
+            pos += size
+            n += size
+    else:
+        length = int(hdrs.split(b"content-length:")[1].split(b"\r\n")[0])
+        while n < length:
+            data = await reader.read(min(1 << 20, length - n))
+            intact &= check(data, pos)
+            pos += len(data)
+            n += len(data)
+    writer.close()
+    return n, time.perf_counter() - t0, intact
+
+def check(data: bytes, pos: int) -> bool:
+    off = pos % len(BLOCK)
+    want = (BLOCK[off:] + BLOCK * (len(data) // len(BLOCK) + 1))[:len(data)]
+    return data == want
+
+def vm_hwm_mb(pid: int) -> float:
+    for line in Path(f"/proc/{pid}/status").read_text().splitlines():
+        if line.startswith("VmHWM:"):
+            return int(line.split()[1]) / 1024
+    return 0.0
+
+async def main(args):
+    server = await asyncio.start_server(upstream, "127.0.0.1", args.upstream_port)
+    env = dict(os.environ, ALLOWED_DOMAINS="127.0.0.1", OOBSC_URL="http://127.0.0.1:9",
+               FETCH_STREAM_CHUNK_KB=str(args.chunk_kb), FETCH_TIMEOUT_SEC="60", PYTHONPATH=str(COMMON))
+    gw = subprocess.Popen([sys.executable, "-m", "uvicorn", "egress_gateway:app", "--app-dir", str(DETECTORS),
+                           "--port", str(args.port), "--log-level", "warning"], env=env)
+    try:
+        for _ in range(50):
+            try:
+                await download(args.port, "GET", "/health")
+                break
+            except (OSError, ValueError, IndexError, asyncio.IncompleteReadError):
+                await asyncio.sleep(0.2)
+        base = vm_hwm_mb(gw.pid)
+        url = f"http://127.0.0.1:{args.upstream_port}/{args.mb}"
+        n, dt, ok = await download(args.upstream_port, "GET", f"/{args.mb}")
+        print(f"direct   {n / 1e6:8.1f} MB in {dt:6.2f}s -> {n / dt / 1e6:7.1f} MB/s")
+        n, dt, ok = await download(args.port, "POST", "/fetch", json.dumps({"url": url, "stream": True}).encode())
+        print(f"stream   {n / 1e6:8.1f} MB in {dt:6.2f}s -> {n / dt / 1e6:7.1f} MB/s, byte-exact={ok}")
+        print(f"gateway peak RSS {vm_hwm_mb(gw.pid):.1f} MB (idle {base:.1f} MB, chunk {args.chunk_kb} KB)")
+        t0 = time.perf_counter()
+        reader, writer = await asyncio.open_connection("127.0.0.1", args.port)
+        body = json.dumps({"url": url, "stream": False}).encode()
+        writer.write(b"POST /fetch HTTP/1.1\r\nhost: bench\r\ncontent-type: application/json\r\n"
+                     b"content-length: %d\r\n\r\n" % len(body) + body)
+        await reader.readuntil(b"\r\n\r\n")
+        writer.close()
+        print(f"summary  first 2000 chars in {(time.perf_counter() - t0) * 1000:.1f} ms")
+    finally:
+        gw.terminate()
+        gw.wait()
+        server.close()
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Egress gateway streaming throughput")
+    p.add_argument("--mb", type=int, default=256, help="download size in MiB")
+    p.add_argument("--chunk_kb", type=int, default=64)
+    p.add_argument("--port", type=int, default=8710)
+    p.add_argument("--upstream_port", type=int, default=8711)
+    asyncio.run(main(p.parse_args()))
@@ -0,0 +1,111 @@
+# bench/heartbeat_paths.py
+# Beats/second into OOBSC over the three heartbeat paths:
+#   single  POST /heartbeat (one JSON beat per request)
+#   batch   POST /heartbeat/batch (many agents per request)
+#   udp     compact datagrams to HEARTBEAT_UDP_PORT
+#
+#   python bench/heartbeat_paths.py                  # spawns a local OOBSC
+#   python bench/heartbeat_paths.py --url http://127.0.0.1:8000 --udp_port 8001
+#
+# Rates are taken from OOBSC's own /health "beats" counter, so UDP loss is
+# not counted as throughput.
+import argparse, asyncio, os, socket, subprocess, sys, time
+from pathlib import Path
+import httpx
+
+OOBSC_DIR = Path(__file__).resolve().parent.parent / "oobsc"
+sys.path.insert(0, str(OOBSC_DIR))
+from heartbeats import pack_beats
+from loadgen import run_load
+
+def spawn_oobsc(port: int, udp_port: int) -> subprocess.Popen:
+    env = dict(os.environ, HEARTBEAT_UDP_PORT=str(udp_port), PYTHONPATH=str(OOBSC_DIR.parent / "common"))
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=OOBSC_DIR, env=env)
+    for _ in range(100):
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").is_success:
+                return proc
+        except httpx.HTTPError:
+            time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("OOBSC did not start")
+
+async def beats_total(client: httpx.AsyncClient) -> int:
+    return (await client.get("/health")).json()["beats"]
+
+async def measure(client, name, duration, work):
+    before = await beats_total(client)
+    t0 = time.perf_counter()
+    sent = await work(t0 + duration)
+    await asyncio.sleep(0.2)  # let in-flight datagrams land
+    dt = time.perf_counter() - t0 - 0.2
+    landed = await beats_total(client) - before
+    print(f"{name:7s} {landed / dt:12,.0f} beats/s  (sent {sent:,}, landed {landed:,})")
+    return {"path": name, "beats_per_sec": landed / dt, "sent": sent, "landed": landed}
+
+async def main(args):
+    async with httpx.AsyncClient(base_url=args.url) as client:
+        agents = [f"agent-{i}" for i in range(args.agents)]
+
+        async def single(deadline):
+            async def one(conn, i):
+                await conn.request("POST", "/heartbeat", json_body={"agent": agents[i % len(agents)]})
+                return 1
+            r = await run_load(args.url, args.concurrency, deadline - time.perf_counter(), one)
+            return r["requests"]
+
+        async def batch(deadline):
+            async def many(conn, i):
+                chunk = [agents[(i * args.batch + j) % len(agents)] for j in range(args.batch)]
+                await conn.request("POST", "/heartbeat/batch", json_body=chunk)
+                return len(chunk)
+            r = await run_load(args.url, args.concurrency, deadline - time.perf_counter(), many)
+            return r["requests"] * args.batch
+
+        async def udp(deadline):
+            sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            target = (args.udp_host, args.udp_port)
+            seq, sent, per_dgram = 0, 0, args.udp_records
+            epoch = int(time.time())  # this sender's boot epoch
+            while time.perf_counter() < deadline:
+                for _ in range(64):
+                    seq += 1
+                    base = sent % len(agents)
+                    sock.sendto(pack_beats([(agents[(base + j) % len(agents)], seq) for j in range(per_dgram)], epoch), target)
+                    sent += per_dgram
+                await asyncio.sleep(0)  # give the pacing a chance; UDP has no backpressure
+            sock.close()
+            return sent
+
+        results = [
+            await measure(client, "single", args.duration, single),
+            await measure(client, "batch", args.duration, batch),
+            await measure(client, "udp", args.duration, udp),
+        ]
+        base = results[0]["beats_per_sec"] or 1
+        for r in results[1:]:
+            print(f"{r['path']:7s} x{r['beats_per_sec'] / base:.1f} vs single")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="OOBSC heartbeat ingestion benchmark")
+    p.add_argument("--url", default=None, help="running OOBSC (default: spawn one)")
+    p.add_argument("--port", type=int, default=8700)
+    p.add_argument("--udp_host", default="127.0.0.1")
+    p.add_argument("--udp_port", type=int, default=8701)
+    p.add_argument("--agents", type=int, default=10000)
+    p.add_argument("--batch", type=int, default=500)
+    p.add_argument("--udp_records", type=int, default=40, help="beats per datagram")
+    p.add_argument("--concurrency", type=int, default=16)
+    p.add_argument("--duration", type=float, default=5.0)
+    args = p.parse_args()
+    proc = None
+    if args.url is None:
+        proc = spawn_oobsc(args.port, args.udp_port)
+        args.url = f"http://127.0.0.1:{args.port}"
+    try:
+        asyncio.run(main(args))
+    finally:
+        if proc:
+            proc.terminate()
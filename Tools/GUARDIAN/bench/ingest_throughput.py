@@ -0,0 +1,67 @@
+# bench/ingest_throughput.py
+# Throughput of the honeytoken scan on large bodies.
+#
+#   python bench/ingest_throughput.py --mb 512                 # in-process scanner
+#   python bench/ingest_throughput.py --mb 512 --url http://127.0.0.1:9000/ingest
+#
+# The token is planted at the very end of the body (worst case) so every byte
+# is scanned. Peak RSS is reported to show memory stays bounded.
+import argparse, os, resource, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "detectors"))
+from honeytoken_matcher import Matcher
+
+TOKEN = b"FAKE_API_KEY=XYZ-123-SUPER-SECRET"
+
+def body_chunks(total: int, chunk: int):
+    # Printable filler; the token straddles the last chunk boundary.
+    block = (os.urandom(chunk // 2).hex().encode())[:chunk]
+    sent = 0
+    while sent + chunk < total - len(TOKEN):
+        yield block
+        sent += chunk
+    tail = block[: total - sent - len(TOKEN)] + TOKEN
+    half = len(tail) - len(TOKEN) // 2
+    yield tail[:half]
+    yield tail[half:]
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def bench_local(total: int, chunk: int, decoys: int):
+    tokens = {f"decoy_{i}.txt": f"DECOY-{i:06d}-{os.urandom(8).hex()}" for i in range(decoys)}
+    tokens["fake_key.txt"] = TOKEN.decode()
+    matcher = Matcher(tokens)
+    scanner = matcher.scanner()
+    t0 = time.perf_counter()
+    hit = None
+    for c in body_chunks(total, chunk):
+        hit = scanner.feed(c)
+        if hit:
+            break
+    dt = time.perf_counter() - t0
+    print(f"engine={matcher.engine} decoys={len(matcher)} chunk={chunk}")
+    print(f"patterns={matcher.patterns}")
+    print(f"scanned {scanner.scanned / 1e6:.1f} MB in {dt:.2f}s -> {scanner.scanned / dt / 1e6:.1f} MB/s, match={hit}")
+    print(f"peak RSS {peak_rss_mb():.1f} MB")
+
+def bench_http(url: str, total: int, chunk: int):
+    import httpx
+    t0 = time.perf_counter()
+    r = httpx.post(url, content=body_chunks(total, chunk), timeout=None)
+    dt = time.perf_counter() - t0
+    print(f"POST {total / 1e6:.1f} MB in {dt:.2f}s -> {total / dt / 1e6:.1f} MB/s: {r.status_code} {r.text}")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Honeytoken ingest throughput")
+    p.add_argument("--mb", type=int, default=256, help="body size in MB")
+    p.add_argument("--chunk_kb", type=int, default=64)
+    p.add_argument("--decoys", type=int, default=1000, help="extra decoys to compile (local mode)")
+    p.add_argument("--url", default=None, help="POST to a running detector instead")
+    args = p.parse_args()
+    total, chunk = args.mb * 1024 * 1024, args.chunk_kb * 1024
+    if args.url:
+        bench_http(args.url, total, chunk)
+    else:
+        bench_local(total, chunk, args.decoys)
@@ -0,0 +1,83 @@
+# bench/loadgen.py
+# Minimal keep-alive HTTP/1.1 load generator. httpx.AsyncClient's pool
+# becomes the bottleneck with dozens of concurrent requests, which would
+# make the benchmarks measure the client rather than the service.
+import asyncio, json, time
+from urllib.parse import urlparse
+
+class Conn:
+    def __init__(self, url: str):
+        u = urlparse(url)
+        self.host, self.port = u.hostname, u.port or 80
+        self.reader = self.writer = None
+
+    async def request(self, method: str, path: str, body: bytes | None = None,
+                      json_body=None, headers: dict | None = None) -> tuple[int, bytes]:
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        if json_body is not None:
+            body = json.dumps(json_body).encode()
+            headers = {"content-type": "application/json", **(headers or {})}
+        body = body or b""
+        head = f"{method} {path} HTTP/1.1\r\nhost: {self.host}\r\ncontent-length: {len(body)}\r\n"
+        for k, v in (headers or {}).items():
+            head += f"{k}: {v}\r\n"
+        self.writer.write(head.encode() + b"\r\n" + body)
+        raw = await self.reader.readuntil(b"\r\n\r\n")
+        lines = raw.split(b"\r\n")
+        status = int(lines[0].split()[1])
+        hdrs = {k.strip().lower(): v.strip() for k, _, v in (l.partition(b":") for l in lines[1:] if l)}
+        if b"content-length" in hdrs:
+            data = await self.reader.readexactly(int(hdrs[b"content-length"]))
+        elif hdrs.get(b"transfer-encoding") == b"chunked":
+            data = b""
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).strip(), 16)
+                data += await self.reader.readexactly(size + 2)
+                if size == 0:
+                    break
+        else:
+            data = await self.reader.read()
+        if hdrs.get(b"connection") == b"close":
+            self.close()
+        return status, data
+
+    def close(self):
+        if self.writer:
+            self.writer.close()
+        self.reader = self.writer = None
+
+def percentile(sorted_vals: list[float], p: float) -> float:
+    if not sorted_vals:
+        return 0.0
+    return sorted_vals[min(len(sorted_vals) - 1, int(p / 100 * len(sorted_vals)))]
+
+async def run_load(url: str, concurrency: int, duration: float, request) -> dict:
+    """Drive `await request(conn, i) -> units` from `concurrency` keep-alive
+    connections for `duration` seconds; returns rate and latency percentiles."""
+    units, lat = 0, []
+    deadline = time.perf_counter() + duration
+
+    async def worker(k):
+        nonlocal units
+        conn, i = Conn(url), k
+        try:
+            while time.perf_counter() < deadline:
+                t0 = time.perf_counter()
+                n = await request(conn, i)  # not `units += await ...`: that reads units before awaiting
+                units += n
+                lat.append(time.perf_counter() - t0)
+                i += concurrency
+        finally:
+            conn.close()
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(worker(k) for k in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    lat.sort()
+    return {
+        "rate": units / elapsed,
+        "requests": len(lat),
+        "p50_ms": percentile(lat, 50) * 1000,
+        "p99_ms": percentile(lat, 99) * 1000,
+    }
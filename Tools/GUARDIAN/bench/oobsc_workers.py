@@ -0,0 +1,110 @@
+# bench/oobsc_workers.py
+# Scale OOBSC across uvicorn workers (serve.py + shared state server).
+#
+#   python bench/oobsc_workers.py --workers 1 2 4
+#
+# For each worker count this first checks inhibit consistency (after every
+# POST /inhibit returns, fresh connections, which land on arbitrary
+# workers, must all read the new value), then measures heartbeat and
+# /status throughput with concurrent clients. Exits non-zero on any
+# inconsistent read.
+import argparse, asyncio, json, os, subprocess, sys, tempfile, time
+from pathlib import Path
+import httpx
+from loadgen import run_load
+
+OOBSC_DIR = Path(__file__).resolve().parent.parent / "oobsc"
+
+def spawn(workers: int, port: int, tmp: str) -> subprocess.Popen:
+    env = dict(os.environ, OOBSC_WORKERS=str(workers), PORT=str(port), HOST="127.0.0.1",
+               STATE_SOCKET=os.path.join(tmp, "state.sock"), STATE_DIR=os.path.join(tmp, "state"),
+               PYTHONPATH=str(OOBSC_DIR.parent / "common"))  # metrics.py
+    proc = subprocess.Popen([sys.executable, "serve.py"], cwd=OOBSC_DIR, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    for _ in range(150):
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/health").is_success:
+                time.sleep(0.5 * workers)  # let every worker finish startup
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    proc.kill()
+    raise SystemExit("OOBSC did not start")
+
+async def check_consistency(url: str, flips: int, reads: int) -> tuple[int, int, int]:
+    bad, seen = 0, set()
+    async with httpx.AsyncClient(base_url=url) as ctl:
+        for k in range(flips):
+            value = k % 2 == 0
+            await ctl.post("/inhibit", json={"inhibit": value})
+            async def read():
+                # new client → new connection → whichever worker accepts it
+                async with httpx.AsyncClient(base_url=url) as c:
+                    s = (await c.get("/status", params={"limit": 0})).json()
+                    h = (await c.get("/health")).json()
+                    seen.add(h["worker"])
+                    return s["inhibit"] == value
+            bad += sum(not ok for ok in await asyncio.gather(*(read() for _ in range(reads))))
+        await ctl.post("/inhibit", json={"inhibit": False})
+    return bad, flips * reads, len(seen)
+
+async def single_beat(conn, i):
+    await conn.request("POST", "/heartbeat", json_body={"agent": f"agent-{i % 10000}"})
+    return 1
+
+async def batch_beat(conn, i):
+    await conn.request("POST", "/heartbeat/batch", json_body=[f"agent-{(i + j) % 10000}" for j in range(200)])
+    return 200
+
+async def status_read(conn, i):
+    await conn.request("GET", "/status?limit=50")
+    return 1
+
+async def rate(url, concurrency, duration, request) -> float:
+    return (await run_load(url, concurrency, duration, request))["rate"]
+
+async def bench(workers: int, args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        proc = spawn(workers, args.port, tmp)
+        url = f"http://127.0.0.1:{args.port}"
+        try:
+            bad, total, seen = await check_consistency(url, args.flips, args.reads)
+            result = {
+                "workers": workers,
+                "workers_seen": seen,
+                "inconsistent_reads": bad,
+                "reads": total,
+                "single_beats_per_sec": await rate(url, args.concurrency, args.duration, single_beat),
+                "batch_beats_per_sec": await rate(url, args.concurrency, args.duration, batch_beat),
+                "status_per_sec": await rate(url, args.concurrency, args.duration, status_read),
+            }
+        finally:
+            proc.terminate()
+            proc.wait(10)
+    return result
+
+async def main(args):
+    results = []
+    for n in args.workers:
+        r = await bench(n, args)
+        results.append(r)
+        print(f"workers={n} (seen {r['workers_seen']}): inconsistent {r['inconsistent_reads']}/{r['reads']}  "
+              f"single {r['single_beats_per_sec']:,.0f}/s  batch {r['batch_beats_per_sec']:,.0f} beats/s  "
+              f"status {r['status_per_sec']:,.0f}/s", flush=True)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+    if any(r["inconsistent_reads"] for r in results):
+        raise SystemExit("inhibit view was inconsistent across workers")
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="OOBSC multi-worker consistency + throughput")
+    p.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    p.add_argument("--port", type=int, default=8720)
+    p.add_argument("--concurrency", type=int, default=32)
+    p.add_argument("--duration", type=float, default=5.0)
+    p.add_argument("--flips", type=int, default=20, help="inhibit toggles in the consistency check")
+    p.add_argument("--reads", type=int, default=16, help="reads after each toggle")
+    p.add_argument("--json", default=None, help="write results to this file")
+    args = p.parse_args()
+    asyncio.run(main(args))
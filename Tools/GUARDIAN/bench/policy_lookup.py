@@ -0,0 +1,77 @@
+# bench/policy_lookup.py
+# Egress policy lookup cost with a large rule set.
+#
+#   python bench/policy_lookup.py --rules 50000
+#
+# Compiles a mix of exact, wildcard, suffix, CIDR and path rules, then times
+# check_url() on a fixed set of URLs: cold (cache cleared every round, so
+# each lookup parses the URL and walks the trie/radix tree) and warm (LRU
+# decision caches).
+import argparse, random, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "detectors"))
+from egress_policy import Policy
+
+def make_rules(n: int, rng: random.Random) -> list[str]:
+    rules = []
+    for i in range(n):
+        k = i % 5
+        if k == 0:
+            rules.append(f"allow host{i}.example{i % 97}.com")
+        elif k == 1:
+            rules.append(f"allow *.svc{i}.internal")
+        elif k == 2:
+            rules.append(f"allow .tenant{i}.net")
+        elif k == 3:
+            rules.append(f"allow 10.{(i >> 8) & 255}.{i & 255}.0/24")
+        else:
+            rules.append(f"deny https://*.tenant{i - 2}.net/admin")
+    return rules
+
+def make_urls(n: int, rules: int, rng: random.Random) -> list[str]:
+    urls = []
+    for _ in range(n):
+        i = rng.randrange(rules)
+        urls.append(rng.choice([
+            f"https://host{i - i % 5}.example{(i - i % 5) % 97}.com/x",
+            f"https://a.b.svc{i - i % 5 + 1}.internal/",
+            f"https://api.tenant{i - i % 5 + 2}.net/admin/users",
+            f"http://10.{rng.randrange(256)}.{rng.randrange(256)}.7/",
+            f"https://unknown{i}.example.org/",
+        ]))
+    return urls
+
+def per_lookup_ns(policy: Policy, urls: list[str], rounds: int, cold: bool) -> float:
+    total = 0.0
+    for _ in range(rounds):
+        if cold:
+            policy.decide.cache_clear()
+            policy.check_url.cache_clear()
+        t0 = time.perf_counter()
+        for u in urls:
+            policy.check_url(u)
+        total += time.perf_counter() - t0
+    return total / (rounds * len(urls)) * 1e9
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Egress policy lookup cost")
+    p.add_argument("--rules", type=int, default=50000)
+    p.add_argument("--urls", type=int, default=2000)
+    p.add_argument("--rounds", type=int, default=20)
+    args = p.parse_args()
+    rng = random.Random(1)
+    rules = make_rules(args.rules, rng)
+    t0 = time.perf_counter()
+    policy = Policy(rules)
+    print(f"compiled {len(policy)} rules in {(time.perf_counter() - t0) * 1000:.0f} ms")
+    urls = make_urls(args.urls, args.rules, rng)
+    allowed = sum(policy.check_url(u).allowed for u in urls)
+    print(f"{allowed}/{len(urls)} sample URLs allowed")
+    print(f"cold (trie/radix walk + URL parse): {per_lookup_ns(policy, urls, args.rounds, True):7.0f} ns/lookup")
+    print(f"warm (LRU decision cache):          {per_lookup_ns(policy, urls, args.rounds, False):7.0f} ns/lookup")
+    host = ("https", "host0.example0.com", 443, "/x")
+    t0 = time.perf_counter()
+    for _ in range(200000):
+        policy.decide(*host)
+    print(f"warm, pre-parsed key:               {(time.perf_counter() - t0) / 200000 * 1e9:7.0f} ns/lookup")
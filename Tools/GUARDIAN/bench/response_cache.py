@@ -0,0 +1,79 @@
+# bench/response_cache.py
+# Many agents fetching the same documentation pages through /fetch, with the
+# response cache off and on: latency and how many requests reach upstream.
+# The gateway runs in-process; the upstream is a local stand-in that answers
+# after --delay ms with a cacheable (max-age) page.
+#
+#   python bench/response_cache.py --agents 50 --pages 20 --rounds 5
+import argparse, asyncio, os, statistics, sys, time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "detectors"))
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common"))  # metrics.py
+os.environ.update(ALLOWED_DOMAINS="127.0.0.1", EGRESS_BLOCK_PRIVATE="0", RESPONSE_CACHE="1",
+                  OOBSC_URL=os.getenv("OOBSC_URL", "http://127.0.0.1:1"))
+import httpx
+import egress_gateway
+
+HITS = [0]
+
+def make_upstream(delay: float, size: int):
+    body = b"x" * size
+    async def upstream(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b"\r\n\r\n")
+                HITS[0] += 1
+                await asyncio.sleep(delay)
+                writer.write(b"HTTP/1.1 200 OK\r\ncache-control: max-age=300\r\n"
+                             b"content-length: %d\r\n\r\n" % len(body) + body)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            writer.close()
+    return upstream
+
+def summary(name: str, ms: list[float], upstream: int, wall: float):
+    ms = sorted(ms)
+    print(f"{name:6} n={len(ms)} p50={statistics.median(ms):.2f} ms p99={ms[int(len(ms) * 0.99) - 1]:.2f} ms "
+          f"upstream={upstream} wall={wall:.2f} s")
+
+async def run(base: str, args) -> list[float]:
+    transport = httpx.ASGITransport(app=egress_gateway.app)
+    ms = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://gateway", timeout=60) as c:
+        async def agent(a: int):
+            for r in range(args.rounds):
+                for p in range(args.pages):
+                    t0 = time.perf_counter()
+                    resp = await c.post("/fetch", json={"url": f"{base}/doc/{(p + a) % args.pages}",
+                                                        "stream": True})
+                    resp.raise_for_status()
+                    ms.append((time.perf_counter() - t0) * 1000)
+        await asyncio.gather(*(agent(a) for a in range(args.agents)))
+    return ms
+
+async def main(args):
+    server = await asyncio.start_server(make_upstream(args.delay / 1000, args.size), "127.0.0.1", 0)
+    base = f"http://127.0.0.1:{server.sockets[0].getsockname()[1]}"
+    cache = egress_gateway.CACHE
+    try:
+        for name, enabled in (("off", None), ("on", cache)):
+            egress_gateway.CACHE = enabled
+            HITS[0] = 0
+            t0 = time.perf_counter()
+            ms = await run(base, args)
+            summary(name, ms, HITS[0], time.perf_counter() - t0)
+        print(cache.stats())
+    finally:
+        cache.clear()
+        await egress_gateway.POOLS.close()
+        server.close()
+
+if __name__ == "__main__":
+    p = argparse.ArgumentParser(description="Egress gateway response cache off vs on")
+    p.add_argument("--agents", type=int, default=50)
+    p.add_argument("--pages", type=int, default=20, help="distinct URLs")
+    p.add_argument("--rounds", type=int, default=3, help="passes over the pages per agent")
+    p.add_argument("--delay", type=float, default=50, help="upstream response time, ms")
+    p.add_argument("--size", type=int, default=32 * 1024, help="page size, bytes")
+    asyncio.run(main(p.parse_args()))
@@ -0,0 +1,184 @@
+# common/metrics.py
+# Shared by oobsc, detectors and runtime: their images are built from the
+# Tools/GUARDIAN context and copy it next to their own modules.
+# Minimal Prometheus metrics: counters, fixed-bucket histograms and gauges,
+# rendered in the text exposition format for a /metrics endpoint.
+#
+# Updates take no lock: every thread writes its own shard (a dict per
+# metric, created on the thread's first update) and a scrape sums the
+# shards. The hot path is a thread-local lookup, a dict get and an add.
+#
+# Kept identical in oobsc/, detectors/ and runtime/ (each is its own
+# Docker build context).
+import threading, time
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# seconds; spans a microsecond decoy scan up to a slow upstream
+LATENCY_BUCKETS = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025,
+                   0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_METRICS: list = []
+
+def _label_str(names: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(str(v))}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _snapshot(d: dict) -> list:
+    # another thread may add a label set mid-copy
+    while True:
+        try:
+            return list(d.items())
+        except RuntimeError:
+            continue
+
+class _Sharded:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = tuple(labels)
+        self._shards: list[dict] = []
+        self._local = threading.local()
+        _METRICS.append(self)
+
+    def _mine(self) -> dict:
+        try:
+            return self._local.d
+        except AttributeError:
+            d = self._local.d = {}
+            self._shards.append(d)
+            return d
+
+    def header(self) -> list[str]:
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Sharded):
+    kind = "counter"
+
+    def inc(self, *labels, n: float = 1):
+        d = self._mine()
+        d[labels] = d.get(labels, 0) + n
+
+    def totals(self) -> dict:
+        out = {}
+        for shard in list(self._shards):
+            for k, v in _snapshot(shard):
+                out[k] = out.get(k, 0) + v
+        return out
+
+    def render(self) -> list[str]:
+        return self.header() + [f"{self.name}{_label_str(self.labels, k)} {v}"
+                                for k, v in sorted(self.totals().items())]
+
+class Histogram(_Sharded):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        super().__init__(name, doc, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, *labels):
+        d = self._mine()
+        cell = d.get(labels)
+        if cell is None:
+            cell = d[labels] = [0] * (len(self.buckets) + 1) + [0.0]  # buckets, +Inf, sum
+        cell[bisect_left(self.buckets, value)] += 1
+        cell[-1] += value
+
+    def time(self, *labels) -> "_Timer":
+        return _Timer(self, labels)
+
+    def totals(self) -> dict:
+        out = {}
+        for shard in list(self._shards):
+            for k, cell in _snapshot(shard):
+                acc = out.setdefault(k, [0] * len(cell))
+                for i, v in enumerate(cell):
+                    acc[i] += v
+        return out
+
+    def render(self) -> list[str]:
+        lines = self.header()
+        for k, cell in sorted(self.totals().items()):
+            cum = 0
+            for bound, n in zip(self.buckets + (float("inf"),), cell):
+                cum += n
+                le = 'le="+Inf"' if bound == float("inf") else f'le="{bound!r}"'
+                lines.append(f"{self.name}_bucket{_label_str(self.labels, k, le)} {cum}")
+            lines.append(f"{self.name}_sum{_label_str(self.labels, k)} {cell[-1]}")
+            lines.append(f"{self.name}_count{_label_str(self.labels, k)} {cum}")
+        return lines
+
+class _Timer:
+    __slots__ = ("hist", "labels", "t0")
+
+    def __init__(self, hist: Histogram, labels: tuple):
+        self.hist = hist
+        self.labels = labels
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.t0, *self.labels)
+
+class Gauge:
+    """Value read at scrape time from fn() -> number or {label tuple: number},
+    or set() explicitly. kind="counter" for totals kept elsewhere."""
+
+    def __init__(self, name: str, doc: str, fn=None, labels: tuple = (), kind: str = "gauge"):
+        self.name = name
+        self.doc = doc
+        self.fn = fn
+        self.labels = tuple(labels)
+        self.kind = kind
+        self.value = 0
+        _METRICS.append(self)
+
+    def set(self, value: float):
+        self.value = value
+
+    def render(self) -> list[str]:
+        try:
+            v = self.fn() if self.fn else self.value
+        except Exception:
+            return []  # source unavailable: omit rather than fail the scrape
+        values = v if isinstance(v, dict) else {(): v}
+        return [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"] + [
+            f"{self.name}{_label_str(self.labels, k)} {float(x)}" for k, x in sorted(values.items())]
+
+def render() -> str:
+    lines = []
+    for m in _METRICS:
+        lines += m.render()
+    return "\n".join(lines) + "\n"
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def serve(port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """/metrics on a daemon thread, for processes without a web app."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
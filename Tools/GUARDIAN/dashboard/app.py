@@ -1,24 +1,41 @@
 # dashboard/app.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
-from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse
+from fastapi.responses import HTMLResponse, PlainTextResponse, JSONResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import subprocess, sys, os, asyncio
+import subprocess, sys, os, asyncio, json, time
 import httpx
 from typing import Optional
 import docker, os
 from fastapi.responses import PlainTextResponse
+from concurrent.futures import ThreadPoolExecutor
+from logstream import LogHub, LOG_TAIL
+from statusfeed import StatusFeed
 
 MANAGED = os.getenv("MANAGED_CONTAINERS", "guardian-oobsc,guardian-ai,guardian-honeytoken,guardian-egress").split(",")
-app = FastAPI(title="Guardian Dashboard")
 templates = Jinja2Templates(directory=os.path.join(os.path.dirname(__file__), "templates"))
 PROJECT_PREFIX = os.getenv("PROJECT_PREFIX", "guardian")
+LOG_CONTAINERS = os.getenv("LOG_CONTAINERS", ",".join(MANAGED + [f"{PROJECT_PREFIX}-dashboard"])).split(",")
+LOG_KEEPALIVE = float(os.getenv("LOG_KEEPALIVE_SEC", "15"))
+STATUS_KEEPALIVE = float(os.getenv("STATUS_KEEPALIVE_SEC", "15"))
+DOCKER_WORKERS = int(os.getenv("DOCKER_WORKERS", "8"))
+# Compose up starts these first and waits until they are running/healthy.
+COMPOSE_FIRST = os.getenv("COMPOSE_FIRST", "guardian-oobsc").split(",")
+COMPOSE_STOP_TIMEOUT = int(os.getenv("COMPOSE_STOP_TIMEOUT_SEC", "5"))
+COMPOSE_READY_TIMEOUT = float(os.getenv("COMPOSE_READY_TIMEOUT_SEC", "30"))
 OOBSC = os.getenv("OOBSC_URL", "http://127.0.0.1:8000")
 HONEYPOT = os.getenv("HONEYPOT_URL", "http://127.0.0.1:9000")
 EGRESS = os.getenv("EGRESS_URL", "http://127.0.0.1:9100")
 PROJECT = os.getenv("PROJECT_NAME", "guardian")
 AUTH = os.getenv("AUTH_TOKEN", "")
 HEAD = {"x-guardian-auth": AUTH} if AUTH else {}
+# /health of each managed service that has one (compose up ?wait=true).
+HEALTH_URLS = {
+    f"{PROJECT_PREFIX}-oobsc": f"{OOBSC}/health",
+    f"{PROJECT_PREFIX}-honeytoken": f"{HONEYPOT}/health",
+    f"{PROJECT_PREFIX}-egress": f"{EGRESS}/health",
+}
 
 
 def list_project_containers(client):
@@ -31,27 +48,53 @@ def run(cmd: list[str], cwd: Optional[str] = None) -> tuple[int, str, str]:
     out, err = p.communicate()
     return p.returncode, out, err
 
-def docker_logs_tail(n: int = 200) -> str:
-    try:
-        client = docker.from_env()
-        containers = client.containers.list(all=True)
-        # Only our compose project
-        containers = [c for c in containers if c.name.startswith(PROJECT_PREFIX)]
-        order = ["oobsc","ai","honeytoken","egress","dashboard"]
-        containers.sort(key=lambda c: next((i for i,k in enumerate(order) if k in c.name), 999))
-        out = []
-        for c in containers:
-            try:
-                logs = c.logs(tail=n).decode("utf-8", errors="ignore")
-            except Exception as e:
-                logs = f"<unable to read logs: {e}>"
-            out.append(f"===== {c.name} =====\n{logs.rstrip()}\n")
-        return "\n".join(out)
-    except Exception as e:
-        return f"error reading docker logs: {e}"
+_DOCKER = None
 
 def get_client():
-    return docker.from_env()
+    # one client (and connection pool) for the process; the SDK is thread-safe
+    global _DOCKER
+    if _DOCKER is None:
+        _DOCKER = docker.from_env()
+    return _DOCKER
+
+# Blocking Docker SDK calls run here, never on the event loop.
+DOCKER_POOL = ThreadPoolExecutor(max_workers=DOCKER_WORKERS, thread_name_prefix="docker")
+
+async def in_docker(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(DOCKER_POOL, fn, *args)
+
+# One pooled client for every call to OOBSC, the detector and the gateway.
+HTTP = httpx.AsyncClient(timeout=2.0, limits=httpx.Limits(max_connections=32, max_keepalive_connections=16))
+
+async def get_json(url: str):
+    r = await HTTP.get(url)
+    r.raise_for_status()
+    return r.json()
+
+def container_states() -> dict[str, str]:
+    found = {c.name: c.status for c in get_client().containers.list(all=True)}
+    return {name: found.get(name, "missing") for name in MANAGED}
+
+LOGS = LogHub(LOG_CONTAINERS, get_client)
+STATUS = StatusFeed({
+    "oobsc": lambda: get_json(f"{OOBSC}/status"),
+    "oobsc_health": lambda: get_json(f"{OOBSC}/health"),
+    "honeytoken": lambda: get_json(f"{HONEYPOT}/health"),
+    "egress": lambda: get_json(f"{EGRESS}/health"),
+    "containers": lambda: in_docker(container_states),
+})
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    LOGS.start()
+    refresher = asyncio.create_task(STATUS.run())
+    yield
+    refresher.cancel()
+    LOGS.stop()
+    await HTTP.aclose()
+    DOCKER_POOL.shutdown(wait=False, cancel_futures=True)
+
+app = FastAPI(title="Guardian Dashboard", lifespan=lifespan)
 
 def get_by_name(client, name):
     try:
@@ -64,80 +107,196 @@ async def index(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
 # --- Compose control ---
+# Containers within a stage are started/stopped concurrently on DOCKER_POOL;
+# on up, COMPOSE_FIRST is a stage of its own that must be ready before the
+# rest start. Down has no ordering to honour and stops everything at once.
+def compose_stages() -> list[list[str]]:
+    first = [n for n in MANAGED if n in COMPOSE_FIRST]
+    return [first, [n for n in MANAGED if n not in COMPOSE_FIRST]]
+
+def start_container(name: str) -> str:
+    c = get_by_name(get_client(), name)
+    if not c:
+        return "missing"
+    c.reload()
+    if c.status in ("exited", "created"):
+        c.start()
+        return "started"
+    return c.status
+
+def stop_container(name: str) -> str:
+    c = get_by_name(get_client(), name)
+    if not c:
+        return "missing"
+    c.reload()
+    if c.status not in ("exited", "dead"):
+        c.stop(timeout=COMPOSE_STOP_TIMEOUT)
+        return "stopped"
+    return c.status
+
+def container_ready(name: str) -> bool:
+    """Running, and healthy if the image defines a healthcheck."""
+    state = get_client().containers.get(name).attrs["State"]
+    health = state.get("Health")
+    return bool(state.get("Running")) and (health is None or health.get("Status") == "healthy")
+
+async def wait_ready(name: str, http: bool):
+    deadline = time.monotonic() + COMPOSE_READY_TIMEOUT
+    url = HEALTH_URLS.get(name) if http else None
+    while True:
+        if await in_docker(container_ready, name):
+            if url is None:
+                return
+            try:
+                if (await HTTP.get(url)).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"not ready after {COMPOSE_READY_TIMEOUT:.0f}s")
+        await asyncio.sleep(0.25)
+
+async def compose_one(name: str, op, wait: bool, http: bool) -> dict:
+    t0 = time.perf_counter()
+    out = {}
+    try:
+        out["result"] = await in_docker(op, name)
+        out["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if wait and out["result"] != "missing":
+            await wait_ready(name, http)
+            out["ready_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    except Exception as e:
+        out["error"] = str(e) or type(e).__name__
+        out["ms"] = round((time.perf_counter() - t0) * 1000, 1)
+    return out
+
+async def compose(op, stages: list[list[str]], wait_first: bool, wait: bool) -> dict:
+    t0 = time.perf_counter()
+    containers = {}
+    for n, stage in enumerate(stages):
+        stage_wait = wait or (wait_first and n == 0)
+        results = await asyncio.gather(*(compose_one(name, op, stage_wait, wait) for name in stage))
+        containers.update(zip(stage, results))
+    STATUS.invalidate()
+    return {"ok": not any("error" in r for r in containers.values()),
+            "total_ms": round((time.perf_counter() - t0) * 1000, 1), "containers": containers}
+
 @app.post("/api/compose/down")
 async def compose_down():
     try:
-        client = get_client()
-        stopped = []
-        for name in MANAGED:
-            c = get_by_name(client, name)
-            if not c:
-                continue
-            c.reload()
-            if c.status not in ("exited", "dead"):
-                c.stop(timeout=5)
-            stopped.append(name)
-        return JSONResponse({"ok": True, "stopped": stopped})
+        out = await compose(stop_container, [MANAGED], False, False)
+        stopped = [n for n, r in out["containers"].items() if r.get("result", "missing") != "missing"]
+        return JSONResponse({"stopped": stopped, **out})
     except Exception as e:
         return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
 @app.post("/api/compose/up")
-async def compose_up():
+async def compose_up(wait: bool = False):
+    """Start COMPOSE_FIRST, wait until it is running (and healthy), then
+    start the rest. With wait=true also wait for every service's /health."""
     try:
-        client = get_client()
-        started = []
-        for name in MANAGED:
-            c = get_by_name(client, name)
-            if not c:
-                continue
-            c.reload()
-            if c.status in ("exited", "created"):
-                c.start()
-            started.append(name)
-        # optional: wait a moment for OOBSC to come up for a smoother UI
-        return JSONResponse({"ok": True, "started": started})
+        out = await compose(start_container, compose_stages(), True, wait)
+        started = [n for n, r in out["containers"].items() if r.get("result", "missing") != "missing"]
+        return JSONResponse({"started": started, **out})
     except Exception as e:
         return JSONResponse({"ok": False, "error": str(e)}, status_code=500)
 
 # --- Status / inhibit (proxy to OOBSC) ---
 @app.get("/api/status")
 async def api_status():
-    async with httpx.AsyncClient(timeout=2.0) as client:
-        r = await client.get(f"{OOBSC}/status")
-        return JSONResponse(r.json())
+    """OOBSC /status, from the shared snapshot (see statusfeed.py)."""
+    oobsc = (await STATUS.get())["oobsc"]
+    if not oobsc["ok"]:
+        return JSONResponse({"error": oobsc["error"]}, status_code=502)
+    return JSONResponse(oobsc["data"])
+
+@app.get("/api/overview")
+async def api_overview():
+    """Every service and container in one cached snapshot."""
+    return JSONResponse(await STATUS.get())
+
+@app.get("/api/overview/stream")
+async def api_overview_stream():
+    """Server-sent events: the current snapshot on connect, then each new one."""
+    async def events():
+        async for snap in STATUS.watch(STATUS_KEEPALIVE):
+            yield f"data: {json.dumps(snap)}\n\n" if snap else ": keepalive\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 @app.post("/api/inhibit/{state}")
 async def api_inhibit(state: str):
     val = True if state.lower() in ("1", "true", "on") else False
-    async with httpx.AsyncClient(timeout=2.0) as client:
-        r = await client.post(f"{OOBSC}/inhibit", json={"inhibit": val})
-        return JSONResponse(r.json())
+    r = await HTTP.post(f"{OOBSC}/inhibit", json={"inhibit": val, "source": "dashboard",
+                                                  "reason": "set from the dashboard"})
+    STATUS.invalidate()
+    return JSONResponse(r.json())
+
+@app.get("/api/events")
+async def api_events(after: int | None = None, start: float | None = None, end: float | None = None,
+                     agent: str | None = None, detector: str | None = None, limit: int = 100):
+    """OOBSC's detection event journal (see oobsc/journal.py)."""
+    query = {"after": after, "start": start, "end": end, "agent": agent, "detector": detector, "limit": limit}
+    try:
+        r = await HTTP.get(f"{OOBSC}/events", params={k: v for k, v in query.items() if v is not None})
+        return JSONResponse(r.json(), status_code=r.status_code)
+    except httpx.HTTPError as e:
+        return JSONResponse({"error": str(e)}, status_code=502)
 
 # --- Tripwires (trigger demo actions) ---
 @app.post("/api/honeytoken")
 async def api_honeytoken():
     token = "FAKE_API_KEY=XYZ-123-SUPER-SECRET"
-    async with httpx.AsyncClient(timeout=3.0) as client:
-        r = await client.post(f"{HONEYPOT}/ingest", content=token, headers={"Content-Type": "text/plain"})
-        return JSONResponse(r.json())
+    r = await HTTP.post(f"{HONEYPOT}/ingest", content=token, headers={"Content-Type": "text/plain"}, timeout=3.0)
+    STATUS.invalidate()
+    return JSONResponse(r.json())
 
 @app.post("/api/egress/allowed")
 async def api_egress_allowed():
     payload = {"url": "https://httpbin.org/get"}
-    async with httpx.AsyncClient(timeout=6.0) as client:
-        r = await client.post(f"{EGRESS}/fetch", json=payload)
-        return JSONResponse({"status": r.status_code, "body": r.text})
+    r = await HTTP.post(f"{EGRESS}/fetch", json=payload, timeout=6.0)
+    return JSONResponse({"status": r.status_code, "body": r.text})
 
 @app.post("/api/egress/forbidden")
 async def api_egress_forbidden():
     payload = {"url": "https://example.com"}
-    async with httpx.AsyncClient(timeout=6.0) as client:
-        r = await client.post(f"{EGRESS}/fetch", json=payload)
-        # Forbidden fetch will also trigger inhibit
-        return JSONResponse({"status": r.status_code, "body": r.text})
+    r = await HTTP.post(f"{EGRESS}/fetch", json=payload, timeout=6.0)
+    # Forbidden fetch will also trigger inhibit
+    STATUS.invalidate()
+    return JSONResponse({"status": r.status_code, "body": r.text})
 
-# --- Logs (grab last N lines from compose) ---
+# --- Logs (followed in the background, see logstream.py) ---
 @app.get("/api/logs", response_class=PlainTextResponse)
-async def api_logs(n: int = 200):
-    return PlainTextResponse(docker_logs_tail(n))
+async def api_logs(n: int = LOG_TAIL, since: int | None = None, limit: int = 1000):
+    """Without `since`: the last n lines per container as text. With it:
+    JSON lines numbered above the cursor, and the cursor to poll with next."""
+    if since is None:
+        return PlainTextResponse("\n".join(
+            f"===== {name} =====\n" + "\n".join(lines) + "\n"
+            for name, lines in LOGS.tail(n).items() if lines))
+    items, missed = LOGS.after(since, max(1, min(limit, 5000)))
+    return JSONResponse({"cursor": items[-1][0] if items else min(since, LOGS.seq), "missed": missed,
+                         "lines": [{"seq": seq, "container": c, "line": line} for seq, c, line in items]})
+
+@app.get("/api/logs/stream")
+async def api_logs_stream(request: Request, n: int = LOG_TAIL):
+    """Server-sent events, one per log line (id = cursor). Resumes after
+    Last-Event-ID on reconnect; otherwise starts with the last n lines."""
+    last_id = request.headers.get("last-event-id", "")
+    cursor = int(last_id) if last_id.isdigit() else max(0, LOGS.seq - n)
+    sub = LOGS.subscribe(cursor)
+
+    async def events():
+        try:
+            while True:
+                batch, dropped = await sub.next_batch(LOG_KEEPALIVE)
+                out = [f"event: dropped\ndata: {dropped}\n\n"] if dropped else []
+                out += [f"id: {seq}\ndata: {json.dumps({'container': c, 'line': line})}\n\n"
+                        for seq, c, line in batch]
+                yield "".join(out) or ": keepalive\n\n"
+        finally:
+            LOGS.unsubscribe(sub)
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
 # Run: uvicorn dashboard.app:app --host 127.0.0.1 --port 8080
@@ -0,0 +1,154 @@
+# dashboard/logstream.py
+# Follows the logs of the managed containers and fans them out to dashboard
+# clients. The Docker SDK log stream blocks, so each container gets one
+# follower thread (never the event loop); followers feed a shared ring of
+# numbered lines. SSE clients each get a bounded buffer (a slow browser
+# loses its oldest lines, not the dashboard's memory); pollers read
+# "everything after cursor" from the ring.
+import os, asyncio, threading, calendar, time
+from collections import deque
+from itertools import islice
+
+LOG_BUFFER = int(os.getenv("LOG_BUFFER_LINES", "5000"))
+LOG_CLIENT_BUFFER = int(os.getenv("LOG_CLIENT_BUFFER_LINES", "1000"))
+LOG_TAIL = int(os.getenv("LOG_TAIL_LINES", "200"))
+LOG_RETRY = float(os.getenv("LOG_RETRY_SEC", "2"))
+
+def _split_timestamp(line: str) -> tuple[str | None, str]:
+    """'2024-05-01T10:00:00.123456789Z text' -> (timestamp, text). Docker
+    pads the fraction to 9 digits, so timestamps compare as strings."""
+    ts, sep, text = line.partition(" ")
+    if sep and len(ts) >= 20 and ts[4] == "-" and ts[10] == "T":
+        return ts, text
+    return None, line
+
+def _epoch(ts: str) -> int:
+    return calendar.timegm(time.strptime(ts[:19], "%Y-%m-%dT%H:%M:%S"))
+
+class Subscriber:
+    """One streaming client: a bounded buffer of (seq, container, line)."""
+
+    def __init__(self, size: int = LOG_CLIENT_BUFFER):
+        self.lines = deque(maxlen=size)
+        self.dropped = 0
+        self.ready = asyncio.Event()
+
+    def push(self, item):
+        if len(self.lines) == self.lines.maxlen:
+            self.dropped += 1
+        self.lines.append(item)
+        self.ready.set()
+
+    async def next_batch(self, timeout: float) -> tuple[list, int]:
+        """Buffered lines (waiting up to timeout for some) and how many
+        were dropped since the last batch."""
+        if not self.lines:
+            self.ready.clear()
+            try:
+                await asyncio.wait_for(self.ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch, dropped = list(self.lines), self.dropped
+        self.lines.clear()
+        self.dropped = 0
+        return batch, dropped
+
+class LogHub:
+    def __init__(self, names: list[str], client_factory):
+        self.names = names
+        self.client_factory = client_factory
+        self.ring = deque(maxlen=LOG_BUFFER)  # (seq, container, line)
+        self.seq = 0
+        self.subscribers: set[Subscriber] = set()
+        self.state: dict[str, str] = {}       # container -> "following" | "waiting: why"
+        self.loop = None
+        self.stopping = threading.Event()
+        self.streams = {}                     # container -> open log stream
+
+    def start(self):
+        if self.loop is not None:
+            return
+        self.loop = asyncio.get_running_loop()
+        for name in self.names:
+            threading.Thread(target=self._follow, args=(name,), name=f"logs-{name}", daemon=True).start()
+
+    def stop(self):
+        self.stopping.set()
+        for stream in list(self.streams.values()):
+            try:
+                stream.close()  # unblocks the follower's read
+            except Exception:
+                pass
+
+    def _follow(self, name: str):
+        last = None  # timestamp of the last line published, for reconnects
+        while not self.stopping.is_set():
+            try:
+                c = self.client_factory().containers.get(name)
+                # a restart or stopped container ends the stream; pick up after `last`
+                kw = {"since": _epoch(last)} if last else {"tail": LOG_TAIL}
+                stream = self.streams[name] = c.logs(stream=True, follow=True, timestamps=True, **kw)
+                self.state[name] = "following"
+                partial = b""
+                for chunk in stream:
+                    *lines, partial = (partial + chunk).split(b"\n")
+                    out = []
+                    for raw in lines:
+                        ts, line = _split_timestamp(raw.decode("utf-8", errors="replace"))
+                        if ts is not None:
+                            if last is not None and ts <= last:
+                                continue  # replayed by the reconnect's whole-second `since`
+                            last = ts
+                        out.append(line)
+                    if out:
+                        self.loop.call_soon_threadsafe(self._publish, name, out)
+                self.state[name] = "waiting: stream ended"
+            except Exception as e:
+                self.state[name] = f"waiting: {e}"
+            finally:
+                self.streams.pop(name, None)
+            self.stopping.wait(LOG_RETRY)
+
+    def _publish(self, name: str, lines: list[str]):
+        for line in lines:
+            self.seq += 1
+            item = (self.seq, name, line)
+            self.ring.append(item)
+            for sub in self.subscribers:
+                sub.push(item)
+
+    def after(self, cursor: int, limit: int = LOG_BUFFER) -> tuple[list, int]:
+        """Lines numbered above cursor (at most limit, oldest first) and how
+        many in between already left the ring. A cursor from before a
+        dashboard restart (ahead of seq) reads from the start."""
+        if not self.ring:
+            return [], 0
+        first = self.ring[0][0]
+        if cursor > self.seq:
+            cursor = 0
+        start = max(0, cursor - first + 1)
+        return list(islice(self.ring, start, start + limit)), max(0, first - cursor - 1)
+
+    def subscribe(self, cursor: int) -> Subscriber:
+        sub = Subscriber()
+        for item in self.after(cursor)[0]:
+            sub.push(item)
+        sub.dropped = 0  # a replay overflowing the buffer is not news
+        self.subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subscribers.discard(sub)
+
+    def tail(self, n: int) -> dict[str, list[str]]:
+        """Last n buffered lines per container, in self.names order."""
+        per = {name: [] for name in self.names}
+        for _seq, name, line in reversed(self.ring):
+            lines = per.setdefault(name, [])
+            if len(lines) < n:
+                lines.append(line)
+        return {name: lines[::-1] for name, lines in per.items()}
+
+    def stats(self) -> dict:
+        return {"seq": self.seq, "buffered": len(self.ring), "subscribers": len(self.subscribers),
+                "containers": dict(self.state)}
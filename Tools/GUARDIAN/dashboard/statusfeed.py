@@ -0,0 +1,119 @@
+# dashboard/statusfeed.py
+# One aggregated status snapshot for every dashboard viewer. Sources (OOBSC,
+# detector and gateway health, container states) are probed concurrently;
+# the result is cached for STATUS_TTL_SEC, concurrent misses share one
+# refresh, and SSE viewers are pushed each new snapshot by a single refresh
+# loop. Upstream load is one probe per source per TTL, however many tabs
+# are open.
+import os, time, asyncio
+
+STATUS_TTL = float(os.getenv("STATUS_TTL_SEC", "1"))
+STATUS_PROBE_TIMEOUT = float(os.getenv("STATUS_PROBE_TIMEOUT_SEC", "2"))
+
+class StatusFeed:
+    def __init__(self, sources: dict, ttl: float = STATUS_TTL):
+        self.sources = sources  # name -> async callable returning JSON-able data
+        self.ttl = ttl
+        self.snapshot: dict | None = None
+        self.expires = 0.0
+        self.version = 0
+        self.inflight: asyncio.Future | None = None
+        self.generation = 0  # bumped by invalidate(); a collect from an older one is stale
+        self.changed = asyncio.Event()  # set (and replaced) on every new snapshot
+        self.wake = asyncio.Event()
+        self.viewers = 0
+        self.refreshes = 0
+        self.requests = 0
+
+    async def get(self) -> dict:
+        """The cached snapshot, refreshed if older than the TTL."""
+        self.requests += 1
+        if self.snapshot is not None and time.monotonic() < self.expires:
+            return self.snapshot
+        return await self.refresh()
+
+    async def refresh(self) -> dict:
+        if self.inflight is None:
+            self.inflight = asyncio.ensure_future(self._collect(self.generation))
+            self.inflight.add_done_callback(self._landed)
+        return await asyncio.shield(self.inflight)
+
+    def _landed(self, fut):
+        if self.inflight is fut:
+            self.inflight = None
+
+    def invalidate(self):
+        """Something changed (e.g. inhibit was toggled): refresh now. A
+        collect already in flight may have probed before the change, so it
+        is detached and the next refresh starts a new one."""
+        self.generation += 1
+        self.expires = 0.0
+        self.inflight = None
+        self.wake.set()
+
+    async def _collect(self, generation: int) -> dict:
+        t0 = time.perf_counter()
+        names = list(self.sources)
+        probes = await asyncio.gather(*(self._probe(self.sources[n]) for n in names))
+        self.refreshes += 1
+        current = generation == self.generation
+        if current:
+            self.version += 1
+        snap = {"version": self.version, "ts": time.time(),
+                "collect_ms": round((time.perf_counter() - t0) * 1000, 2),
+                **dict(zip(names, probes))}
+        if not current:
+            return snap  # invalidated meanwhile: its waiters get it; not cached or pushed
+        self.snapshot = snap
+        self.expires = time.monotonic() + self.ttl
+        ev, self.changed = self.changed, asyncio.Event()
+        ev.set()
+        return self.snapshot
+
+    async def _probe(self, fn) -> dict:
+        t0 = time.perf_counter()
+        try:
+            data = await asyncio.wait_for(fn(), STATUS_PROBE_TIMEOUT)
+            out = {"ok": True, "data": data}
+        except Exception as e:
+            out = {"ok": False, "error": str(e) or type(e).__name__}
+        out["ms"] = round((time.perf_counter() - t0) * 1000, 2)
+        return out
+
+    async def run(self):
+        """Refresh loop; only probes while someone is watching."""
+        while True:
+            self.wake.clear()  # before refreshing, so an invalidate() during it is kept
+            if self.viewers:
+                try:
+                    await self.refresh()
+                except Exception as e:
+                    print(f"[dashboard] Status refresh failed: {e}", flush=True)
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.ttl)
+            except asyncio.TimeoutError:
+                pass
+
+    async def watch(self, keepalive: float):
+        """Yields each new snapshot, or None after `keepalive` idle seconds."""
+        self.viewers += 1
+        self.wake.set()
+        try:
+            version = None
+            while True:
+                ev = self.changed  # grab before checking, so no snapshot is missed
+                snap = self.snapshot if self.snapshot is not None else await self.get()
+                if snap["version"] != version:
+                    version = snap["version"]
+                    yield snap
+                    continue
+                try:
+                    await asyncio.wait_for(ev.wait(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            self.viewers -= 1
+
+    def stats(self) -> dict:
+        return {"version": self.version, "refreshes": self.refreshes, "requests": self.requests,
+                "viewers": self.viewers}
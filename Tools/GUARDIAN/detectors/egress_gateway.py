@@ -1,8 +1,18 @@
 # detectors/egress_gateway.py
+from contextlib import asynccontextmanager, AsyncExitStack
 from fastapi import FastAPI, Request, HTTPException
-from pydantic import BaseModel
-from urllib.parse import urlparse
-import os, httpx, asyncio
+from fastapi.responses import StreamingResponse, Response
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, field_validator
+from urllib.parse import urlparse, unquote_plus
+import os, re, time, httpx, asyncio, pathlib, ipaddress
+from oobsc_client import OOBSCClient, CURRENT_AGENT, AGENT_HEADER
+from upstream_pool import UpstreamPools, PoolBusy
+from egress_policy import Policy, policy_signature, normalize_path, DEFAULT_PORTS
+from egress_resolver import Resolver, PinnedBackend, AddressRejected, ResolveError
+from honeytoken_matcher import Matcher, load_decoys, dir_signature
+from response_cache import ResponseCache, Entry, CachedStream, TeeStream, cache_key, request_cacheable, lifetime
+import metrics
 
 OOBSC_URL = os.getenv("OOBSC_URL", "http://127.0.0.1:8000")
 ALLOWED = set(
@@ -10,30 +20,156 @@ ALLOWED = set(
     for d in os.getenv("ALLOWED_DOMAINS", "httpbin.org").split(",")
     if d.strip()
 )
+# Policy file (see egress_policy.py); when unset, ALLOWED_DOMAINS is the policy.
+POLICY_FILE = os.getenv("POLICY_FILE", "")
+POLICY_RELOAD_SEC = float(os.getenv("POLICY_RELOAD_SEC", "2"))
 TIMEOUT = float(os.getenv("FETCH_TIMEOUT_SEC", "5"))
+MAX_REDIRECTS = int(os.getenv("FETCH_MAX_REDIRECTS", "10"))
+# Refuse hosts that resolve to private/loopback/link-local addresses unless
+# an IP/CIDR rule allows the address explicitly.
+BLOCK_PRIVATE = os.getenv("EGRESS_BLOCK_PRIVATE", "1") not in ("0", "false", "off")
+# "summary" (JSON with truncated text) or "stream" (relay upstream bytes).
+FETCH_MODE = os.getenv("FETCH_MODE", "summary")
+STREAM_CHUNK = int(os.getenv("FETCH_STREAM_CHUNK_KB", "64")) * 1024
+SUMMARY_CHARS = 2000
+# Scan outgoing URL, headers and body for decoys before forwarding.
+EGRESS_SCAN = os.getenv("EGRESS_SCAN", "1") not in ("0", "false", "off")
+DECOY_DIR = pathlib.Path(os.getenv("DECOY_DIR", "decoys"))
+DECOY_RELOAD_SEC = float(os.getenv("DECOY_RELOAD_SEC", "2"))
+# Shared cache for GETs without credentials (see response_cache.py).
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "0") not in ("0", "false", "off")
+HEADER_NAME = re.compile(r"[!#$%&'*+.^_`|~0-9A-Za-z-]+")  # RFC 9110 token
+# Per-connection headers that must not be relayed (RFC 9110 7.6.1).
+HOP_BY_HOP = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+              "te", "trailer", "transfer-encoding", "upgrade"}
 
-app = FastAPI(title="EgressAllowlistGateway")
+OOBSC = OOBSCClient(OOBSC_URL, "egress")
+RESOLVER = Resolver()
+POOLS = UpstreamPools(TIMEOUT, backend=PinnedBackend(RESOLVER))
+CACHE = ResponseCache() if RESPONSE_CACHE else None
+
+REQUESTS = metrics.Counter("guardian_egress_requests_total", "/fetch calls by response status", ("code",))
+SCAN_TIME = metrics.Histogram("guardian_egress_scan_seconds", "Outbound decoy scan time per request")
+DECISION_TIME = metrics.Histogram("guardian_egress_decision_seconds", "Allowlist decision time per hop")
+# send() to response headers, redirects included; body relay time is not counted
+UPSTREAM_TIME = metrics.Histogram("guardian_egress_upstream_seconds", "Upstream latency to response headers")
+CACHE_LOOKUPS = metrics.Gauge("guardian_egress_cache_lookups_total", "Response cache lookups by outcome",
+                              lambda: {(k,): CACHE.stats()[k] for k in ("hits", "misses", "revalidated")} if CACHE else {},
+                              labels=("outcome",), kind="counter")
+
+def load_policy() -> Policy:
+    if not POLICY_FILE:
+        return Policy.from_domains(ALLOWED)
+    try:
+        return Policy.from_file(POLICY_FILE)
+    except (OSError, ValueError) as e:
+        print(f"[egress] Cannot load {POLICY_FILE} ({e}); denying all egress", flush=True)
+        return Policy([], source=POLICY_FILE)
+
+POLICY = load_policy()
+
+def load_matcher() -> Matcher:
+    try:
+        return Matcher(load_decoys(DECOY_DIR))
+    except OSError as e:
+        print(f"[egress] Cannot load decoys from {DECOY_DIR} ({e}); outbound scan is empty", flush=True)
+        return Matcher({})
+
+MATCHER = load_matcher() if EGRESS_SCAN else Matcher({})
+
+async def watch_decoys():
+    global MATCHER
+    sig = dir_signature(DECOY_DIR)
+    while True:
+        await asyncio.sleep(DECOY_RELOAD_SEC)
+        new_sig = dir_signature(DECOY_DIR)
+        if new_sig == sig:
+            continue
+        sig = new_sig
+        MATCHER = await asyncio.to_thread(load_matcher)
+        print(f"[egress] Reloaded {len(MATCHER)} decoys", flush=True)
+
+async def watch_policy():
+    global POLICY
+    sig = policy_signature(POLICY_FILE)
+    while True:
+        await asyncio.sleep(POLICY_RELOAD_SEC)
+        new_sig = policy_signature(POLICY_FILE)
+        if new_sig == sig:
+            continue
+        sig = new_sig
+        try:
+            # Compile off the event loop, then publish with a single assignment;
+            # requests in flight finish against the policy they started with.
+            policy = await asyncio.to_thread(Policy.from_file, POLICY_FILE)
+        except (OSError, ValueError) as e:
+            print(f"[egress] Policy reload failed, keeping old rules: {e}", flush=True)
+            continue
+        POLICY = policy
+        print(f"[egress] Reloaded {len(policy)} policy rules", flush=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await OOBSC.start()
+    watchers = []
+    if POLICY_FILE:
+        watchers.append(asyncio.create_task(watch_policy()))
+    if EGRESS_SCAN:
+        watchers.append(asyncio.create_task(watch_decoys()))
+    yield
+    for w in watchers:
+        w.cancel()
+    await POOLS.close()
+    if CACHE:
+        CACHE.clear()
+    await OOBSC.close()
+
+app = FastAPI(title="EgressAllowlistGateway", lifespan=lifespan)
 
 class FetchReq(BaseModel):
     url: str
     method: str = "GET"
-    headers: dict | None = None
+    headers: dict[str, str] | None = None
     body: str | None = None
+    stream: bool | None = None  # None = FETCH_MODE
 
-async def trigger_inhibit(reason: str):
-    async with httpx.AsyncClient(timeout=2.0) as client:
-        try:
-            await client.post(f"{OOBSC_URL}/inhibit", json={"inhibit": True})
-            print(f"[egress] Inhibit triggered: {reason}", flush=True)
-        except Exception as e:
-            print(f"[egress] Failed to contact OOBSC: {e}", flush=True)
+    @field_validator("headers")
+    @classmethod
+    def _valid_headers(cls, headers):
+        for name, value in (headers or {}).items():
+            if not HEADER_NAME.fullmatch(name) or not value.isascii() or any(c in value for c in "\r\n\0"):
+                raise ValueError(f"invalid header: {name!r}")
+        return headers
+
+    @field_validator("method")
+    @classmethod
+    def _valid_method(cls, method):
+        if not HEADER_NAME.fullmatch(method):
+            raise ValueError(f"invalid method: {method!r}")
+        return method
 
 @app.get("/health")
 async def health():
-    return {"ok": True, "allowed_domains": sorted(ALLOWED)}
+    return {"ok": True, "policy": POLICY.stats(), "oobsc": OOBSC.stats(), "decoys": len(MATCHER),
+            "upstream": POOLS.stats(), "dns": RESOLVER.stats(),
+            "cache": CACHE.stats() if CACHE else None}
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.post("/fetch")
-async def fetch(req: FetchReq):
+async def fetch(req: FetchReq, request: Request):
+    CURRENT_AGENT.set(request.headers.get(AGENT_HEADER))  # for the OOBSC event journal
+    try:
+        out = await _fetch(req)
+    except HTTPException as e:
+        REQUESTS.inc(str(e.status_code))
+        raise
+    REQUESTS.inc(str(out.status_code) if isinstance(out, Response) else "200")
+    return out
+
+async def _fetch(req: FetchReq):
     # Parse hostname
     parsed = urlparse(req.url)
     host = (parsed.hostname or "").lower()
@@ -41,29 +177,250 @@ async def fetch(req: FetchReq):
     if not host:
         raise HTTPException(status_code=400, detail="Invalid URL")
 
-    # Enforce allow-list
-    if host not in ALLOWED:
-        await trigger_inhibit(f"Outbound to forbidden domain: {host}")
-        raise HTTPException(status_code=403, detail=f"Domain not allowed: {host}")
+    try:
+        url = httpx.URL(req.url)
+    except httpx.InvalidURL:
+        raise HTTPException(status_code=400, detail="Invalid URL")
+    with SCAN_TIME.time():
+        hit = scan_outbound(req)
+    if hit:
+        decoy, variant = hit
+        OOBSC.inhibit(f"Honeytoken in outbound request to {url.host} (decoy: {decoy}, encoding: {variant})", decoy)
+        raise HTTPException(status_code=403, detail=f"Outbound request carries a honeytoken ({decoy})")
+    stream = req.stream if req.stream is not None else FETCH_MODE == "stream"
+    if CACHE and request_cacheable(req.method, req.headers, req.body is not None):
+        return await fetch_cached(req, url, stream)
+    resp, held = await open_upstream(req, url)
+    return await respond(resp, releaser(resp, held), stream)
+
+def scan_outbound(req: FetchReq) -> tuple[str, str] | None:
+    """One automaton pass over the URL, headers and body the agent asked
+    to send. Fields are joined with newlines so no match spans two. The
+    percent/plus-decoded form (query strings, form bodies) is scanned too:
+    the matcher only knows the canonical encodings of each token, and a
+    partly or oddly encoded one decodes back to the plain token."""
+    parts = [req.url]
+    if req.headers:
+        parts += [f"{k}: {v}" for k, v in req.headers.items()]
+    if req.body is not None:
+        parts.append(req.body)
+    text = "\n".join(parts)
+    decoded = unquote_plus(text)
+    if decoded != text:
+        text += "\n" + decoded
+    if not text.isascii():
+        text = text.encode("utf-8").decode("latin-1")  # the matcher works on raw bytes
+    return MATCHER.search(text)
 
-    # Forward the request
+async def open_upstream(req: FetchReq, url: httpx.URL, extra_headers: dict | None = None):
+    """Send req to url -> (streaming response, held origin slot).
+
+    The body is never buffered whole: stream mode relays it chunk by chunk,
+    summary mode reads just enough for the text. The origin slot (and its
+    pooled connection) is held until the body has been relayed or
+    summarized. Redirects are followed here, so every hop goes through the
+    policy, the resolver and the pinned address."""
+    upstream = None
+    held = AsyncExitStack()
+    t0 = time.perf_counter()
     try:
-        async with httpx.AsyncClient(timeout=TIMEOUT, follow_redirects=True) as client:
-            resp = await client.request(
-                req.method.upper(),
-                req.url,
-                headers=req.headers,
-                content=(req.body.encode("utf-8") if req.body is not None else None),
-            )
-            # Return a trimmed response (status + text)
-            text = resp.text
-            # Keep it small for logs
-            if len(text) > 2000:
-                text = text[:2000] + "...(truncated)"
-            return {
-                "status_code": resp.status_code,
-                "headers": dict(resp.headers),
-                "text": text,
-            }
+        for hop in range(MAX_REDIRECTS + 1):
+            check_destination(url, "Redirect to" if hop else "Outbound to")
+            await pin_destination(url)
+            client = await held.enter_async_context(POOLS.slot(str(url)))
+            if upstream is None:
+                upstream = client.build_request(
+                    req.method.upper(),
+                    url,
+                    headers={**(req.headers or {}), **(extra_headers or {})},
+                    content=(req.body.encode("utf-8") if req.body is not None else None),
+                )
+            resp = await client.send(upstream, stream=True)
+            if not (resp.is_redirect and resp.next_request):
+                UPSTREAM_TIME.observe(time.perf_counter() - t0)
+                return resp, held
+            if hop == MAX_REDIRECTS:
+                await resp.aclose()
+                raise HTTPException(status_code=502, detail=f"Upstream error: more than {MAX_REDIRECTS} redirects")
+            upstream = resp.next_request
+            url = upstream.url
+            await resp.aclose()
+            await held.aclose()
+            held = AsyncExitStack()
+    except BaseException as e:
+        # whatever went wrong, give the origin slot back
+        await held.aclose()
+        if isinstance(e, PoolBusy):
+            raise HTTPException(status_code=503, detail=f"Upstream busy: {url.host}: {e}")
+        if isinstance(e, httpx.HTTPError):
+            raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+        raise
+
+def releaser(resp: httpx.Response, held: AsyncExitStack | None = None):
+    async def release():
+        # idempotent: runs from relay()'s finally and as the background task,
+        # whichever comes first (a client disconnect can skip either one)
+        await resp.aclose()
+        if held is not None:
+            await held.aclose()
+    return release
+
+async def respond(resp: httpx.Response, release, stream: bool, cache: str | None = None):
+    if stream:
+        headers = relay_headers(resp.headers)
+        if cache:
+            headers["x-guardian-cache"] = cache
+        return StreamingResponse(relay(resp, release), status_code=resp.status_code,
+                                 headers=headers, background=BackgroundTask(release))
+    try:
+        out = await summarize(resp)
     except httpx.HTTPError as e:
         raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+    finally:
+        await release()
+    if cache:
+        out["cache"] = cache
+    return out
+
+async def fetch_cached(req: FetchReq, url: httpx.URL, stream: bool):
+    """GET through the shared response cache. A fresh entry is served
+    without touching upstream; a stale one is revalidated; concurrent misses
+    for one request (URL and headers) wait for the first to fetch it."""
+    started = time.perf_counter()
+    key = cache_key(str(url), req.headers)
+    entry = CACHE.lookup(key)
+    if not (entry and entry.fresh()) and not await CACHE.flight(key):
+        # someone else fetched it; if it still is not fresh, go uncached
+        entry = CACHE.lookup(key)
+        if not (entry and entry.fresh()):
+            CACHE.misses += 1
+            resp, held = await open_upstream(req, url)
+            return await respond(resp, releaser(resp, held), stream, "bypass")
+    if entry and entry.fresh():
+        return await serve_entry(entry, stream, "hit", started)
+
+    # leading the fetch: every path below must land() the flight
+    CACHE.misses += 1
+    # open the stale body before revalidating: the entry may be evicted
+    # meanwhile, and an open spill file stays readable
+    body = CachedStream(entry, STREAM_CHUNK) if entry else None
+    try:
+        resp, held = await open_upstream(req, url, entry.validators() if entry else None)
+    except BaseException:
+        CACHE.land(key)
+        if body:
+            await body.aclose()
+        raise
+    if resp.status_code == 304 and entry:
+        await releaser(resp, held)()
+        CACHE.refresh(entry, resp.headers)
+        CACHE.land(key)
+        return await serve_entry(entry, stream, "revalidated", started, body)
+    if body:
+        await body.aclose()
+    life = lifetime(resp.status_code, resp.headers, time.time())
+    if life is None:
+        CACHE.land(key)
+        CACHE.observe("miss", started)
+        return await respond(resp, releaser(resp, held), stream, "miss")
+    writer = CACHE.writer(key, str(resp.url), resp.status_code, resp.headers, life)
+    tee = httpx.Response(resp.status_code, headers=resp.headers,
+                         stream=TeeStream(resp, writer, STREAM_CHUNK))
+    release = releaser(tee, held)
+    CACHE.observe("miss", started)
+    if stream:
+        return await respond(tee, release, stream, "miss")
+    # summary mode reads the whole body so it can be stored
+    try:
+        async for _chunk in tee.aiter_raw(STREAM_CHUNK):
+            if writer.done:
+                break  # too large to store
+    except httpx.HTTPError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+    finally:
+        await release()
+    if writer.committed:
+        stored = writer.entry.response(STREAM_CHUNK)
+        return await respond(stored, releaser(stored), stream, "miss")
+    head = httpx.Response(resp.status_code, headers=resp.headers, content=bytes(writer.head))
+    return await respond(head, releaser(head), stream, "miss")
+
+async def serve_entry(entry: Entry, stream: bool, outcome: str, started: float,
+                      body: CachedStream | None = None):
+    resp = entry.response(STREAM_CHUNK, body)
+    try:
+        # the policy may have changed since the entry was stored
+        check_destination(httpx.URL(entry.url), "Outbound to")
+    except HTTPException:
+        await resp.aclose()
+        raise
+    if outcome == "hit":
+        CACHE.hits += 1
+    CACHE.bytes_served += entry.size
+    CACHE.observe(outcome, started)
+    return await respond(resp, releaser(resp), stream, outcome)
+
+def check_destination(url: httpx.URL, what: str):
+    """Policy check for one hop; a forbidden destination inhibits and 403s."""
+    with DECISION_TIME.time():
+        decision = POLICY.check_url(url)
+    if not decision.allowed:
+        why = f" (rule: {decision.rule})" if decision.rule else ""
+        OOBSC.inhibit(f"{what} forbidden destination: {url.host}{why}")
+        raise HTTPException(status_code=403, detail=f"Destination not allowed: {url.host}{why}")
+
+async def pin_destination(url: httpx.URL):
+    """Resolve the host (cached) and pin an address the policy accepts."""
+    port = url.port or DEFAULT_PORTS.get(url.scheme, 0)
+    path = normalize_path(url.path)
+
+    def allowed(addr: str) -> bool:
+        d = POLICY.check_ip(url.scheme, addr, port, path)
+        if d is not None:
+            return d.allowed  # explicit IP/CIDR rule
+        return not BLOCK_PRIVATE or ipaddress.ip_address(addr).is_global
+
+    try:
+        # raw_host: the punycode name httpcore hands to PinnedBackend
+        await RESOLVER.pin(url.raw_host.decode("ascii"), port, allowed)
+    except AddressRejected as e:
+        OOBSC.inhibit(f"Outbound to disallowed address: {e}")
+        raise HTTPException(status_code=403, detail=f"Destination not allowed: {e}")
+    except ResolveError as e:
+        raise HTTPException(status_code=502, detail=f"Upstream error: {e}")
+
+def relay_headers(headers: httpx.Headers) -> dict:
+    # Raw bytes are relayed, so content-encoding and content-length still hold.
+    drop = HOP_BY_HOP | {k.strip().lower() for k in headers.get("connection", "").split(",")}
+    return {k: v for k, v in headers.items() if k.lower() not in drop}
+
+async def relay(resp: httpx.Response, release):
+    # Each chunk is awaited into the client socket before the next upstream
+    # read, so a slow reader stalls the upstream rather than growing memory.
+    try:
+        async for chunk in resp.aiter_raw(STREAM_CHUNK):
+            yield chunk
+    except httpx.HTTPError as e:
+        # headers are already sent; cutting the stream short is all we can do
+        print(f"[egress] Upstream stream broke: {e}", flush=True)
+    finally:
+        await release()
+
+async def summarize(resp: httpx.Response) -> dict:
+    """Status, headers and the first SUMMARY_CHARS of text."""
+    budget = SUMMARY_CHARS * 4  # enough bytes for 2000 chars of UTF-8
+    buf, more = bytearray(), False
+    async for chunk in resp.aiter_bytes(STREAM_CHUNK):
+        buf += chunk
+        if len(buf) > budget:
+            more = True
+            break
+    text = bytes(buf).decode(resp.encoding or "utf-8", errors="replace")
+    # Keep it small for logs
+    if more or len(text) > SUMMARY_CHARS:
+        text = text[:SUMMARY_CHARS] + "...(truncated)"
+    return {
+        "status_code": resp.status_code,
+        "headers": dict(resp.headers),
+        "text": text,
+    }
@@ -0,0 +1,285 @@
+# detectors/egress_policy.py
+# Compiled egress policy. Host rules live in a trie keyed by reversed DNS
+# labels (com -> example -> api), IP rules in a binary radix tree per
+# address family, so a lookup costs one walk down the host name or address
+# however many rules are loaded. Decisions are memoised in an LRU cache that
+# belongs to the compiled Policy, so a reload swaps rules and cache together.
+#
+# Policy file, one rule per line ('#' starts a comment):
+#
+#   allow example.com                 exact host, any scheme/port/path
+#   allow *.example.com               subdomains only
+#   allow .example.com                example.com and all subdomains
+#   allow https://api.example.com:443/v1   scheme, port and path prefix
+#   allow 10.0.0.0/8                  IPv4/IPv6 literal or CIDR
+#   deny  https://*.example.com/admin
+#
+# The most specific host match wins (exact, then deeper suffixes, then
+# longer CIDR prefixes); among rules for the same host, longer path prefixes
+# are tried first, then file order. Anything unmatched is denied.
+#
+# URLs are parsed with httpx, the same parser the gateway sends with. Paths
+# are matched percent-decoded, with dot segments resolved, repeated slashes
+# collapsed and backslashes read as slashes, so /v1/../admin, /%61dmin and
+# /v1%2F..%2Fadmin are all judged as /admin.
+import os, ipaddress, functools
+from typing import NamedTuple
+import httpx
+
+CACHE_SIZE = int(os.getenv("POLICY_CACHE_SIZE", "65536"))
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+class Rule(NamedTuple):
+    allow: bool
+    scheme: str | None  # None = any
+    port: int | None    # None = any
+    path: str           # prefix; "" = any
+    text: str           # as written, for logs
+    order: int
+
+    def matches(self, scheme: str, port: int, path: str) -> bool:
+        if self.scheme is not None and self.scheme != scheme:
+            return False
+        if self.port is not None and self.port != port:
+            return False
+        p = self.path
+        return not p or path == p or path.startswith(p if p.endswith("/") else p + "/")
+
+class Decision(NamedTuple):
+    allowed: bool
+    rule: str | None  # matching rule text; None = default deny
+
+DENY = Decision(False, None)
+
+class PolicyError(ValueError):
+    pass
+
+class _HostNode:
+    __slots__ = ("children", "exact", "wild", "suffix")
+
+    def __init__(self):
+        self.children: dict[str, "_HostNode"] = {}
+        self.exact: list[Rule] = []   # this name only
+        self.wild: list[Rule] = []    # *.name: strictly below
+        self.suffix: list[Rule] = []  # .name: this name and below
+
+class _RadixTree:
+    """Binary trie over address bits; nodes are [zero, one, rules]."""
+
+    def __init__(self, bits: int):
+        self.bits = bits
+        self.root = [None, None, None]
+
+    def insert(self, net: ipaddress.IPv4Network | ipaddress.IPv6Network, rule: Rule):
+        node, addr = self.root, int(net.network_address)
+        for i in range(net.prefixlen):
+            b = (addr >> (self.bits - 1 - i)) & 1
+            if node[b] is None:
+                node[b] = [None, None, None]
+            node = node[b]
+        if node[2] is None:
+            node[2] = []
+        node[2].append(rule)
+
+    def lookup(self, addr: int) -> list[list[Rule]]:
+        """Rule lists on the path to addr, longest prefix first."""
+        found, node, shift = [], self.root, self.bits - 1
+        while node is not None:
+            if node[2]:
+                found.append(node[2])
+            if shift < 0:
+                break
+            node = node[(addr >> shift) & 1]
+            shift -= 1
+        found.reverse()
+        return found
+
+def _sorted(rules: list[Rule]) -> list[Rule]:
+    return sorted(rules, key=lambda r: (-len(r.path), r.order))
+
+def parse_rule(line: str, order: int) -> tuple[str, Rule]:
+    """-> (host pattern, rule)."""
+    text = line.strip()
+    verb, _, target = text.partition(" ")
+    if verb not in ("allow", "deny") or not target.strip():
+        raise PolicyError(f"expected 'allow|deny <pattern>': {text!r}")
+    target = target.strip()
+    scheme = None
+    if "://" in target:
+        scheme, target = target.split("://", 1)
+        scheme = None if scheme == "*" else scheme.lower()
+    host, slash, path = target.partition("/")
+    path = slash + path if slash else ""
+    if host.startswith("["):  # [v6]:port
+        h, _, rest = host[1:].partition("]")
+        host, port = h, rest[1:] if rest.startswith(":") else ""
+    elif host.count(":") == 1:
+        host, port = host.split(":")
+    else:
+        port = ""
+    # a CIDR's prefix length was split off as the path
+    if path and _ip(host) is not None and path[1:].isdigit() and "/" not in path[1:]:
+        host, path = f"{host}{path}", ""
+    try:
+        port_n = None if port in ("", "*") else int(port)
+    except ValueError:
+        raise PolicyError(f"bad port in {text!r}")
+    path = path.rstrip("*")
+    rule = Rule(verb == "allow", scheme, port_n, normalize_path(path) if path else "", text, order)
+    return host.lower().rstrip("."), rule
+
+def normalize_path(path: str) -> str:
+    """Decoded URL path -> the path a lenient server would resolve it to."""
+    out = []
+    segs = path.replace("\\", "/").split("/")
+    for seg in segs:
+        if seg == "..":
+            if out:
+                out.pop()
+        elif seg not in ("", "."):
+            out.append(seg)
+    norm = "/" + "/".join(out)
+    if out and segs[-1] in ("", ".", ".."):
+        norm += "/"
+    return norm
+
+def _ip(host: str):
+    # cheap pre-check: parsing every hostname as an address is slow
+    if not host or not (host[-1].isdigit() or ":" in host):
+        return None
+    try:
+        return ipaddress.ip_address(host)
+    except ValueError:
+        return None
+
+class Policy:
+    """Immutable compiled rule set. Build a new one to change rules and swap
+    the reference; requests in flight keep the Policy they started with."""
+
+    def __init__(self, lines, source: str = ""):
+        self.source = source
+        self.root = _HostNode()
+        self.nets = {4: _RadixTree(32), 6: _RadixTree(128)}
+        self.rules = 0
+        for n, line in enumerate(lines):
+            line = line.split("#", 1)[0].strip()
+            if line:
+                self._add(*parse_rule(line, n))
+        self._finish(self.root)
+        self.decide = functools.lru_cache(maxsize=CACHE_SIZE)(self._decide)
+        # hot URLs skip parsing too
+        self.check_url = functools.lru_cache(maxsize=CACHE_SIZE)(self._check_url)
+
+    @classmethod
+    def from_file(cls, path: str) -> "Policy":
+        with open(path, encoding="utf-8") as f:
+            return cls(f.read().splitlines(), source=path)
+
+    @classmethod
+    def from_domains(cls, domains) -> "Policy":
+        """ALLOWED_DOMAINS compatibility: exact hosts, any scheme/port/path."""
+        return cls([f"allow {d}" for d in domains], source="ALLOWED_DOMAINS")
+
+    def __len__(self):
+        return self.rules
+
+    def _add(self, host: str, rule: Rule):
+        self.rules += 1
+        try:
+            net = ipaddress.ip_network(host, strict=False)
+        except ValueError:
+            net = None
+        if net is not None:
+            self.nets[net.version].insert(net, rule)
+            return
+        if not host or "*" in host.lstrip("*."):
+            raise PolicyError(f"bad host pattern in {rule.text!r}")
+        kind = "exact"
+        if host.startswith("*."):
+            kind, host = "wild", host[2:]
+        elif host.startswith("."):
+            kind, host = "suffix", host[1:]
+        node = self.root
+        for label in reversed(host.split(".")):
+            node = node.children.setdefault(label, _HostNode())
+        getattr(node, kind).append(rule)
+
+    def _finish(self, node: _HostNode):
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            n.exact, n.wild, n.suffix = _sorted(n.exact), _sorted(n.wild), _sorted(n.suffix)
+            stack.extend(n.children.values())
+        for tree in self.nets.values():
+            stack = [tree.root]
+            while stack:
+                n = stack.pop()
+                if n[2]:
+                    n[2] = _sorted(n[2])
+                stack.extend(c for c in n[:2] if c is not None)
+
+    def candidates(self, host: str) -> list[list[Rule]]:
+        """Rule lists that apply to host, most specific first."""
+        ip = _ip(host)
+        if ip is not None:
+            return self.nets[ip.version].lookup(int(ip))
+        labels = host.split(".")
+        found, node, depth = [], self.root, len(labels)
+        for i, label in enumerate(reversed(labels)):
+            node = node.children.get(label)
+            if node is None:
+                break
+            last = i == depth - 1
+            if node.suffix:
+                found.append(node.suffix)
+            if not last and node.wild:
+                found.append(node.wild)
+            if last and node.exact:
+                found.append(node.exact)
+        found.reverse()
+        return found
+
+    def _decide(self, scheme: str, host: str, port: int, path: str) -> Decision:
+        for rules in self.candidates(host):
+            for r in rules:
+                if r.matches(scheme, port, path):
+                    return Decision(r.allow, r.text)
+        return DENY
+
+    def check_ip(self, scheme: str, addr: str, port: int, path: str) -> Decision | None:
+        """Decision of the IP/CIDR rules alone for a resolved address; None
+        when no IP rule matches."""
+        ip = ipaddress.ip_address(addr)
+        for rules in self.nets[ip.version].lookup(int(ip)):
+            for r in rules:
+                if r.matches(scheme, port, path):
+                    return Decision(r.allow, r.text)
+        return None
+
+    def _check_url(self, url: "str | httpx.URL") -> Decision:
+        """Pass the gateway's own parsed httpx.URL where there is one, so
+        the policy judges exactly the URL that will be requested."""
+        if not isinstance(url, httpx.URL):
+            try:
+                url = httpx.URL(url)
+            except httpx.InvalidURL:
+                return DENY
+        scheme = url.scheme
+        host = url.host.rstrip(".")
+        if not host:
+            return DENY
+        port = url.port or DEFAULT_PORTS.get(scheme, 0)
+        return self.decide(scheme, host, port, normalize_path(url.path))
+
+    def stats(self) -> dict:
+        c, u = self.decide.cache_info(), self.check_url.cache_info()
+        return {"source": self.source, "rules": self.rules,
+                "cache": {"hits": c.hits + u.hits, "misses": c.misses, "size": c.currsize,
+                          "urls": u.currsize}}
+
+def policy_signature(path: str) -> tuple:
+    try:
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    except FileNotFoundError:
+        return ()
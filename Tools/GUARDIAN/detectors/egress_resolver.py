@@ -0,0 +1,139 @@
+# detectors/egress_resolver.py
+# In-process DNS cache for the egress gateway, and address pinning. The
+# gateway resolves a host, validates the addresses against the policy, and
+# pins the one it accepted; PinnedBackend then connects only to pinned
+# addresses, so the socket goes exactly where the check said it may, and a
+# second lookup inside the HTTP client cannot be steered elsewhere (DNS
+# rebinding). TLS still verifies against the host name.
+import os, asyncio, socket, time, ipaddress
+import httpcore
+
+try:
+    import dns.asyncresolver  # dnspython, optional: gives real record TTLs
+except ImportError:
+    dns = None
+
+DNS_TTL = float(os.getenv("DNS_TTL_SEC", "60"))        # used when the TTL is unknown
+DNS_MIN_TTL = float(os.getenv("DNS_MIN_TTL_SEC", "5"))
+DNS_MAX_TTL = float(os.getenv("DNS_MAX_TTL_SEC", "300"))
+DNS_NEGATIVE_TTL = float(os.getenv("DNS_NEGATIVE_TTL_SEC", "5"))
+DNS_MAX_ENTRIES = int(os.getenv("DNS_MAX_ENTRIES", "10000"))
+PIN_MAX_ENTRIES = int(os.getenv("PIN_MAX_ENTRIES", str(DNS_MAX_ENTRIES)))
+
+class ResolveError(Exception):
+    pass
+
+class AddressRejected(Exception):
+    """The host resolved only to addresses the policy does not allow."""
+
+def literal_ip(host: str) -> bool:
+    try:
+        ipaddress.ip_address(host)
+        return True
+    except ValueError:
+        return False
+
+class Resolver:
+    def __init__(self):
+        self.cache: dict[str, tuple[float, list[str] | str]] = {}  # host -> (expires, addrs | error)
+        self.inflight: dict[str, asyncio.Future] = {}
+        self.pins: dict[tuple[str, int], str] = {}  # (ascii host, port) -> addr, least recently pinned first
+        self.engine = "dnspython" if dns else "getaddrinfo"
+        self.hits = 0
+        self.misses = 0
+
+    async def resolve(self, host: str) -> list[str]:
+        """Cached, single-flight lookup; concurrent misses share one query."""
+        if literal_ip(host):
+            return [host]
+        hit = self.cache.get(host)
+        if hit and hit[0] > time.monotonic():
+            self.hits += 1
+            if isinstance(hit[1], str):
+                raise ResolveError(hit[1])
+            return hit[1]
+        fut = self.inflight.get(host)
+        if fut is None:
+            self.misses += 1
+            fut = self.inflight[host] = asyncio.ensure_future(self._refresh(host))
+            fut.add_done_callback(lambda _f: self.inflight.pop(host, None))
+        return await asyncio.shield(fut)
+
+    async def _refresh(self, host: str) -> list[str]:
+        try:
+            addrs, ttl = await self._lookup(host)
+        except (OSError, ResolveError) as e:
+            self._store(host, f"cannot resolve {host}: {e}", DNS_NEGATIVE_TTL)
+            raise ResolveError(f"cannot resolve {host}: {e}")
+        self._store(host, addrs, min(max(ttl, DNS_MIN_TTL), DNS_MAX_TTL))
+        return addrs
+
+    def _store(self, host: str, value, ttl: float):
+        if len(self.cache) >= DNS_MAX_ENTRIES:
+            now = time.monotonic()
+            self.cache = {h: v for h, v in self.cache.items() if v[0] > now}
+            if len(self.cache) >= DNS_MAX_ENTRIES:
+                self.cache.pop(next(iter(self.cache)))  # oldest insert
+        self.cache[host] = (time.monotonic() + ttl, value)
+
+    async def _lookup(self, host: str) -> tuple[list[str], float]:
+        if dns:
+            addrs, ttl = [], None
+            for rdtype in ("A", "AAAA"):
+                try:
+                    ans = await dns.asyncresolver.resolve(host, rdtype)
+                except (dns.resolver.NoAnswer, dns.resolver.NXDOMAIN):
+                    continue
+                except dns.exception.DNSException as e:
+                    raise ResolveError(str(e) or type(e).__name__)
+                addrs += [r.address for r in ans]
+                ttl = ans.rrset.ttl if ttl is None else min(ttl, ans.rrset.ttl)
+            if not addrs:
+                raise ResolveError("no A/AAAA records")
+            return addrs, ttl
+        infos = await asyncio.get_running_loop().getaddrinfo(host, None, type=socket.SOCK_STREAM)
+        addrs = list(dict.fromkeys(info[4][0] for info in infos))  # dedupe, keep order
+        return addrs, DNS_TTL
+
+    async def pin(self, host: str, port: int, allowed) -> str:
+        """Resolve host and pin the first address `allowed(addr)` accepts.
+        host is the ASCII (punycode) form, as httpcore connects to it."""
+        addrs = await self.resolve(host)
+        for addr in addrs:
+            if allowed(addr):
+                self.pins.pop((host, port), None)  # re-pinned: most recent again
+                self.pins[(host, port)] = addr
+                if len(self.pins) > PIN_MAX_ENTRIES:
+                    self.pins.pop(next(iter(self.pins)))
+                return addr
+        raise AddressRejected(f"{host} resolves only to disallowed addresses ({', '.join(addrs)})")
+
+    def pinned(self, host: str, port: int) -> str | None:
+        if literal_ip(host):
+            return host
+        return self.pins.get((host, port))
+
+    def stats(self) -> dict:
+        return {"engine": self.engine, "entries": len(self.cache), "pins": len(self.pins),
+                "hits": self.hits, "misses": self.misses}
+
+class PinnedBackend(httpcore.AsyncNetworkBackend):
+    """httpcore network backend that connects to the pinned address for a
+    host and refuses hosts that were never validated."""
+
+    def __init__(self, resolver: Resolver):
+        self.resolver = resolver
+        self.inner = httpcore.AnyIOBackend()
+
+    async def connect_tcp(self, host, port, timeout=None, local_address=None, socket_options=None):
+        addr = self.resolver.pinned(host, port)
+        if addr is None:
+            raise httpcore.ConnectError(f"{host}:{port} has no validated address")
+        return await self.inner.connect_tcp(addr, port, timeout=timeout, local_address=local_address,
+                                            socket_options=socket_options)
+
+    async def connect_unix_socket(self, path, timeout=None, socket_options=None):
+        raise httpcore.ConnectError("unix sockets are not an egress destination")
+
+    async def sleep(self, seconds):
+        await self.inner.sleep(seconds)
@@ -1,15 +1,29 @@
 # detectors/honeytoken_detector.py
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
 from pydantic import BaseModel
-import os, pathlib, asyncio
-import httpx
+import os, time, pathlib, asyncio, zlib
+from oobsc_client import OOBSCClient, CURRENT_AGENT, AGENT_HEADER
+import metrics
+from honeytoken_matcher import Matcher, Inflater, load_decoys, dir_signature, looks_compressed
 
 # --- Configuration ---
 OOBSC_URL = os.getenv("OOBSC_URL", "http://127.0.0.1:8000")
 HONEYPOT_HOST = os.getenv("HONEYPOT_HOST", "127.0.0.1")
 HONEYPOT_PORT = int(os.getenv("HONEYPOT_PORT", "9000"))
-DECOY_DIR = pathlib.Path("decoys")
+DECOY_DIR = pathlib.Path(os.getenv("DECOY_DIR", "decoys"))
 DECOY_FILE = DECOY_DIR / "fake_key.txt"
+DECOY_RELOAD_SEC = float(os.getenv("DECOY_RELOAD_SEC", "2"))
+# "stream": scan request.stream() chunk by chunk (bounded memory, stops at
+# the first match); "buffer": read the whole body first.
+INGEST_MODE = os.getenv("INGEST_MODE", "stream").lower()
+# Inflate gzip/deflate bodies before scanning, up to INFLATE_MAX_MB of output.
+INFLATE = os.getenv("INFLATE", "1") not in ("0", "false", "off")
+INFLATE_MAX = int(float(os.getenv("INFLATE_MAX_MB", "64")) * 1024 * 1024)
+# Past the budget the compressed remainder cannot be inspected: "inhibit"
+# fails closed (413 + inhibit), "raw" only keeps scanning the raw bytes.
+INFLATE_OVERFLOW = os.getenv("INFLATE_OVERFLOW", "inhibit").lower()
 
 # Ensure decoy exists (idempotent)
 DECOY_DIR.mkdir(parents=True, exist_ok=True)
@@ -17,31 +31,153 @@ if not DECOY_FILE.exists():
     # You can change this value; keep it unique-ish.
     DECOY_FILE.write_text("FAKE_API_KEY=XYZ-123-SUPER-SECRET\n", encoding="utf-8")
 
-TOKEN = DECOY_FILE.read_text(encoding="utf-8").strip()
+OOBSC = OOBSCClient(OOBSC_URL, "detector")
 
-app = FastAPI(title="HoneytokenDetector")
+INGESTS = metrics.Counter("guardian_ingest_requests_total", "Ingested payloads by outcome", ("result",))
+INGEST_BYTES = metrics.Counter("guardian_ingest_bytes_total", "Payload bytes scanned")
+# Scanner CPU only: time spent awaiting body chunks from the client is excluded.
+SCAN_TIME = metrics.Histogram("guardian_ingest_scan_seconds", "Decoy scan time per payload")
+DECOYS = metrics.Gauge("guardian_decoys", "Compiled decoys", lambda: len(MATCHER))
 
-class InhibitReq(BaseModel):
-    inhibit: bool
+# Compiled matcher over every decoy in DECOY_DIR; swapped whole on reload.
+MATCHER = Matcher(load_decoys(DECOY_DIR))
 
-async def trigger_inhibit(reason: str):
-    async with httpx.AsyncClient(timeout=2.0) as client:
+async def watch_decoys():
+    global MATCHER
+    sig = dir_signature(DECOY_DIR)
+    while True:
+        await asyncio.sleep(DECOY_RELOAD_SEC)
+        new_sig = dir_signature(DECOY_DIR)
+        if new_sig == sig:
+            continue
         try:
-            await client.post(f"{OOBSC_URL}/inhibit", json={"inhibit": True})
-            print(f"[detector] Inhibit triggered. Reason: {reason}", flush=True)
+            # Build off the event loop, then publish with a single assignment.
+            matcher = await asyncio.to_thread(lambda: Matcher(load_decoys(DECOY_DIR)))
         except Exception as e:
-            print(f"[detector] Failed to contact OOBSC: {e}", flush=True)
+            print(f"[detector] Decoy reload failed, keeping old set: {e}", flush=True)
+            continue
+        MATCHER, sig = matcher, new_sig
+        print(f"[detector] Reloaded {len(matcher)} decoys", flush=True)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await OOBSC.start()
+    watcher = asyncio.create_task(watch_decoys())
+    yield
+    watcher.cancel()
+    await OOBSC.close()
+
+app = FastAPI(title="HoneytokenDetector", lifespan=lifespan)
+
+class InhibitReq(BaseModel):
+    inhibit: bool
 
 @app.get("/health")
 async def health():
-    return {"ok": True, "watching_for": TOKEN[:12] + "...(redacted)"}
+    return {"ok": True, "decoys": len(MATCHER), "engine": MATCHER.engine, "oobsc": OOBSC.stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+def new_inflater(request: Request, head: bytes) -> Inflater | None:
+    if not INFLATE:
+        return None
+    encoding = request.headers.get("content-encoding", "").lower()
+    if encoding == "deflate":
+        # "deflate" is zlib-wrapped by the spec but often sent raw
+        return Inflater(INFLATE_MAX, raw=not looks_compressed(head))
+    if encoding in ("gzip", "x-gzip") or looks_compressed(head):
+        return Inflater(INFLATE_MAX)
+    return None
+
+class Uninspectable(Exception):
+    pass
+
+async def scan_body(request: Request, chunks) -> tuple[tuple[str, str] | None, int]:
+    # The raw bytes are always scanned. A compressed body is inflated and
+    # scanned a second time, so data after the end of the deflate stream is
+    # not missed. Raises Uninspectable when the inflate budget runs out and
+    # INFLATE_OVERFLOW=inhibit, or when a body known to be compressed turns
+    # out to be corrupt (what follows the error cannot be inspected).
+    scanner = MATCHER.scanner()
+    inflater = inflated = None
+    compressed = False  # magic header seen, or inflating already produced output
+    first = True
+    busy = 0.0  # scan time only; waiting for the client's next chunk is not counted
+
+    def inflate(chunk: bytes, final: bool = False):
+        nonlocal inflater
+        try:
+            for piece in inflater.feed(chunk, final):
+                hit = inflated.feed(piece)
+                if hit:
+                    return hit
+        except zlib.error as e:
+            # everything inflated before the error has been scanned
+            if compressed or inflated.scanned:
+                raise Uninspectable(f"corrupt compressed body after {inflated.scanned} bytes: {e}")
+            inflater = None  # not actually compressed; the raw scan covers it
+            return None
+        if inflater.truncated:
+            if INFLATE_OVERFLOW != "raw":
+                raise Uninspectable(f"compressed body inflates past {INFLATE_MAX} bytes")
+            print(f"[detector] Inflate budget exhausted after {inflated.scanned} bytes; "
+                  "scanning the rest raw", flush=True)
+        return None
+
+    try:
+        async for chunk in chunks:
+            t0 = time.perf_counter()
+            try:
+                if first:
+                    inflater, first = new_inflater(request, chunk), False
+                    inflated = MATCHER.scanner() if inflater else None
+                    compressed = looks_compressed(chunk)
+                hit = scanner.feed(chunk)
+                if hit:
+                    # stop reading; the rest of the body is never buffered
+                    return hit, scanner.scanned
+                if inflater and not inflater.truncated:
+                    hit = inflate(chunk)
+                    if hit:
+                        return hit, scanner.scanned
+            finally:
+                busy += time.perf_counter() - t0
+        if inflater and not inflater.truncated:
+            t0 = time.perf_counter()
+            try:
+                hit = inflate(b"", final=True)  # the held-back trailer
+                if hit:
+                    return hit, scanner.scanned
+            finally:
+                busy += time.perf_counter() - t0
+        return None, scanner.scanned
+    finally:
+        SCAN_TIME.observe(busy)
+        INGEST_BYTES.inc(n=scanner.scanned)
 
 @app.post("/ingest")
 async def ingest(request: Request):
-    body = await request.body()
-    text = body.decode("utf-8", errors="ignore")
-    print(f"[detector] Received {len(text)} bytes", flush=True)
-    if TOKEN in text:
-        await trigger_inhibit("Honeytoken observed in egress")
-        return {"ok": True, "matched": True}
+    CURRENT_AGENT.set(request.headers.get(AGENT_HEADER))
+    try:
+        if INGEST_MODE == "buffer":
+            body = await request.body()
+            async def once():
+                yield body
+            hit, size = await scan_body(request, once())
+        else:
+            hit, size = await scan_body(request, request.stream())
+    except Uninspectable as e:
+        # fail closed: what we could not inflate may hold a decoy
+        INGESTS.inc("uninspectable")
+        OOBSC.inhibit(f"Uninspectable egress payload: {e}")
+        return JSONResponse({"ok": False, "matched": False, "error": str(e)}, status_code=413)
+    print(f"[detector] Received {size} bytes", flush=True)
+    if hit:
+        decoy, variant = hit
+        INGESTS.inc("match")
+        OOBSC.inhibit(f"Honeytoken observed in egress (decoy: {decoy}, encoding: {variant})", decoy)
+        return {"ok": True, "matched": True, "decoy": decoy, "encoding": variant}
+    INGESTS.inc("clean")
     return {"ok": True, "matched": False}
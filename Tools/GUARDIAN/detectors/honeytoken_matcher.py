@@ -0,0 +1,242 @@
+# detectors/honeytoken_matcher.py
+# Multi-pattern decoy matcher: every decoy in a directory is compiled into a
+# single Aho-Corasick automaton, so a payload is scanned once no matter how
+# many decoys are planted. Encoded forms of each decoy (hex, URL, base64 at
+# every alignment) are compiled into the same automaton, so catching an
+# encoded exfiltration costs no extra pass.
+import os, pathlib, base64, re, zlib
+from urllib.parse import quote, quote_plus
+
+try:
+    import ahocorasick  # pyahocorasick (C automaton), optional
+except ImportError:
+    ahocorasick = None
+
+# Shorter tokens would match ordinary traffic; ignore them.
+MIN_TOKEN_LEN = int(os.getenv("DECOY_MIN_LEN", "8"))
+
+def load_decoys(decoy_dir: pathlib.Path) -> dict[str, str]:
+    """Map decoy name (file name) -> token (stripped file content)."""
+    decoys = {}
+    for path in sorted(decoy_dir.iterdir()):
+        if not path.is_file() or path.name.startswith("."):
+            continue
+        try:
+            token = path.read_text(encoding="utf-8").strip()
+        except (OSError, UnicodeDecodeError):
+            continue
+        if len(token) >= MIN_TOKEN_LEN:
+            decoys[path.name] = token
+    return decoys
+
+def _b64_fragments(raw: bytes, alphabet: bytes | None) -> dict[str, bytes]:
+    """Base64 of raw as it appears inside a larger encoded blob.
+
+    Where raw lands in the 3-byte grouping depends on how many bytes precede
+    it, so there are three possible encodings. For each offset keep only the
+    characters that depend on raw alone (no neighbouring bytes)."""
+    out = {}
+    for offset in range(3):
+        enc = base64.b64encode(b"\0" * offset + raw, altchars=alphabet)
+        start = 4 if offset else 0          # first group mixes in the prefix
+        end = (offset + len(raw)) // 3 * 4  # last partial group mixes in the suffix
+        out[f"base64+{offset}"] = enc[start:end]
+    return out
+
+def encoded_variants(token: str) -> dict[str, str]:
+    """variant name -> search key (latin-1 str) for one decoy token."""
+    raw = token.encode("utf-8")
+    forms = {
+        "plain": raw,
+        "hex": raw.hex().encode(),
+        "HEX": raw.hex().upper().encode(),
+        "url": quote(raw, safe="").encode(),
+        "url+": quote_plus(raw, safe="").encode(),
+    }
+    # percent escapes in lowercase (%3d) are just as valid
+    forms["url-lower"] = re.sub(rb"%[0-9A-F]{2}", lambda m: m.group().lower(), forms["url"])
+    forms.update(_b64_fragments(raw, None))
+    for k, v in _b64_fragments(raw, b"-_").items():
+        forms[k.replace("base64", "base64url")] = v
+    keys, seen = {}, set()
+    for variant, key in forms.items():
+        if len(key) >= MIN_TOKEN_LEN and key not in seen:
+            seen.add(key)
+            keys[variant] = key.decode("latin-1")
+    return keys
+
+def dir_signature(decoy_dir: pathlib.Path) -> tuple:
+    """Cheap fingerprint of the decoy directory, used to detect changes."""
+    try:
+        return tuple(
+            (e.name, e.stat().st_mtime_ns, e.stat().st_size)
+            for e in sorted(os.scandir(decoy_dir), key=lambda e: e.name)
+            if e.is_file()
+        )
+    except FileNotFoundError:
+        return ()
+
+class _PyAutomaton:
+    """Pure-python Aho-Corasick, used when pyahocorasick is not installed.
+    Mirrors the subset of the pyahocorasick API we need."""
+
+    def __init__(self):
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [None]
+
+    def add_word(self, word: str, value):
+        s = 0
+        for ch in word:
+            nxt = self._goto[s].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[s][ch] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(None)
+            s = nxt
+        self._out[s] = value
+
+    def make_automaton(self):
+        goto, fail, out = self._goto, self._fail, self._out
+        queue = list(goto[0].values())
+        for s in queue:
+            for ch, nxt in goto[s].items():
+                f = fail[s]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                if out[nxt] is None:
+                    # inherit a match that ends here via the suffix link
+                    out[nxt] = out[fail[nxt]]
+                queue.append(nxt)
+
+    def iter(self, text: str):
+        goto, fail, out = self._goto, self._fail, self._out
+        s = 0
+        for i, ch in enumerate(text):
+            while s and ch not in goto[s]:
+                s = fail[s]
+            s = goto[s].get(ch, 0)
+            if out[s] is not None:
+                yield i, out[s]
+
+class Matcher:
+    """Immutable compiled decoy set. Build a new one to change decoys and swap
+    the reference; scans in flight keep using the old automaton."""
+
+    def __init__(self, decoys: dict[str, str], encoded: bool = True):
+        self.decoys = dict(decoys)
+        self.max_len = 0
+        self.patterns = 0
+        self.engine = "pyahocorasick" if ahocorasick else "python"
+        auto = ahocorasick.Automaton() if ahocorasick else _PyAutomaton()
+        for name, token in self.decoys.items():
+            # Match on raw bytes: latin-1 maps each byte to one char.
+            keys = encoded_variants(token) if encoded else {"plain": token.encode("utf-8").decode("latin-1")}
+            for variant, key in keys.items():
+                auto.add_word(key, (name, variant))
+                self.max_len = max(self.max_len, len(key))
+                self.patterns += 1
+        if self.decoys:
+            auto.make_automaton()
+        self._auto = auto
+
+    def __len__(self):
+        return len(self.decoys)
+
+    def search(self, text: str) -> tuple[str, str] | None:
+        """(decoy name, variant) of the first decoy found in latin-1 text."""
+        if not self.decoys:
+            return None
+        for _end, hit in self._auto.iter(text):
+            return hit
+        return None
+
+    def search_bytes(self, data: bytes) -> tuple[str, str] | None:
+        return self.search(data.decode("latin-1"))
+
+    def scanner(self) -> "StreamScanner":
+        return StreamScanner(self)
+
+class StreamScanner:
+    """Chunk-by-chunk scan with bounded memory. The last max_len-1 bytes of
+    each chunk are carried into the next one, so a token split across a
+    chunk boundary is still found."""
+
+    def __init__(self, matcher: Matcher):
+        self.matcher = matcher
+        self.carry = ""
+        self.scanned = 0
+
+    def feed(self, chunk: bytes) -> tuple[str, str] | None:
+        self.scanned += len(chunk)
+        text = self.carry + chunk.decode("latin-1")
+        keep = self.matcher.max_len - 1
+        self.carry = text[-keep:] if keep > 0 else ""
+        return self.matcher.search(text)
+
+class Inflater:
+    """Incremental gzip/zlib/raw-deflate decoder with a hard output budget,
+    so a compression bomb cannot blow up memory or CPU. feed() yields
+    decompressed pieces of at most `piece` bytes. Concatenated gzip members
+    are inflated in turn; anything else after the end of the stream is left
+    to the caller's scan of the raw bytes.
+
+    zlib checks the trailer (CRC/Adler) in the same call that returns the
+    last output, and a bad checksum discards that output. So the last
+    TRAILER input bytes are held back until more data arrives or the final
+    feed(), and everything before the trailer is yielded before it is
+    checked. A corrupt stream still raises zlib.error."""
+
+    TRAILER = 8  # gzip: CRC32 + ISIZE; zlib's Adler-32 is shorter
+
+    def __init__(self, limit: int, piece: int = 64 * 1024, raw: bool = False):
+        # wbits 47 auto-detects the gzip or zlib header; -15 is headerless deflate
+        self._z = zlib.decompressobj(-15 if raw else 47)
+        self.raw = raw
+        self.remaining = limit
+        self.piece = piece
+        self.truncated = False
+        self._pending = b""  # held-back trailer bytes / a lone byte that may start the next gzip member
+
+    def feed(self, chunk: bytes, final: bool = False):
+        data = self._pending + chunk
+        self._pending = b""
+        if not final:
+            data, self._pending = data[:-self.TRAILER], data[-self.TRAILER:]
+            yield from self._inflate(data, False)
+        else:
+            # the checksum gets a call of its own: for zlib, the bytes before
+            # the Adler-32 may still hold the end of the deflate stream
+            yield from self._inflate(data[:-4], False)
+            tail, self._pending = self._pending + data[-4:], b""
+            yield from self._inflate(tail, True)
+        if self.remaining <= 0 and (self._pending or not self._z.eof):
+            self.truncated = True
+
+    def _inflate(self, data: bytes, final: bool):
+        while data and self.remaining > 0:
+            if self._z.eof:
+                if self.raw:
+                    break
+                if len(data) < 2 and not final:
+                    self._pending = data + self._pending
+                    break
+                if data[:2] != b"\x1f\x8b":
+                    break  # trailing bytes, not another member
+                self._z = zlib.decompressobj(47)
+            out = self._z.decompress(data, min(self.piece, self.remaining))
+            self.remaining -= len(out)
+            data = self._z.unused_data if self._z.eof else self._z.unconsumed_tail
+            if out:
+                yield out
+        if data and self.remaining <= 0:
+            self._pending += data  # over budget: only marks the stream truncated
+
+def looks_compressed(head: bytes) -> bool:
+    """gzip magic or a valid zlib header."""
+    if head[:2] == b"\x1f\x8b":
+        return True
+    return len(head) >= 2 and head[0] & 0x0F == 8 and (head[0] << 8 | head[1]) % 31 == 0
@@ -0,0 +1,119 @@
+# detectors/oobsc_client.py
+# Shared OOBSC client for the detectors: one pooled httpx client for the life
+# of the app, inhibit signals delivered in the background with retry, and
+# signals raised while a delivery is already in flight queued behind it.
+# The first signal is what flips inhibit; the queued ones are sent after it
+# as repeats, so each detection still reaches OOBSC's event journal.
+# Each signal carries a trace id and its detection time, so OOBSC and the
+# guarded processes can time every hop of the inhibit path, plus the
+# detector, agent, reason and decoy for OOBSC's event journal.
+import os, time, uuid, asyncio, contextvars
+from collections import deque
+import httpx
+import metrics
+
+AUTH = os.getenv("AUTH_TOKEN", "")
+RETRIES = int(os.getenv("OOBSC_RETRIES", "5"))
+BACKOFF = float(os.getenv("OOBSC_BACKOFF_SEC", "0.1"))
+BACKOFF_MAX = float(os.getenv("OOBSC_BACKOFF_MAX_SEC", "2"))
+QUEUE_MAX = int(os.getenv("OOBSC_QUEUE_MAX", "256"))  # signals waiting behind a delivery
+AGENT_HEADER = "x-guardian-agent"
+
+# Agent behind the request being handled (from AGENT_HEADER); set per request.
+CURRENT_AGENT: contextvars.ContextVar[str | None] = contextvars.ContextVar("guardian_agent", default=None)
+
+SIGNALS = metrics.Counter("guardian_inhibit_signals_total", "Inhibit signals raised", ("source", "result"))
+PROPAGATION = metrics.Histogram("guardian_inhibit_propagation_seconds",
+                                "Inhibit path latency per hop (see trace fields)", ("hop",))
+
+class OOBSCClient:
+    def __init__(self, base_url: str, tag: str, timeout: float = 2.0):
+        self.base_url = base_url
+        self.tag = tag
+        self.timeout = timeout
+        self.client: httpx.AsyncClient | None = None
+        self._inflight: asyncio.Task | None = None
+        self._queued: deque[dict] = deque()
+        self.last_trace: str | None = None
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0  # coalesced with the queue full: not journaled
+        self.failed = 0
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            timeout=self.timeout,
+            headers={"x-guardian-auth": AUTH} if AUTH else None,
+            limits=httpx.Limits(max_connections=4, max_keepalive_connections=2),
+        )
+
+    async def close(self):
+        if self._inflight and not self._inflight.done():
+            # give a pending inhibit a chance to land before shutting down
+            await asyncio.wait([self._inflight], timeout=self.timeout)
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    def inhibit(self, reason: str, decoy: str | None = None) -> bool:
+        """Request inhibit without blocking the caller. Returns False when
+        a delivery is already in flight: the signal is then queued and sent
+        (for the journal) once that one is done, or dropped if the queue
+        holds QUEUE_MAX already."""
+        body = {"inhibit": True, "trace": uuid.uuid4().hex[:16], "origin_ts": time.time(), "source": self.tag,
+                "agent": CURRENT_AGENT.get(), "reason": reason, "decoy": decoy}
+        if self._inflight and not self._inflight.done():
+            self.coalesced += 1
+            SIGNALS.inc(self.tag, "coalesced")
+            if len(self._queued) < QUEUE_MAX:
+                self._queued.append(body)
+            else:
+                self.dropped += 1
+                SIGNALS.inc(self.tag, "dropped")
+            return False
+        self.last_trace = body["trace"]
+        self._inflight = asyncio.create_task(self._drain(body))
+        return True
+
+    async def _drain(self, body: dict):
+        acked = await self._deliver(body)
+        while self._queued:
+            acked = await self._deliver(self._queued.popleft(), repeat=acked) or acked
+
+    async def _deliver(self, body: dict, repeat: bool = False) -> bool:
+        """POST one signal with retry; True once OOBSC acknowledged it.
+        `repeat`: an earlier signal already got inhibit through."""
+        reason, trace, origin_ts = body["reason"], body["trace"], body["origin_ts"]
+        delay = BACKOFF
+        for attempt in range(1, RETRIES + 1):
+            try:
+                r = await self.client.post("/inhibit", json=body)
+                r.raise_for_status()
+                self.sent += 1
+                SIGNALS.inc(self.tag, "sent")
+                if repeat:
+                    # inhibit was already requested; this one is for the journal
+                    print(f"[{self.tag}] Inhibit repeated (trace {trace}). Reason: {reason}", flush=True)
+                    return True
+                PROPAGATION.observe(time.time() - origin_ts, "detector_acked")
+                print(f"[{self.tag}] Inhibit triggered (trace {trace}). Reason: {reason}", flush=True)
+                return True
+            except Exception as e:
+                print(f"[{self.tag}] Failed to contact OOBSC (attempt {attempt}/{RETRIES}): {e}", flush=True)
+            if attempt < RETRIES:
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, BACKOFF_MAX)
+        self.failed += 1
+        SIGNALS.inc(self.tag, "failed")
+        return False
+
+    def stats(self) -> dict:
+        return {
+            "sent": self.sent,
+            "coalesced": self.coalesced,
+            "queued": len(self._queued),
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "in_flight": bool(self._inflight and not self._inflight.done()),
+        }
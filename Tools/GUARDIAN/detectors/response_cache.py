@@ -0,0 +1,339 @@
+# detectors/response_cache.py
+# Shared cache for allowed GETs through the egress gateway. Freshness
+# follows Cache-Control / Expires (with the usual Last-Modified heuristic);
+# stale entries with an ETag or Last-Modified are revalidated with a
+# conditional request. Entries are evicted LRU against a byte budget; small
+# bodies live in memory, larger ones spill to files under the cache dir.
+# Concurrent misses for one request wait for a single upstream fetch.
+import os, time, asyncio, tempfile, email.utils
+from collections import OrderedDict
+import httpx
+
+CACHE_MB = float(os.getenv("RESPONSE_CACHE_MB", "64"))
+CACHE_DISK_MB = float(os.getenv("RESPONSE_CACHE_DISK_MB", "512"))
+CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", "") or os.path.join(tempfile.gettempdir(), "egress-cache")
+MEM_ENTRY = int(float(os.getenv("RESPONSE_CACHE_MEM_ENTRY_KB", "256")) * 1024)
+MAX_ENTRY = int(float(os.getenv("RESPONSE_CACHE_MAX_ENTRY_MB", "32")) * 1024 * 1024)
+HEURISTIC_MAX = float(os.getenv("RESPONSE_CACHE_HEURISTIC_MAX_SEC", "300"))
+FLIGHT_WAIT = float(os.getenv("RESPONSE_CACHE_FLIGHT_WAIT_SEC", "10"))
+HEAD_BYTES = 64 * 1024  # kept from every body for summaries of uncached ones
+
+# A shared cache must not serve one caller's personalised response to another.
+PRIVATE_REQUEST_HEADERS = {"authorization", "cookie", "range", "if-none-match",
+                           "if-modified-since", "if-match", "if-unmodified-since", "if-range"}
+# Only steer caching; every other header the agent sends is part of the key,
+# so an entry is replayed only for an identical request (which also
+# satisfies any Vary the upstream sent).
+KEY_IGNORED_HEADERS = {"cache-control", "pragma"}
+# Dropped when storing; the rest is replayed on a hit.
+UNSTORED_HEADERS = {"connection", "keep-alive", "proxy-authenticate", "proxy-authorization",
+                    "te", "trailer", "transfer-encoding", "upgrade", "set-cookie", "age"}
+
+def parse_cache_control(value: str) -> dict[str, str | None]:
+    out = {}
+    for part in value.split(","):
+        k, _, v = part.strip().partition("=")
+        if k:
+            out[k.lower()] = v.strip().strip('"') if v else None
+    return out
+
+def _http_date(value: str | None) -> float | None:
+    if not value:
+        return None
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError, IndexError, OverflowError):
+        return None
+
+def cache_key(url: str, headers: dict | None) -> str:
+    h = sorted((k.lower(), v) for k, v in (headers or {}).items() if k.lower() not in KEY_IGNORED_HEADERS)
+    return "\n".join([url] + [f"{k}: {v}" for k, v in h])  # header values hold no newlines
+
+def request_cacheable(method: str, headers: dict | None, has_body: bool) -> bool:
+    if method.upper() != "GET" or has_body:
+        return False
+    h = {k.lower(): v for k, v in (headers or {}).items()}
+    if PRIVATE_REQUEST_HEADERS & h.keys():
+        return False
+    cc = parse_cache_control(h.get("cache-control", ""))
+    return "no-store" not in cc and "no-cache" not in cc and h.get("pragma", "") != "no-cache"
+
+def lifetime(status: int, headers, now: float) -> float | None:
+    """Freshness lifetime in seconds; None = not worth storing (forbidden,
+    too large, or never fresh and without validators)."""
+    life = _lifetime(status, headers, now)
+    if life == 0.0 and "etag" not in headers and "last-modified" not in headers:
+        return None
+    try:
+        if int(headers.get("content-length", 0)) > MAX_ENTRY:
+            return None
+    except ValueError:
+        return None
+    return life
+
+def _lifetime(status: int, headers, now: float) -> float | None:
+    if status != 200:
+        return None
+    cc = parse_cache_control(headers.get("cache-control", ""))
+    if "no-store" in cc or "private" in cc or "set-cookie" in headers:
+        return None
+    if "*" in (v.strip() for v in headers.get("vary", "").split(",")):
+        return None  # varies on something other than the request
+    if "no-cache" in cc:
+        return 0.0
+    for directive in ("s-maxage", "max-age"):
+        if directive in cc:
+            try:
+                return max(0.0, float(cc[directive]))
+            except (TypeError, ValueError):
+                return 0.0
+    date = _http_date(headers.get("date")) or now
+    if "expires" in headers:
+        expires = _http_date(headers["expires"])
+        return max(0.0, expires - date) if expires else 0.0
+    modified = _http_date(headers.get("last-modified"))
+    if modified and modified < date:
+        return min((date - modified) / 10, HEURISTIC_MAX)  # RFC 9111 4.2.2
+    return 0.0
+
+class Entry:
+    __slots__ = ("key", "url", "status", "headers", "body", "path", "size", "stored", "fresh_until")
+
+    def __init__(self, key: str, url: str, status: int, headers: list[tuple[str, str]], life: float):
+        self.key = key
+        self.url = url              # final URL after redirects, re-checked on every hit
+        self.status = status
+        self.headers = headers
+        self.body: bytes | None = None
+        self.path: str | None = None
+        self.size = 0
+        self.stored = time.time()
+        self.fresh_until = self.stored + life
+
+    def fresh(self, now: float | None = None) -> bool:
+        return (time.time() if now is None else now) < self.fresh_until
+
+    def validators(self) -> dict[str, str]:
+        h, out = dict(self.headers), {}
+        if "etag" in h:
+            out["if-none-match"] = h["etag"]
+        if "last-modified" in h:
+            out["if-modified-since"] = h["last-modified"]
+        return out
+
+    def served_headers(self) -> list[tuple[str, str]]:
+        return self.headers + [("age", str(int(time.time() - self.stored)))]
+
+    def response(self, chunk: int, body: "CachedStream | None" = None) -> httpx.Response:
+        """The stored response, replayed as raw (still encoded) bytes. Call
+        it right after lookup(), or pass a body opened then: an open spill
+        file survives eviction."""
+        return httpx.Response(self.status, headers=self.served_headers(),
+                              stream=body or CachedStream(self, chunk))
+
+class CachedStream(httpx.AsyncByteStream):
+    def __init__(self, entry: Entry, chunk: int):
+        self.body = entry.body
+        self.file = open(entry.path, "rb") if entry.path else None
+        self.chunk = chunk
+
+    async def __aiter__(self):
+        if self.file is None:
+            for off in range(0, len(self.body), self.chunk):
+                yield self.body[off:off + self.chunk]
+            return
+        while True:
+            chunk = await asyncio.to_thread(self.file.read, self.chunk)
+            if not chunk:
+                return
+            yield chunk
+
+    async def aclose(self):
+        if self.file is not None:
+            self.file.close()
+
+class TeeStream(httpx.AsyncByteStream):
+    """Relays an upstream body and copies it into a CacheWriter; the entry
+    is stored only if the body arrives complete."""
+
+    def __init__(self, resp: httpx.Response, writer: "CacheWriter", chunk: int):
+        self.resp = resp
+        self.writer = writer
+        self.chunk = chunk
+
+    async def __aiter__(self):
+        async for chunk in self.resp.aiter_raw(self.chunk):
+            self.writer.write(chunk)
+            yield chunk
+        self.writer.commit()
+
+    async def aclose(self):
+        self.writer.abort()  # no-op once committed
+        await self.resp.aclose()
+
+class CacheWriter:
+    """Collects one upstream body while it is relayed; commit() stores it.
+    Bodies past MAX_ENTRY are abandoned (the relay goes on uncached)."""
+
+    def __init__(self, cache: "ResponseCache", entry: Entry):
+        self.cache = cache
+        self.entry = entry
+        self.buf = bytearray()
+        self.head = bytearray()
+        self.file = None
+        self.aborted = False
+        self.done = False
+
+    @property
+    def committed(self) -> bool:
+        return self.done and not self.aborted
+
+    def write(self, chunk: bytes):
+        if len(self.head) < HEAD_BYTES:
+            self.head += chunk[:HEAD_BYTES - len(self.head)]
+        if self.aborted or self.done:
+            return
+        self.entry.size += len(chunk)
+        if self.entry.size > MAX_ENTRY:
+            self.abort()
+            return
+        if self.file is None and self.entry.size > MEM_ENTRY:
+            # spill: page-cache writes, cheap enough to do inline
+            os.makedirs(self.cache.dir, exist_ok=True)
+            fd, self.entry.path = tempfile.mkstemp(dir=self.cache.dir, suffix=".body")
+            self.file = os.fdopen(fd, "wb")
+            self.file.write(self.buf)
+            self.buf = bytearray()
+        if self.file is not None:
+            self.file.write(chunk)
+        else:
+            self.buf += chunk
+
+    def commit(self) -> Entry | None:
+        if self.aborted or self.done:
+            return None
+        self.done = True
+        if self.file is not None:
+            self.file.close()
+        else:
+            self.entry.body = bytes(self.buf)
+        self.cache.store(self.entry)
+        self.cache.land(self.entry.key)
+        return self.entry
+
+    def abort(self):
+        if self.done:
+            return
+        self.aborted = self.done = True
+        if self.file is not None:
+            self.file.close()
+            _unlink(self.entry.path)
+        self.buf = bytearray()
+        self.cache.land(self.entry.key)
+
+def _unlink(path: str | None):
+    if path:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+class ResponseCache:
+    def __init__(self, mem_bytes: float = CACHE_MB * 1024 * 1024,
+                 disk_bytes: float = CACHE_DISK_MB * 1024 * 1024, cache_dir: str = CACHE_DIR):
+        self.mem_budget = mem_bytes
+        self.disk_budget = disk_bytes
+        self.dir = cache_dir
+        self.entries: OrderedDict[str, Entry] = OrderedDict()
+        self.mem_bytes = 0
+        self.disk_bytes = 0
+        self.flights: dict[str, asyncio.Event] = {}
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0   # stale entry confirmed by a 304
+        self.collapsed = 0     # misses that waited on another request's fetch
+        self.stores = 0
+        self.evictions = 0
+        self.bytes_served = 0  # body bytes answered from the cache
+        self.ms = {"hit": [0, 0.0], "miss": [0, 0.0], "revalidated": [0, 0.0]}  # count, total ms
+
+    def lookup(self, key: str) -> Entry | None:
+        e = self.entries.get(key)
+        if e is not None:
+            self.entries.move_to_end(key)
+        return e
+
+    def writer(self, key: str, url: str, status: int, headers, life: float) -> CacheWriter:
+        kept = [(k, v) for k, v in headers.items() if k.lower() not in UNSTORED_HEADERS]
+        return CacheWriter(self, Entry(key, url, status, kept, life))
+
+    def store(self, e: Entry):
+        old = self.entries.pop(e.key, None)
+        if old is not None:
+            self._forget(old)
+        self.entries[e.key] = e
+        if e.path:
+            self.disk_bytes += e.size
+        else:
+            self.mem_bytes += e.size
+        self.stores += 1
+        while self.entries and (self.mem_bytes > self.mem_budget or self.disk_bytes > self.disk_budget):
+            _key, victim = self.entries.popitem(last=False)
+            self._forget(victim)
+            self.evictions += 1
+
+    def _forget(self, e: Entry):
+        if e.path:
+            self.disk_bytes -= e.size
+            _unlink(e.path)  # readers holding the file open keep their copy
+        else:
+            self.mem_bytes -= e.size
+
+    def refresh(self, e: Entry, headers):
+        """A 304 confirmed e: take the new headers and freshness."""
+        update = {k.lower(): v for k, v in headers.items() if k.lower() not in UNSTORED_HEADERS
+                  and k.lower() not in ("content-length", "content-encoding")}
+        e.headers = [(k, update.pop(k.lower(), v)) for k, v in e.headers] + list(update.items())
+        e.stored = time.time()
+        e.fresh_until = e.stored + (lifetime(e.status, httpx.Headers(e.headers), e.stored) or 0.0)
+        self.revalidated += 1
+
+    async def flight(self, key: str) -> bool:
+        """True: caller leads the fetch for key and must land() it. False:
+        another fetch was in flight and has landed (or timed out)."""
+        ev = self.flights.get(key)
+        if ev is None:
+            self.flights[key] = asyncio.Event()
+            return True
+        self.collapsed += 1
+        try:
+            await asyncio.wait_for(ev.wait(), FLIGHT_WAIT)
+        except asyncio.TimeoutError:
+            pass
+        return False
+
+    def land(self, key: str):
+        ev = self.flights.pop(key, None)
+        if ev is not None:
+            ev.set()
+
+    def observe(self, outcome: str, started: float):
+        m = self.ms[outcome]
+        m[0] += 1
+        m[1] += (time.perf_counter() - started) * 1000
+
+    def clear(self):
+        for e in self.entries.values():
+            self._forget(e)
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries), "mem_bytes": self.mem_bytes, "disk_bytes": self.disk_bytes,
+            "hits": self.hits, "misses": self.misses, "revalidated": self.revalidated,
+            "collapsed": self.collapsed, "stores": self.stores, "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+            "bytes_served": self.bytes_served,
+            "mean_ms": {k: round(t / n, 3) if n else None for k, (n, t) in self.ms.items()},
+        }
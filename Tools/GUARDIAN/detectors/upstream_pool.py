@@ -0,0 +1,203 @@
+# detectors/upstream_pool.py
+# Long-lived upstream connection pools for the egress gateway: one httpx
+# client per origin (scheme, host, port), so allowed requests reuse
+# keep-alive connections instead of paying DNS/TCP/TLS setup every time.
+# Each origin also gets a concurrency cap with a bounded wait queue, so one
+# slow upstream holds only its own slots and cannot starve the others.
+import os, asyncio, time
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from contextlib import asynccontextmanager
+from urllib.parse import urlsplit
+import httpx, httpcore
+
+try:
+    import h2  # noqa: F401  (httpx needs it for HTTP/2)
+except ImportError:
+    h2 = None
+
+POOL_MAX = int(os.getenv("UPSTREAM_POOL_MAX", "20"))
+POOL_KEEPALIVE = int(os.getenv("UPSTREAM_POOL_KEEPALIVE", "10"))
+KEEPALIVE_SEC = float(os.getenv("UPSTREAM_KEEPALIVE_SEC", "30"))
+HTTP2 = os.getenv("UPSTREAM_HTTP2", "0") in ("1", "true", "on")
+HOST_CONCURRENCY = int(os.getenv("UPSTREAM_HOST_CONCURRENCY", "16"))
+HOST_QUEUE = int(os.getenv("UPSTREAM_HOST_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("UPSTREAM_QUEUE_TIMEOUT_SEC", "5"))
+# Origins are per (scheme, host, port), and a suffix rule allows any number
+# of hosts: idle origins are closed, and their total is capped.
+ORIGIN_MAX = int(os.getenv("UPSTREAM_ORIGIN_MAX", "256"))
+ORIGIN_IDLE_SEC = float(os.getenv("UPSTREAM_ORIGIN_IDLE_SEC", "120"))
+
+class PoolBusy(Exception):
+    """The origin's queue is full, or no slot freed up in time."""
+
+class _CoreStream(httpx.AsyncByteStream):
+    def __init__(self, stream):
+        self.stream = stream
+
+    async def __aiter__(self):
+        with _mapped_errors():
+            async for chunk in self.stream:
+                yield chunk
+
+    async def aclose(self):
+        with _mapped_errors():
+            await self.stream.aclose()
+
+class _mapped_errors:
+    """httpcore exceptions -> the httpx ones of the same name, as callers
+    of httpx expect."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, exc, tb):
+        if isinstance(exc, httpcore.TimeoutException | httpcore.NetworkError | httpcore.ProtocolError
+                      | httpcore.UnsupportedProtocol | httpcore.PoolTimeout):
+            raise getattr(httpx, typ.__name__, httpx.TransportError)(str(exc)) from exc
+        return False
+
+class PoolTransport(httpx.AsyncBaseTransport):
+    """httpx transport over an httpcore pool we build ourselves, so the pool
+    can be given a network backend (e.g. PinnedBackend)."""
+
+    def __init__(self, http2: bool, limits: httpx.Limits, network_backend=None):
+        self.pool = httpcore.AsyncConnectionPool(
+            ssl_context=httpx.create_ssl_context(),
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=limits.keepalive_expiry,
+            http1=True,
+            http2=http2,
+            network_backend=network_backend,
+        )
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        req = httpcore.Request(
+            method=request.method,
+            url=httpcore.URL(scheme=request.url.raw_scheme, host=request.url.raw_host,
+                             port=request.url.port, target=request.url.raw_path),
+            headers=request.headers.raw,
+            content=request.stream,
+            extensions=request.extensions,
+        )
+        with _mapped_errors():
+            resp = await self.pool.handle_async_request(req)
+        return httpx.Response(status_code=resp.status, headers=resp.headers,
+                              stream=_CoreStream(resp.stream), extensions=resp.extensions)
+
+    async def aclose(self):
+        await self.pool.aclose()
+
+class _Origin:
+    def __init__(self, client: httpx.AsyncClient):
+        self.client = client
+        self.slots = asyncio.Semaphore(HOST_CONCURRENCY)
+        self.waiting = 0
+        self.active = 0
+        self.requests = 0
+        self.rejected = 0
+        self.claims = 0  # callers between _origin() and holding/queueing for a slot
+        self.last_used = time.monotonic()
+
+    def idle(self) -> bool:
+        return self.active == 0 and self.waiting == 0 and self.claims == 0
+
+class UpstreamPools:
+    """Origins are opened lazily on first use and closed together."""
+
+    def __init__(self, timeout: float, backend=None):
+        self.timeout = timeout
+        self.backend = backend  # httpcore network backend (e.g. PinnedBackend)
+        self.origins: dict[tuple, _Origin] = {}
+        self.http2 = HTTP2 and h2 is not None
+        if HTTP2 and h2 is None:
+            print("[egress] UPSTREAM_HTTP2 set but h2 is not installed; using HTTP/1.1", flush=True)
+
+    async def close(self):
+        origins, self.origins = self.origins, {}
+        await asyncio.gather(*(o.client.aclose() for o in origins.values()))
+
+    def _client(self) -> httpx.AsyncClient:
+        transport = PoolTransport(
+            self.http2,
+            httpx.Limits(max_connections=POOL_MAX,
+                         max_keepalive_connections=POOL_KEEPALIVE,
+                         keepalive_expiry=KEEPALIVE_SEC),
+            network_backend=self.backend,
+        )
+        # redirects are followed by the caller, one validated hop at a time.
+        # All agents share the client, so it must not keep cookies: one
+        # agent's Set-Cookie would ride along on the next agent's requests.
+        return httpx.AsyncClient(timeout=self.timeout, follow_redirects=False, transport=transport,
+                                 cookies=CookieJar(DefaultCookiePolicy(allowed_domains=[])))
+
+    async def _origin(self, url: str) -> _Origin:
+        """The origin for url, claimed so _make_room cannot close it; the
+        caller drops the claim once it holds or queues for a slot."""
+        u = urlsplit(url)
+        key = (u.scheme, (u.hostname or "").lower(), u.port)
+        o = self.origins.get(key)
+        if o is None:
+            await self._make_room()
+            o = self.origins.get(key)  # opened by another request while we waited
+            if o is None:
+                o = self.origins[key] = _Origin(self._client())
+        o.claims += 1
+        return o
+
+    async def _make_room(self):
+        """Close origins idle for ORIGIN_IDLE_SEC; at ORIGIN_MAX, also the
+        least recently used idle one. All busy at the cap -> PoolBusy."""
+        now = time.monotonic()
+        stale = [k for k, o in self.origins.items() if o.idle() and now - o.last_used > ORIGIN_IDLE_SEC]
+        if len(self.origins) - len(stale) >= ORIGIN_MAX:
+            idle = sorted((o.last_used, k) for k, o in self.origins.items() if o.idle() and k not in stale)
+            stale += [k for _t, k in idle[:len(self.origins) - len(stale) - ORIGIN_MAX + 1]]
+        if len(self.origins) - len(stale) >= ORIGIN_MAX:
+            raise PoolBusy(f"{ORIGIN_MAX} upstream origins busy")
+        closing = [self.origins.pop(k).client for k in stale]
+        await asyncio.gather(*(c.aclose() for c in closing))
+
+    @asynccontextmanager
+    async def slot(self, url: str):
+        """Hold one of the origin's concurrency slots; yields its client.
+        Raises PoolBusy instead of queueing without bound."""
+        o = await self._origin(url)
+        try:
+            if o.slots.locked():
+                if o.waiting >= HOST_QUEUE:
+                    o.rejected += 1
+                    raise PoolBusy(f"{HOST_QUEUE} requests already queued")
+                o.waiting += 1
+                try:
+                    await asyncio.wait_for(o.slots.acquire(), QUEUE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    o.rejected += 1
+                    raise PoolBusy(f"no upstream slot within {QUEUE_TIMEOUT}s")
+                finally:
+                    o.waiting -= 1
+            else:
+                await o.slots.acquire()
+            o.active += 1
+        finally:
+            o.claims -= 1
+        o.requests += 1
+        o.last_used = time.monotonic()
+        try:
+            yield o.client
+        finally:
+            o.active -= 1
+            o.last_used = time.monotonic()
+            o.slots.release()
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "origins": {
+                f"{s}://{h}" + (f":{p}" if p else ""): {
+                    "active": o.active, "waiting": o.waiting,
+                    "requests": o.requests, "rejected": o.rejected,
+                }
+                for (s, h, p), o in self.origins.items()
+            },
+        }
@@ -1,9 +1,20 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-import time, threading, os
+import os, time, asyncio, json
+from state import LocalState
+from shared_state import SharedStateClient
+import metrics
 
-app = FastAPI()
 AUTH = os.getenv("AUTH_TOKEN", "")
+STATUS_PAGE = int(os.getenv("STATUS_PAGE_SIZE", "100"))
+HB_BATCH_MAX = int(os.getenv("HEARTBEAT_BATCH_MAX", "10000"))
+EVENTS_PAGE = int(os.getenv("EVENTS_PAGE_SIZE", "100"))
+WATCH_KEEPALIVE = float(os.getenv("WATCH_KEEPALIVE_SEC", "5"))
+WATCH_POLL_MAX = float(os.getenv("WATCH_POLL_MAX_SEC", "30"))
+# Set by serve.py when running several workers against one state server.
+STATE_SOCKET = os.getenv("STATE_SOCKET", "")
 
 class Heartbeat(BaseModel):
     source: str | None = None
@@ -11,18 +22,49 @@ class Heartbeat(BaseModel):
 
 class InhibitRequest(BaseModel):
     inhibit: bool
+    trace: str | None = None        # set by the detector that fired
+    origin_ts: float | None = None  # detection time (unix), for hop timing
+    # journaled with the request (see /events)
+    source: str | None = None       # detector that fired
+    agent: str | None = None        # agent whose traffic tripped it, if known
+    reason: str | None = None
+    decoy: str | None = None
 
-STATE = {
-    "inhibit": False,
-    "heartbeats": {},  # source/agent -> unix time
-}
+INHIBIT_REQUESTS = metrics.Counter("guardian_inhibit_requests_total", "POST /inhibit calls", ("value",))
+PROPAGATION = metrics.Histogram("guardian_inhibit_propagation_seconds",
+                                "Inhibit path latency per hop (see trace fields)", ("hop",))
+WATCHERS = metrics.Gauge("guardian_watch_subscribers", "Open /watch streams")
+BEATS = metrics.Gauge("guardian_heartbeats_total", "Heartbeats accepted", kind="counter")
+REPLAYED = metrics.Gauge("guardian_heartbeats_replayed_total", "Heartbeat datagrams dropped as replays",
+                         kind="counter")
+AGENTS = metrics.Gauge("guardian_agents", "Known agents by state", labels=("state",))
+INHIBITED = metrics.Gauge("guardian_inhibit", "1 while inhibit is set",
+                          lambda: float(STATE.inhibit_event()["inhibit"]))
+
+# Set (and replaced) on every inhibit transition to wake /watch subscribers.
+CHANGED = asyncio.Event()
+
+def notify_changed(event: dict):
+    global CHANGED
+    ev, CHANGED = CHANGED, asyncio.Event()
+    ev.set()
+
+STATE = SharedStateClient(STATE_SOCKET, notify_changed) if STATE_SOCKET else LocalState(notify_changed)
 
 def clear_inhibit_after(seconds=10):
-    def _clr():
-        time.sleep(seconds)
-        STATE["inhibit"] = False
+    async def _clr():
+        await asyncio.sleep(seconds)
+        await STATE.set_inhibit(False)
         print(f"[oobsc] Auto-cleared inhibit after {seconds}s", flush=True)
-    threading.Thread(target=_clr, daemon=True).start()
+    asyncio.create_task(_clr())
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await STATE.start()
+    yield
+    await STATE.stop()
+
+app = FastAPI(lifespan=lifespan)
 
 def check_auth(request: Request):
     token = request.headers.get("x-guardian-auth", "")
@@ -30,25 +72,126 @@ def check_auth(request: Request):
         raise HTTPException(status_code=401, detail="unauthorized")
 
 @app.get("/health")
-def health():
-    return {"ok": True}
+async def health():
+    try:
+        stats = await STATE.stats()
+    except (ConnectionError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=f"state unavailable: {e}")
+    return {"ok": True, "worker": os.getpid(), **stats}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format. With several workers each reports its own
+    request metrics; heartbeat totals come from the shared state."""
+    try:
+        stats = await STATE.stats()
+        BEATS.set(stats["beats"])
+        REPLAYED.set(stats["replayed"])
+        counts = await STATE.status(limit=0)
+        AGENTS.set({("alive",): counts.get("alive", 0), ("dead",): counts.get("dead", 0)})
+    except (ConnectionError, asyncio.TimeoutError):
+        pass
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
 
 @app.post("/heartbeat")
 def heartbeat(hb: Heartbeat):
     who = hb.source or hb.agent or "guarded_ai"
-    STATE["heartbeats"][who] = time.time()
+    STATE.beat(who)
     return {"ok": True, "agent": who}
 
+@app.post("/heartbeat/batch")
+async def heartbeat_batch(request: Request):
+    """Many agents' beats in one request: a JSON list of agent ids, or
+    {"agents": [...]}. Parsed directly, without a pydantic model per beat."""
+    try:
+        agents = json.loads(await request.body())
+        if isinstance(agents, dict):
+            agents = agents["agents"]
+        if not isinstance(agents, list) or not all(isinstance(a, str) for a in agents):
+            raise ValueError
+    except (ValueError, KeyError):
+        raise HTTPException(status_code=422, detail="expected a list of agent ids")
+    if len(agents) > HB_BATCH_MAX:
+        raise HTTPException(status_code=413, detail=f"batch larger than {HB_BATCH_MAX}")
+    STATE.beat_many(agents)
+    return {"ok": True, "count": len(agents)}
+
 @app.get("/status")
-def status():
-    now = time.time()
-    ages = {src: now - ts for src, ts in STATE["heartbeats"].items()}
-    return {"inhibit": STATE["inhibit"], "heartbeat_ages_sec": ages}
+async def status(agent: str | None = None, state: str = "all", prefix: str = "",
+                 offset: int = 0, limit: int = STATUS_PAGE):
+    """Inhibit state plus one page of heartbeat ages. `state` filters to
+    alive/dead agents; `next` is the offset of the following page."""
+    try:
+        return await STATE.status(agent=agent, state=state, prefix=prefix,
+                                  offset=offset, limit=max(0, min(limit, 1000)))
+    except (ConnectionError, asyncio.TimeoutError):
+        # heartbeat detail is unavailable, but inhibit still fails closed
+        return {**STATE.inhibit_event(), "heartbeat_ages_sec": {}, "degraded": True}
 
 @app.post("/inhibit")
-def set_inhibit(req: InhibitRequest, request: Request):
+async def set_inhibit(req: InhibitRequest, request: Request):
     check_auth(request)
-    STATE["inhibit"] = req.inhibit
+    INHIBIT_REQUESTS.inc(str(req.inhibit).lower())
+    if req.origin_ts:
+        PROPAGATION.observe(max(0.0, time.time() - req.origin_ts), "detector_to_oobsc")
+    try:
+        result = await STATE.set_inhibit(req.inhibit, req.trace, req.origin_ts,
+                                         {"source": req.source, "agent": req.agent,
+                                          "reason": req.reason, "decoy": req.decoy})
+    except (ConnectionError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=f"state unavailable: {e}")
     # if req.inhibit:
     #     clear_inhibit_after(10)  # remove for stability
-    return {"inhibit": STATE["inhibit"]}
+    if req.trace:
+        print(f"[oobsc] Inhibit={req.inhibit} (trace {req.trace})", flush=True)
+    return {"inhibit": result["inhibit"]}
+
+@app.get("/events")
+async def events(after: int | None = None, start: float | None = None, end: float | None = None,
+                 agent: str | None = None, detector: str | None = None, limit: int = EVENTS_PAGE):
+    """Journaled inhibit/clear calls and heartbeat losses, oldest first.
+    Poll with after=<previous next> for new events; start/end (unix time,
+    end exclusive) select a time range; without either, the newest `limit`."""
+    try:
+        return await STATE.events(after=after, start=start, end=end, agent=agent, detector=detector,
+                                  limit=max(1, min(limit, 1000)))
+    except (ConnectionError, asyncio.TimeoutError) as e:
+        raise HTTPException(status_code=503, detail=f"state unavailable: {e}")
+
+@app.get("/watch")
+async def watch():
+    """Server-sent events: current inhibit state on connect, then one event
+    per transition. Comment lines are sent as keepalive when idle."""
+    async def events():
+        version = None
+        WATCHERS.set(WATCHERS.value + 1)
+        try:
+            while True:
+                ev = CHANGED  # grab before checking, so no transition is missed
+                event = STATE.inhibit_event()
+                if event["version"] != version:
+                    if version is not None and "ts" in event:
+                        PROPAGATION.observe(max(0.0, time.time() - event["ts"]), "oobsc_to_watcher")
+                    version = event["version"]
+                    yield f"data: {json.dumps(event)}\n\n"
+                    continue
+                try:
+                    await asyncio.wait_for(ev.wait(), WATCH_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+        finally:
+            WATCHERS.set(WATCHERS.value - 1)
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
+
+@app.get("/watch/poll")
+async def watch_poll(version: int = -1, timeout: float = 25.0):
+    """Versioned long-poll: returns as soon as the inhibit version differs
+    from `version`, or after `timeout` seconds with the current state."""
+    ev = CHANGED
+    if STATE.inhibit_event()["version"] == version:
+        try:
+            await asyncio.wait_for(ev.wait(), min(timeout, WATCH_POLL_MAX))
+        except asyncio.TimeoutError:
+            pass
+    return STATE.inhibit_event()
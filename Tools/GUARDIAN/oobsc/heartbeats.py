@@ -0,0 +1,267 @@
+# oobsc/heartbeats.py
+# Heartbeat store sized for large fleets: agent ids are interned to slots,
+# last-seen times live in flat arrays, and staleness is tracked with a
+# timing wheel so neither a beat nor an expiry sweep touches every agent.
+from array import array
+from collections import deque
+from bisect import bisect_left, insort
+import threading, time, struct
+
+# Compact heartbeat record (UDP transport): u8 id length, u32 sender epoch,
+# u32 sequence, id. A datagram carries one or more records back to back.
+# The epoch is fixed for the life of a sender process and grows across
+# restarts (e.g. its start time in seconds), so a restarted sender counting
+# from 0 again is told apart from a replay of old datagrams.
+RECORD = struct.Struct("!BII")
+SEQ_WINDOW = 64  # a seq this close behind the last one is a replay/reorder
+EPOCH_MASK = 0x7FFFFFFF  # stamps are kept in a signed 64-bit array
+
+def stamp(epoch: int, seq: int) -> int:
+    """(epoch, seq) as one ordered int: epoch in the high 32 bits."""
+    return (epoch & EPOCH_MASK) << 32 | (seq & 0xFFFFFFFF)
+
+def stale(last: int, new: int) -> bool:
+    """True if stamp `new` replays or reorders behind stamp `last`."""
+    if new >> 32 != last >> 32:
+        return new >> 32 < last >> 32  # newer epoch: the sender restarted
+    return (last - new) % 2**32 < SEQ_WINDOW
+
+def pack_beats(beats: list[tuple[str, int]], epoch: int = 0) -> bytes:
+    out = bytearray()
+    for agent, seq in beats:
+        raw = agent.encode("utf-8")[:255]
+        out += RECORD.pack(len(raw), epoch & EPOCH_MASK, seq & 0xFFFFFFFF) + raw
+    return bytes(out)
+
+def parse_beats(data: bytes) -> list[tuple[str, int]]:
+    """-> [(agent, stamp)]"""
+    beats, off = [], 0
+    while off + RECORD.size <= len(data):
+        n, epoch, seq = RECORD.unpack_from(data, off)
+        off += RECORD.size
+        if off + n > len(data):
+            break  # truncated record
+        beats.append((data[off:off + n].decode("utf-8", "replace"), stamp(epoch, seq)))
+        off += n
+    return beats
+
+def _remove(slots: list[int], i: int):
+    k = bisect_left(slots, i)
+    if k < len(slots) and slots[k] == i:
+        del slots[k]
+
+def _move(moved: list[int], src: list[int], dst: list[int]):
+    """Move slots between two sorted lists; a mass expiry is one merge
+    instead of a memmove per slot."""
+    if len(moved) <= 32:
+        for i in moved:
+            _remove(src, i)
+            insort(dst, i)
+        return
+    gone = set(moved)
+    src[:] = [i for i in src if i not in gone]
+    dst[:] = sorted(dst + sorted(moved))  # two sorted runs: a linear merge
+
+class HeartbeatStore:
+    def __init__(self, timeout: float, tick: float = 0.5, evict_after: float | None = None):
+        self.timeout = timeout
+        self.tick = tick
+        self.evict_after = evict_after if evict_after is not None else timeout * 10
+        self.lock = threading.Lock()
+        self.index: dict[str, int] = {}    # agent -> slot
+        self.names: list[str | None] = []  # slot -> agent (None = free)
+        self.last = array("d")             # slot -> last beat (unix time)
+        self.due = array("q")              # slot -> wheel tick it is scheduled on
+        self.dead = bytearray()            # slot -> 1 once timed out
+        self.seq = array("q")              # slot -> last datagram stamp (-1 = none)
+        self.beats = 0
+        self.replayed = 0
+        self.dirty: set[int] = set()       # slots beaten since the last drain_dirty()
+        self.free: list[int] = []
+        self.dead_slots: list[int] = []    # sorted, so dead/alive pages start with a bisect
+        self.alive_slots: list[int] = []
+        self._by_name: list[str] | None = []  # sorted names for prefix pages; None = stale
+        self.graveyard = deque()           # (dead since, slot), oldest first
+        self.nslots = int(timeout / tick) + 2
+        self.wheel = [[] for _ in range(self.nslots)]
+        self.cursor = int(time.time() / tick)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _slot(self, agent: str) -> int:
+        i = self.index.get(agent)
+        if i is not None:
+            return i
+        if self.free:
+            i = self.free.pop()
+            self.names[i] = agent
+        else:
+            i = len(self.names)
+            self.names.append(agent)
+            self.last.append(0.0)
+            self.due.append(-1)
+            self.dead.append(0)
+            self.seq.append(-1)
+        insort(self.alive_slots, i)
+        self.index[agent] = i
+        self._by_name = None
+        return i
+
+    def beat(self, agent: str, now: float | None = None, seq: int | None = None):
+        now = time.time() if now is None else now
+        with self.lock:
+            self._beat(agent, now, seq)
+
+    def beat_many(self, beats, now: float | None = None):
+        """Record many beats under one lock. Items are agent ids or
+        (agent, stamp) pairs as returned by parse_beats()."""
+        now = time.time() if now is None else now
+        with self.lock:
+            for b in beats:
+                if isinstance(b, str):
+                    self._beat(b, now, None)
+                else:
+                    self._beat(b[0], now, b[1])
+
+    def _beat(self, agent: str, now: float, seq: int | None):
+        i = self._slot(agent)
+        if seq is not None:
+            last = self.seq[i]
+            if last >= 0 and stale(last, seq):
+                self.replayed += 1
+                return
+            self.seq[i] = seq
+        self.beats += 1
+        self.last[i] = now
+        self.dirty.add(i)
+        if self.dead[i]:
+            self.dead[i] = 0
+            _remove(self.dead_slots, i)
+            insort(self.alive_slots, i)
+        # Re-arm only when the deadline moves to a new tick; older wheel
+        # entries for this slot are skipped when their tick comes up.
+        due = int((now + self.timeout) / self.tick) + 1
+        if due != self.due[i]:
+            self.due[i] = due
+            self.wheel[due % self.nslots].append(i)
+
+    def restore(self, agent: str, last: float, seq: int = -1):
+        """Load a persisted beat; never moves an agent's time backwards."""
+        with self.lock:
+            i = self._slot(agent)
+            if last <= self.last[i]:
+                return
+            self._beat(agent, last, None)
+            self.seq[i] = seq
+            self.beats -= 1
+            self.dirty.discard(i)
+
+    def drain_dirty(self) -> list[tuple[str, float, int]]:
+        with self.lock:
+            out = [(self.names[i], self.last[i], self.seq[i])
+                   for i in self.dirty if self.names[i] is not None]
+            self.dirty.clear()
+        return out
+
+    def export(self) -> list[tuple[str, float, int]]:
+        with self.lock:
+            return [(name, self.last[i], self.seq[i])
+                    for i, name in enumerate(self.names) if name is not None]
+
+    def expire(self, now: float | None = None) -> list[str]:
+        """Advance the wheel to `now`; returns agents that just went stale."""
+        now = time.time() if now is None else now
+        newly_dead, slots = [], []
+        with self.lock:
+            target = int(now / self.tick)
+            if target - self.cursor >= self.nslots:
+                self.cursor = target - self.nslots  # lapped: one full turn covers everything
+            while self.cursor < target:
+                self.cursor += 1
+                b = self.cursor % self.nslots
+                bucket = self.wheel[b]
+                if not bucket:
+                    continue
+                keep = []
+                for i in bucket:
+                    if self.names[i] is None or self.due[i] % self.nslots != b:
+                        continue  # freed, or re-armed on another bucket
+                    if self.due[i] > self.cursor:
+                        keep.append(i)  # same bucket, a later turn of the wheel
+                    elif not self.dead[i]:
+                        self.dead[i] = 1
+                        slots.append(i)
+                        self.graveyard.append((now, i))
+                        newly_dead.append(self.names[i])
+                self.wheel[b] = keep
+            _move(slots, self.alive_slots, self.dead_slots)
+            self._evict(now)
+        return newly_dead
+
+    def _evict(self, now: float):
+        while self.graveyard and self.graveyard[0][0] + self.evict_after <= now:
+            _since, i = self.graveyard.popleft()
+            if not self.dead[i] or self.names[i] is None:
+                continue  # came back to life since
+            del self.index[self.names[i]]
+            self.names[i] = None
+            self.dead[i] = 0
+            self.due[i] = -1
+            self.seq[i] = -1
+            _remove(self.dead_slots, i)
+            self.free.append(i)
+            self._by_name = None
+
+    def age(self, agent: str, now: float | None = None) -> float | None:
+        now = time.time() if now is None else now
+        i = self.index.get(agent)
+        return None if i is None else now - self.last[i]
+
+    def counts(self) -> dict:
+        total = len(self.index)
+        return {"agents": total, "alive": len(self.alive_slots), "dead": len(self.dead_slots)}
+
+    def page(self, offset: int = 0, limit: int = 100, state: str = "all",
+             prefix: str = "", now: float | None = None) -> tuple[dict[str, float], list[str], int | None]:
+        """One page of (agent -> age). Returns (ages, dead agents in the
+        page, next offset).
+
+        Without a prefix, `offset` is a slot number and a page costs
+        O(log n + limit): "alive" and "dead" pages walk sorted per-state slot
+        lists, "all" pages walk the slots (stepping over freed ones). With a
+        prefix, `offset` is a position in a sorted name index, the walk
+        starts at the first matching name and stops at the first name past
+        the prefix. That index is rebuilt (O(n log n)) by the first prefix
+        query after agents join or are evicted."""
+        now = time.time() if now is None else now
+        ages, dead = {}, []
+        with self.lock:
+            if prefix:
+                names = self._name_index()
+                walk = ((pos, self.index[names[pos]]) for pos in
+                        range(max(offset, bisect_left(names, prefix)), len(names)))
+            elif state in ("alive", "dead"):
+                slots = self.alive_slots if state == "alive" else self.dead_slots
+                walk = ((slots[k], slots[k]) for k in range(bisect_left(slots, offset), len(slots)))
+            else:
+                walk = ((i, i) for i in range(offset, len(self.names)))
+            nxt = None
+            for pos, i in walk:
+                name = self.names[i]
+                if prefix and not name.startswith(prefix):
+                    break  # sorted: no more matches
+                if name is None or (state == "alive" and self.dead[i]) or (state == "dead" and not self.dead[i]):
+                    continue
+                if len(ages) >= limit:
+                    nxt = pos
+                    break
+                ages[name] = now - self.last[i]
+                if self.dead[i]:
+                    dead.append(name)
+        return ages, dead, nxt
+
+    def _name_index(self) -> list[str]:
+        if self._by_name is None:
+            self._by_name = sorted(self.index)
+        return self._by_name
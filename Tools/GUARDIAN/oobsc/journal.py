@@ -0,0 +1,125 @@
+# oobsc/journal.py
+# Detection event journal: who raised an inhibit (or what expired), why,
+# and when. Events live in a fixed-capacity ring numbered by a global
+# sequence; secondary indexes map each agent and detector to the sequence
+# numbers of its events still in the ring. Recording is O(1) and memory is
+# bounded by the capacity (fields are clipped), so a detection storm only
+# ages out old events.
+#
+# Reads are by cursor (events after a sequence number) for incremental
+# polling, or by time range; `ts` is kept non-decreasing along the
+# sequence, so both bounds are binary searches.
+import os, time, threading
+from bisect import bisect_left, bisect_right
+from collections import deque
+
+EVENT_CAPACITY = int(os.getenv("EVENT_JOURNAL_SIZE", "10000"))
+FIELD_MAX = int(os.getenv("EVENT_FIELD_MAX", "512"))
+KEY_MAX = 128  # agent / detector ids
+
+def _clip(value, size: int) -> str | None:
+    if value is None:
+        return None
+    value = str(value)
+    return value if len(value) <= size else value[: size - 3] + "..."
+
+class EventJournal:
+    def __init__(self, capacity: int = EVENT_CAPACITY):
+        self.capacity = max(1, capacity)
+        self.ring: list[dict | None] = [None] * self.capacity
+        self.seq = 0                               # last assigned sequence number
+        self.last_ts = 0.0
+        self.by_agent: dict[str, deque[int]] = {}
+        self.by_detector: dict[str, deque[int]] = {}
+        self.lock = threading.Lock()               # the expiry thread records too
+
+    def record(self, kind: str, detector: str | None, reason: str | None = None,
+               agent: str | None = None, decoy: str | None = None, **extra) -> dict:
+        detector = _clip(detector or "unknown", KEY_MAX)
+        agent = _clip(agent, KEY_MAX)
+        with self.lock:
+            seq = self.seq + 1
+            slot = seq % self.capacity
+            old = self.ring[slot]
+            if old is not None:
+                self._unindex(old)
+            self.last_ts = max(time.time(), self.last_ts)
+            ev = {"seq": seq, "ts": self.last_ts, "kind": kind, "detector": detector, "agent": agent,
+                  "reason": _clip(reason, FIELD_MAX), "decoy": _clip(decoy, KEY_MAX),
+                  **{k: v for k, v in extra.items() if v is not None}}
+            self.ring[slot] = ev
+            self.by_detector.setdefault(detector, deque()).append(seq)
+            if agent is not None:
+                self.by_agent.setdefault(agent, deque()).append(seq)
+            self.seq = seq
+        return ev
+
+    def _unindex(self, ev: dict):
+        # the evicted event is the oldest in the ring, so also in its index entries
+        for index, key in ((self.by_detector, ev["detector"]), (self.by_agent, ev["agent"])):
+            if key is None:
+                continue
+            seqs = index[key]
+            seqs.popleft()
+            if not seqs:
+                del index[key]
+
+    def _ts(self, seq: int) -> float:
+        return self.ring[seq % self.capacity]["ts"]
+
+    def query(self, after: int | None = None, start: float | None = None, end: float | None = None,
+              agent: str | None = None, detector: str | None = None, limit: int = 100) -> dict:
+        """Events in sequence order. With `after` and/or `start` the read goes
+        forward from there (at most `limit`); without either it returns the
+        newest `limit` events. `end` is exclusive. Pass `next` back as `after`
+        to continue; `dropped` counts events after the cursor that have
+        already aged out of the ring. A cursor ahead of the journal (OOBSC
+        restarted) reads from the start."""
+        with self.lock:
+            oldest = max(1, self.seq - self.capacity + 1)
+            if after is not None and after > self.seq:
+                after = 0  # cursor from before an OOBSC restart: read from the start
+            if agent is not None or detector is not None:
+                picks = [index.get(key, ()) for index, key in ((self.by_agent, agent), (self.by_detector, detector))
+                         if key is not None]
+                cands = min(picks, key=len)  # walk the smaller index, test the other filter
+            else:
+                cands = range(oldest, self.seq + 1)
+            lo, hi = 0, len(cands)
+            if after is not None:
+                lo = bisect_right(cands, after)
+            if start is not None:
+                lo = max(lo, bisect_left(cands, start, key=self._ts))
+            if end is not None:
+                hi = bisect_left(cands, end, key=self._ts)
+
+            def wanted(ev: dict) -> bool:
+                return ((agent is None or ev["agent"] == agent)
+                        and (detector is None or ev["detector"] == detector))
+
+            events, more = [], False
+            forward = after is not None or start is not None
+            positions = range(lo, hi) if forward else range(hi - 1, lo - 1, -1)
+            for i in positions:
+                ev = self.ring[cands[i] % self.capacity]
+                if not wanted(ev):
+                    continue
+                if len(events) == limit:
+                    more = True
+                    break
+                events.append(ev)
+            if not forward:
+                events.reverse()
+                more = False  # older events exist, but the cursor only moves forward
+            if events and (more or end is not None):
+                nxt = events[-1]["seq"]
+            elif end is None:
+                nxt = self.seq  # read everything there is
+            else:
+                nxt = after or 0
+            return {"events": events, "next": nxt, "more": more, "oldest": oldest, "latest": self.seq,
+                    "dropped": max(0, oldest - 1 - after) if after is not None else 0}
+
+    def stats(self) -> dict:
+        return {"capacity": self.capacity, "size": min(self.seq, self.capacity), "latest": self.seq,
+                "agents": len(self.by_agent), "detectors": len(self.by_detector)}
@@ -0,0 +1,56 @@
+# oobsc/serve.py
+# OOBSC entrypoint. With OOBSC_WORKERS=1 (default) this is plain uvicorn and
+# all state lives in the worker. With more workers it first starts the state
+# server (shared_state.py), then runs uvicorn with N workers that all attach
+# to it through STATE_SOCKET.
+import multiprocessing, os, threading, time
+import uvicorn
+from shared_state import run_state_server
+
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WORKERS = int(os.getenv("OOBSC_WORKERS", "1"))
+SOCKET = os.getenv("STATE_SOCKET", "/tmp/oobsc-state.sock")
+RESTART_SEC = float(os.getenv("STATE_RESTART_SEC", "1"))
+
+def start_state_server() -> multiprocessing.Process:
+    if os.path.exists(SOCKET):
+        os.unlink(SOCKET)
+    server = multiprocessing.Process(target=run_state_server, args=(SOCKET,), daemon=True)
+    server.start()
+    deadline = time.time() + 30  # recovery of a large snapshot may take a moment
+    while not os.path.exists(SOCKET):
+        if not server.is_alive() or time.time() > deadline:
+            raise SystemExit("[oobsc] state server failed to start")
+        time.sleep(0.05)
+    return server
+
+def keep_state_server(holder: list, stopping: threading.Event):
+    """Restart the state server if it dies; the workers fail closed until
+    they reconnect (SharedStateClient retries with backoff)."""
+    while not stopping.wait(RESTART_SEC):
+        if holder[0].is_alive():
+            continue
+        print(f"[oobsc] State server exited ({holder[0].exitcode}); restarting", flush=True)
+        try:
+            holder[0] = start_state_server()
+        except SystemExit as e:
+            print(e, flush=True)
+
+def main():
+    if WORKERS <= 1:
+        os.environ.pop("STATE_SOCKET", None)  # state stays in this process
+        uvicorn.run("app:app", host=HOST, port=PORT)
+        return
+    holder, stopping = [start_state_server()], threading.Event()
+    threading.Thread(target=keep_state_server, args=(holder, stopping), daemon=True).start()
+    os.environ["STATE_SOCKET"] = SOCKET  # inherited by the workers
+    try:
+        uvicorn.run("app:app", host=HOST, port=PORT, workers=WORKERS)
+    finally:
+        stopping.set()
+        holder[0].terminate()
+        holder[0].join(5)
+
+if __name__ == "__main__":
+    main()
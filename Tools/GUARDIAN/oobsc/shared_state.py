@@ -0,0 +1,261 @@
+# oobsc/shared_state.py
+# Shared state for running OOBSC with several uvicorn workers.
+#
+# One state server process owns a LocalState (heartbeats, persistence,
+# expiry, UDP) and is its only writer. Workers connect over a unix socket
+# and speak newline-delimited JSON. The inhibit flag and version are also
+# published in a small memory-mapped cell guarded by a sequence lock, so
+# every worker reads the same inhibit value without a round trip. The
+# server updates the cell before it answers POST /inhibit, so once that
+# call returns no worker can still report the old value.
+import asyncio, itertools, json, mmap, os, signal, struct
+from collections import deque
+from state import LocalState
+
+CELL = struct.Struct("QQ?")  # seq (odd while writing), version, inhibit
+BEAT_FLUSH_SEC = float(os.getenv("STATE_BEAT_FLUSH_SEC", "0.005"))
+RPC_TIMEOUT = float(os.getenv("STATE_RPC_TIMEOUT_SEC", "2"))
+RECONNECT_MAX_SEC = float(os.getenv("STATE_RECONNECT_MAX_SEC", "2"))
+BEAT_BUFFER = int(os.getenv("STATE_BEAT_BUFFER", "100000"))  # beats queued between flushes
+
+class InhibitCell:
+    """Seqlock over (version, inhibit) in a shared mmap; one writer."""
+
+    def __init__(self, path: str, create: bool = False):
+        if create:
+            # a fresh file, so clients still mapping a dead server's cell
+            # never see it truncated under them
+            with open(path + ".tmp", "wb") as f:
+                f.write(b"\0" * CELL.size)
+            os.replace(path + ".tmp", path)
+        self._f = open(path, "r+b")
+        self.buf = mmap.mmap(self._f.fileno(), CELL.size)
+
+    def write(self, inhibit: bool, version: int):
+        seq = struct.unpack_from("Q", self.buf, 0)[0]
+        struct.pack_into("Q", self.buf, 0, seq + 1)
+        CELL.pack_into(self.buf, 0, seq + 1, version, inhibit)
+        struct.pack_into("Q", self.buf, 0, seq + 2)
+
+    def read(self) -> tuple[bool, int]:
+        while True:
+            seq, version, inhibit = CELL.unpack_from(self.buf, 0)
+            if seq % 2 == 0 and struct.unpack_from("Q", self.buf, 0)[0] == seq:
+                return inhibit, version
+
+    def close(self):
+        self.buf.close()
+        self._f.close()
+
+class StateServer:
+    def __init__(self, socket_path: str):
+        self.socket_path = socket_path
+        self.local = LocalState(on_change=self._changed)
+        self.cell = InhibitCell(socket_path + ".cell", create=True)
+        self.clients: set[asyncio.StreamWriter] = set()
+
+    def _changed(self, event: dict):
+        self.cell.write(event["inhibit"], event["version"])
+        line = (json.dumps({"op": "changed", **event}) + "\n").encode()
+        for w in list(self.clients):
+            w.write(line)
+
+    async def serve(self):
+        await self.local.start()
+        ev = self.local.inhibit_event()  # recovered state
+        self.cell.write(ev["inhibit"], ev["version"])
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+        server = await asyncio.start_unix_server(self._handle, path=self.socket_path, limit=1 << 24)
+        print(f"[oobsc] State server on {self.socket_path} (pid {os.getpid()})", flush=True)
+        stop = asyncio.Event()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            asyncio.get_running_loop().add_signal_handler(sig, stop.set)
+        try:
+            async with server:
+                await stop.wait()
+        finally:
+            await self.local.stop()
+            self.cell.close()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.clients.add(writer)
+        try:
+            while line := await reader.readline():
+                msg = json.loads(line)
+                op = msg["op"]
+                if op == "beats":
+                    self.local.beat_many(msg["agents"])
+                    continue  # fire and forget
+                if op == "inhibit":
+                    result = await self.local.set_inhibit(msg["value"], msg.get("trace"), msg.get("origin_ts"),
+                                                          msg.get("event"))
+                elif op == "hello":  # the client is registered for pushes once this returns
+                    result = self.local.inhibit_event()
+                elif op == "status":
+                    result = await self.local.status(**msg["query"])
+                elif op == "events":
+                    result = await self.local.events(**msg["query"])
+                elif op == "stats":
+                    result = await self.local.stats()
+                else:
+                    result = {"error": f"unknown op {op}"}
+                writer.write((json.dumps({"id": msg["id"], "result": result}) + "\n").encode())
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+class SharedStateClient:
+    """Worker-side view with the same interface as LocalState. Beats are
+    buffered and shipped in batches every STATE_BEAT_FLUSH_SEC; inhibit
+    changes and status queries are round trips to the state server.
+
+    If the state server goes away the worker fails closed (inhibit=True,
+    calls raise ConnectionError, beats are dropped) and reconnects with
+    exponential backoff up to STATE_RECONNECT_MAX_SEC."""
+
+    def __init__(self, socket_path: str, on_change=None):
+        self.socket_path = socket_path
+        self.on_change = on_change
+        self.cell: InhibitCell | None = None
+        self.connected = False
+        self._beats = deque(maxlen=BEAT_BUFFER)  # filled from threadpool handlers too
+        self.dropped_beats = 0  # beats received while the state server was gone
+        self._pending: dict[int, asyncio.Future] = {}
+        self._ids = itertools.count()
+        self._writer = None
+        self._reader = None  # task reading the current connection
+        self._tasks = []
+        self._trace: dict = {}  # trace fields of the last transition, with its version
+
+    async def start(self):
+        await self._connect()
+        self._tasks = [asyncio.create_task(self._flush_beats()), asyncio.create_task(self._reconnect())]
+
+    async def _connect(self):
+        reader, writer = await asyncio.open_unix_connection(self.socket_path, limit=1 << 24)
+        if self.cell:
+            self.cell.close()
+        self.cell = InhibitCell(self.socket_path + ".cell")  # a restarted server recreates it
+        self._writer = writer
+        self.connected = True
+        self._reader = asyncio.create_task(self._read(reader))
+        try:
+            ev = await self._call("hello")  # no transition between here and the first push is missed
+        except BaseException:
+            self._reader.cancel()
+            raise
+        if "ts" in ev:
+            self._trace = ev
+
+    async def _reconnect(self):
+        while True:
+            await asyncio.wait([self._reader])
+            delay = 0.05
+            while True:
+                await asyncio.sleep(delay)
+                try:
+                    await self._connect()
+                    break
+                except (OSError, asyncio.TimeoutError):
+                    delay = min(delay * 2, RECONNECT_MAX_SEC)
+            print("[oobsc] Reconnected to state server", flush=True)
+            if self.on_change:
+                self.on_change(self.inhibit_event())
+
+    async def stop(self):
+        for t in self._tasks + [self._reader]:
+            if t:
+                t.cancel()
+        if self._writer:
+            self._writer.close()
+        if self.cell:
+            self.cell.close()
+
+    async def _read(self, reader: asyncio.StreamReader):
+        try:
+            while line := await reader.readline():
+                msg = json.loads(line)
+                if msg.get("op") == "changed":
+                    del msg["op"]
+                    self._trace = msg
+                    if self.on_change:
+                        self.on_change(msg)
+                    continue
+                fut = self._pending.pop(msg["id"], None)
+                if fut and not fut.done():
+                    fut.set_result(msg["result"])
+        finally:
+            self.connected = False
+            self._writer.close()
+            print("[oobsc] Lost state server; failing closed", flush=True)
+            for fut in self._pending.values():
+                if not fut.done():  # a caller may have timed out or been cancelled
+                    fut.set_exception(ConnectionError("state server gone"))
+            self._pending.clear()
+            self._beats.clear()
+            if self.on_change:
+                self.on_change(self.inhibit_event())
+
+    async def _call(self, op: str, **kw):
+        if not self.connected:
+            raise ConnectionError("state server gone")
+        rid = next(self._ids)
+        fut = asyncio.get_running_loop().create_future()
+        self._pending[rid] = fut
+        try:
+            self._writer.write((json.dumps({"id": rid, "op": op, **kw}) + "\n").encode())
+            return await asyncio.wait_for(fut, RPC_TIMEOUT)
+        finally:
+            self._pending.pop(rid, None)
+
+    async def _flush_beats(self):
+        while True:
+            await asyncio.sleep(BEAT_FLUSH_SEC)
+            if not self._beats or not self.connected:
+                continue
+            agents = []
+            while self._beats:
+                agents.append(self._beats.popleft())
+            self._writer.write((json.dumps({"op": "beats", "agents": agents}) + "\n").encode())
+
+    def beat(self, agent: str):
+        if not self.connected:
+            self.dropped_beats += 1  # nowhere to send it; agents beat again
+            return
+        self._beats.append(agent)
+
+    def beat_many(self, agents: list[str]):
+        if not self.connected:
+            self.dropped_beats += len(agents)
+            return
+        self._beats.extend(agents)
+
+    def inhibit_event(self) -> dict:
+        if not self.connected:
+            return {"inhibit": True, "version": -1}  # unknown → unsafe
+        inhibit, version = self.cell.read()
+        if self._trace.get("version") == version:
+            return {**self._trace, "inhibit": inhibit}
+        return {"inhibit": inhibit, "version": version}
+
+    async def set_inhibit(self, value: bool, trace: str | None = None,
+                          origin_ts: float | None = None, event: dict | None = None) -> dict:
+        return await self._call("inhibit", value=value, trace=trace, origin_ts=origin_ts, event=event)
+
+    async def events(self, **query) -> dict:
+        return await self._call("events", query=query)
+
+    async def status(self, **query) -> dict:
+        out = await self._call("status", query=query)
+        out.update(self.inhibit_event())
+        return out
+
+    async def stats(self) -> dict:
+        return await self._call("stats")
+
+def run_state_server(socket_path: str):
+    asyncio.run(StateServer(socket_path).serve())
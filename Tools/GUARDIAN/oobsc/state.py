@@ -0,0 +1,124 @@
+# oobsc/state.py
+# In-process OOBSC state: inhibit flag, heartbeat store, persistence, the
+# expiry ticker and the optional UDP listener. A single-worker OOBSC uses
+# it directly; with several workers it runs inside the state server
+# (shared_state.py) and the workers reach it through SharedStateClient.
+import os, time, threading, asyncio
+from heartbeats import HeartbeatStore, parse_beats
+from statelog import StateLog
+from journal import EventJournal
+
+HB_TIMEOUT = float(os.getenv("HEARTBEAT_TIMEOUT_SEC", "10"))
+HB_TICK = float(os.getenv("HEARTBEAT_TICK_SEC", "0.5"))
+HB_EVICT = float(os.getenv("HEARTBEAT_EVICT_SEC", str(HB_TIMEOUT * 30)))
+# Optional UDP heartbeat listener (compact records, see heartbeats.RECORD).
+HB_UDP_PORT = int(os.getenv("HEARTBEAT_UDP_PORT", "0") or 0)
+# Durable state (append-only log + snapshots); empty = in-memory only.
+STATE_DIR = os.getenv("STATE_DIR", "")
+STATE_FLUSH_SEC = float(os.getenv("STATE_FLUSH_SEC", "1"))
+STATE_SNAPSHOT_SEC = float(os.getenv("STATE_SNAPSHOT_SEC", "300"))
+
+class HeartbeatDatagrams(asyncio.DatagramProtocol):
+    def __init__(self, store: HeartbeatStore):
+        self.store = store
+
+    def datagram_received(self, data, addr):
+        self.store.beat_many(parse_beats(data))
+
+class LocalState:
+    def __init__(self, on_change=None):
+        self.state = {
+            "inhibit": False,
+            "version": 0,  # bumped on every inhibit transition
+        }
+        self.heartbeats = HeartbeatStore(HB_TIMEOUT, tick=HB_TICK, evict_after=HB_EVICT)
+        self.statelog = StateLog(STATE_DIR, self.heartbeats, flush_sec=STATE_FLUSH_SEC,
+                                 snapshot_sec=STATE_SNAPSHOT_SEC) if STATE_DIR else None
+        self.on_change = on_change  # called after every inhibit transition
+        self.trace: dict = {}       # timing/trace fields of the last transition
+        self.journal = EventJournal()
+        self._transition = asyncio.Lock()  # one inhibit transition (and its fsync) at a time
+        self._stop = threading.Event()
+        self._udp = None
+
+    async def start(self):
+        if self.statelog:
+            self.state["inhibit"], self.state["version"] = self.statelog.recover()
+            self.statelog.start(self.state)
+        threading.Thread(target=self._expiry_loop, daemon=True).start()
+        if HB_UDP_PORT:
+            self._udp, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+                lambda: HeartbeatDatagrams(self.heartbeats), local_addr=("0.0.0.0", HB_UDP_PORT))
+            print(f"[oobsc] UDP heartbeats on :{HB_UDP_PORT}", flush=True)
+
+    async def stop(self):
+        if self._udp:
+            self._udp.close()
+        self._stop.set()
+        if self.statelog:
+            self.statelog.close(self.state)
+
+    def _expiry_loop(self):
+        while not self._stop.wait(HB_TICK):
+            for agent in self.heartbeats.expire():
+                print(f"[oobsc] Agent {agent} missed heartbeats for {HB_TIMEOUT}s; marked dead", flush=True)
+                self.journal.record("heartbeat_lost", "oobsc", f"missed heartbeats for {HB_TIMEOUT}s", agent=agent)
+
+    def beat(self, agent: str):
+        self.heartbeats.beat(agent)
+
+    def beat_many(self, agents: list[str]):
+        self.heartbeats.beat_many(agents)
+
+    def inhibit_event(self) -> dict:
+        ev = {"inhibit": self.state["inhibit"], "version": self.state["version"]}
+        if self.trace:
+            ev.update(self.trace)
+        return ev
+
+    async def set_inhibit(self, value: bool, trace: str | None = None,
+                          origin_ts: float | None = None, event: dict | None = None) -> dict:
+        """`trace`/`origin_ts` come from the detector that asked; they ride
+        along on the transition's event so watchers can time each hop.
+        `event` (source, agent, reason, decoy) is journaled with every call,
+        repeats included."""
+        async with self._transition:
+            changed = self.state["inhibit"] != value
+            if changed:
+                def apply():
+                    # one update, so readers on the loop never see a new flag with an old version
+                    self.state.update({"inhibit": value, "version": self.state["version"] + 1})
+                    # ts: when OOBSC flipped the flag (unix time)
+                    self.trace = {"ts": time.time(), **({"trace": trace} if trace else {}),
+                                  **({"origin_ts": origin_ts} if origin_ts else {})}
+                if self.statelog:
+                    # the write + fsync runs off the event loop; apply() still
+                    # happens under the log lock once the record is durable
+                    await asyncio.to_thread(self.statelog.log_inhibit, value, self.state["version"] + 1, apply)
+                else:
+                    apply()
+                if self.on_change:
+                    self.on_change(self.inhibit_event())
+        event = event or {}
+        self.journal.record("inhibit" if value else "clear", event.get("source"), event.get("reason"),
+                            event.get("agent"), event.get("decoy"), trace=trace, changed=changed,
+                            version=self.state["version"])
+        return self.inhibit_event()
+
+    async def events(self, **query) -> dict:
+        return self.journal.query(**query)
+
+    async def status(self, agent: str | None = None, state: str = "all", prefix: str = "",
+                     offset: int = 0, limit: int = 100) -> dict:
+        out = {**self.inhibit_event(), **self.heartbeats.counts()}
+        if agent is not None:
+            age = self.heartbeats.age(agent)
+            out["heartbeat_ages_sec"] = {} if age is None else {agent: age}
+            return out
+        ages, dead, nxt = self.heartbeats.page(offset, limit, state, prefix)
+        out.update({"heartbeat_ages_sec": ages, "dead_agents": dead, "next": nxt})
+        return out
+
+    async def stats(self) -> dict:
+        return {"beats": self.heartbeats.beats, "replayed": self.heartbeats.replayed,
+                "events": self.journal.stats()}
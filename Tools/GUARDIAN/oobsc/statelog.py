@@ -0,0 +1,159 @@
+# oobsc/statelog.py
+# Durable OOBSC state: an append-only log plus periodic compact snapshots.
+#
+# Inhibit transitions are appended and fsynced before they take effect.
+# Heartbeats are not logged per beat: the store tracks which agents beat
+# since the last flush, and a background thread appends one record per such
+# agent and fsyncs the batch every FLUSH_SEC. Snapshots are written to a
+# temp file and renamed into place, after which the log is truncated.
+# Recovery maps the snapshot and replays only the log written since.
+import mmap, os, struct, threading, time, zlib
+from pathlib import Path
+
+FRAME = struct.Struct("!BII")        # type, payload length, crc32(payload)
+INHIBIT = struct.Struct("!?qd")      # inhibit, version, unix time
+BEAT = struct.Struct("!dqB")         # last beat, seq, id length (+ id)
+SNAP_MAGIC = b"OOBSNAP1"
+SNAP_HEAD = struct.Struct("!?qI")    # inhibit, version, agent count
+T_INHIBIT, T_BEAT = 1, 2
+
+def _beat_payload(agent: str, last: float, seq: int) -> bytes:
+    raw = agent.encode("utf-8")[:255]
+    return BEAT.pack(last, seq, len(raw)) + raw
+
+def _frame(kind: int, payload: bytes) -> bytes:
+    return FRAME.pack(kind, len(payload), zlib.crc32(payload)) + payload
+
+class StateLog:
+    def __init__(self, directory: str, store, flush_sec: float = 1.0,
+                 snapshot_sec: float = 300.0, snapshot_log_bytes: int = 64 << 20):
+        self.dir = Path(directory)
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.log_path = self.dir / "oobsc.log"
+        self.snap_path = self.dir / "oobsc.snap"
+        self.store = store
+        self.flush_sec = flush_sec
+        self.snapshot_sec = snapshot_sec
+        self.snapshot_log_bytes = snapshot_log_bytes
+        self.lock = threading.Lock()  # serializes writes to the log file
+        self.log = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    # --- recovery ---
+    def recover(self) -> tuple[bool, int]:
+        """Rebuild the store from snapshot + log; returns (inhibit, version)."""
+        t0 = time.perf_counter()
+        inhibit, version, agents = self._load_snapshot()
+        inhibit, version, replayed, good = self._replay(inhibit, version)
+        # drop a torn tail so new records append after the last good one
+        self.log = open(self.log_path, "ab")
+        self.log.truncate(good)
+        print(f"[oobsc] Recovered state in {(time.perf_counter() - t0) * 1000:.1f} ms: "
+              f"inhibit={inhibit} version={version} agents={agents} log_records={replayed}", flush=True)
+        return inhibit, version
+
+    def _load_snapshot(self) -> tuple[bool, int, int]:
+        if not self.snap_path.exists() or self.snap_path.stat().st_size < len(SNAP_MAGIC) + SNAP_HEAD.size:
+            return False, 0, 0
+        with open(self.snap_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            if m[:len(SNAP_MAGIC)] != SNAP_MAGIC:
+                print("[oobsc] Ignoring snapshot with bad magic", flush=True)
+                return False, 0, 0
+            off = len(SNAP_MAGIC)
+            inhibit, version, count = SNAP_HEAD.unpack_from(m, off)
+            off += SNAP_HEAD.size
+            for _ in range(count):
+                last, seq, n = BEAT.unpack_from(m, off)
+                off += BEAT.size
+                self.store.restore(m[off:off + n].decode("utf-8", "replace"), last, seq)
+                off += n
+        return inhibit, version, count
+
+    def _replay(self, inhibit: bool, version: int) -> tuple[bool, int, int, int]:
+        if not self.log_path.exists():
+            return inhibit, version, 0, 0
+        data = self.log_path.read_bytes()
+        off = records = 0
+        while off + FRAME.size <= len(data):
+            kind, n, crc = FRAME.unpack_from(data, off)
+            payload = data[off + FRAME.size: off + FRAME.size + n]
+            if len(payload) < n or zlib.crc32(payload) != crc:
+                print(f"[oobsc] Log torn at byte {off}; discarding tail", flush=True)
+                break
+            if kind == T_INHIBIT:
+                value, v, _ts = INHIBIT.unpack(payload)
+                if v > version:  # the snapshot may already include it
+                    inhibit, version = value, v
+            elif kind == T_BEAT:
+                last, seq, k = BEAT.unpack_from(payload)
+                self.store.restore(payload[BEAT.size:BEAT.size + k].decode("utf-8", "replace"), last, seq)
+            off += FRAME.size + n
+            records += 1
+        return inhibit, version, records, off
+
+    # --- writing ---
+    def log_inhibit(self, inhibit: bool, version: int, apply):
+        """Blocking, so callers on the event loop run it in a thread: the
+        transition is on disk before apply() makes it visible. Both happen
+        under the log lock so a concurrent snapshot sees either neither or
+        both."""
+        with self.lock:
+            self.log.write(_frame(T_INHIBIT, INHIBIT.pack(inhibit, version, time.time())))
+            self.log.flush()
+            os.fsync(self.log.fileno())
+            apply()
+
+    def flush(self):
+        beats = self.store.drain_dirty()
+        if not beats:
+            return
+        buf = b"".join(_frame(T_BEAT, _beat_payload(*b)) for b in beats)
+        with self.lock:
+            self.log.write(buf)
+            self.log.flush()
+            os.fsync(self.log.fileno())
+
+    def snapshot(self, state: dict):
+        with self.lock:
+            # Everything in the log so far is covered by this export.
+            agents = self.store.export()
+            inhibit, version = state["inhibit"], state["version"]
+            tmp = self.snap_path.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                f.write(SNAP_MAGIC + SNAP_HEAD.pack(inhibit, version, len(agents)))
+                f.write(b"".join(_beat_payload(*a) for a in agents))
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.snap_path)
+            dir_fd = os.open(self.dir, os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+            self.log.truncate(0)
+            self.log.seek(0)
+            os.fsync(self.log.fileno())
+
+    def start(self, state: dict):
+        def run():
+            last_snap = time.monotonic()
+            while not self._stop.wait(self.flush_sec):
+                try:
+                    self.flush()
+                    if (time.monotonic() - last_snap >= self.snapshot_sec
+                            or self.log.tell() >= self.snapshot_log_bytes):
+                        self.snapshot(state)
+                        last_snap = time.monotonic()
+                except OSError as e:
+                    print(f"[oobsc] State log write failed: {e}", flush=True)
+        self._thread = threading.Thread(target=run, daemon=True, name="statelog")
+        self._thread.start()
+
+    def close(self, state: dict):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        self.flush()
+        self.snapshot(state)
+        self.log.close()
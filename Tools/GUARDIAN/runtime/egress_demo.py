@@ -2,12 +2,13 @@
 import requests, json, os
 
 GATEWAY = os.getenv("EGRESS_GATEWAY", "http://127.0.0.1:9100/fetch")
+AGENT_ID = os.getenv("GUARDIAN_AGENT_ID", "guarded_ai")  # named in OOBSC's event journal
 
 def call(url: str, method="GET", body=None):
     payload = {"url": url, "method": method}
     if body is not None:
         payload["body"] = body
-    r = requests.post(GATEWAY, json=payload, timeout=5)
+    r = requests.post(GATEWAY, json=payload, headers={"x-guardian-agent": AGENT_ID}, timeout=5)
     print(f"[egress_demo] {url} -> {r.status_code} {r.text[:200]}")
 
 if __name__ == "__main__":
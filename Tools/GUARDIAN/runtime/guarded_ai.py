@@ -1,4 +1,5 @@
-import os, time, threading, subprocess, sys, requests
+import os, time, threading, subprocess, sys, json, requests
+import metrics
 
 OOBSC_URL = os.getenv("OOBSC_URL", "http://oobsc:8000")
 HEARTBEAT_SOURCE = os.getenv("HEARTBEAT_SOURCE", "guarded_ai")
@@ -6,10 +7,46 @@ HB_INTERVAL = float(os.getenv("HB_INTERVAL_SEC", "2"))
 REQ_TIMEOUT = float(os.getenv("REQ_TIMEOUT_SEC", "1.5"))
 STARTUP_GRACE = float(os.getenv("STARTUP_GRACE_SEC", "8"))  # NEW
 OOBSC = os.getenv("OOBSC_URL", "http://oobsc:8000")
+# Follow OOBSC /watch (SSE) for inhibit pushes; polling is only the fallback.
+WATCH = os.getenv("INHIBIT_WATCH", "1") not in ("0", "false", "off")
+WATCH_IDLE = float(os.getenv("WATCH_IDLE_SEC", "15"))  # > OOBSC keepalive
+WATCH_RETRY = float(os.getenv("WATCH_RETRY_SEC", "1"))
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9300"))  # 0 disables /metrics
+
+TERMINATION = metrics.Histogram("guardian_child_termination_seconds", "SIGTERM to child exit")
+PROPAGATION = metrics.Histogram("guardian_inhibit_propagation_seconds",
+                                "Inhibit path latency per hop (see trace fields)", ("hop",))
+
+def start_metrics():
+    if METRICS_PORT:
+        try:
+            metrics.serve(METRICS_PORT)
+        except OSError as e:
+            print(f"[watchdog] Metrics port {METRICS_PORT} unavailable: {e}", flush=True)
+
+def inhibit_received(ev: dict):
+    """Time from the OOBSC transition to this agent seeing it."""
+    if ev.get("ts"):
+        PROPAGATION.observe(max(0.0, time.time() - ev["ts"]), "oobsc_to_agent")
+
+def inhibit_enforced(ev: dict, what: str):
+    """Called once the children are dead: end-to-end detection-to-kill time
+    and one log line with the trace's hop breakdown."""
+    now = time.time()
+    origin, ts = ev.get("origin_ts"), ev.get("ts")
+    if origin:
+        PROPAGATION.observe(max(0.0, now - origin), "detection_to_kill")
+    if ev.get("trace"):
+        hops = []
+        if origin and ts:
+            hops.append(f"detector->oobsc {(ts - origin) * 1000:.1f} ms")
+        if ts:
+            hops.append(f"oobsc->killed {(now - ts) * 1000:.1f} ms")
+        print(f"[watchdog] Trace {ev['trace']}: {what} ({', '.join(hops) or 'no timestamps'})", flush=True)
 
 def inhibited() -> bool:
     try:
-        r = requests.get(f"{OOBSC}/status", timeout=2)
+        r = requests.get(f"{OOBSC}/status", params={"limit": 0}, timeout=2)
         return r.json().get("inhibit", False)
     except Exception:
         # treat unknown as unsafe → inhibit
@@ -20,6 +57,43 @@ def heartbeat():
     except Exception:
         pass
 
+class InhibitWatch(threading.Thread):
+    """Subscribes to OOBSC /watch. `live` is True only while the stream is
+    connected and has delivered the current state; callers must fall back to
+    polling (fail-closed) otherwise. on_inhibit(event) runs on this thread
+    the moment inhibit=true arrives. `wake` is set on every change or drop."""
+
+    def __init__(self, on_inhibit):
+        super().__init__(daemon=True, name="inhibit-watch")
+        self.on_inhibit = on_inhibit
+        self.live = False
+        self.inhibit = True  # unknown → unsafe
+        self.version = None
+        self.wake = threading.Event()
+
+    def run(self):
+        while True:
+            try:
+                with requests.get(f"{OOBSC}/watch", stream=True,
+                                  timeout=(REQ_TIMEOUT, WATCH_IDLE)) as r:
+                    r.raise_for_status()
+                    for line in r.iter_lines(chunk_size=None, decode_unicode=True):
+                        if not line or not line.startswith("data:"):
+                            continue  # keepalive comment
+                        ev = json.loads(line[5:])
+                        self.inhibit, self.version = ev["inhibit"], ev["version"]
+                        self.live = True
+                        if self.inhibit:
+                            inhibit_received(ev)
+                            self.on_inhibit(ev)
+                        self.wake.set()
+            except Exception as e:
+                if self.live:
+                    print(f"[watchdog] Inhibit watch dropped ({e}); polling", flush=True)
+            self.live = False
+            self.wake.set()
+            time.sleep(WATCH_RETRY)
+
 def launch_child():
     # run a long-lived, harmless process instead of misbehave.py
     return subprocess.Popen([sys.executable, "-c", "import time; time.sleep(10**9)"])
@@ -45,56 +119,99 @@ def start_ai():
 
 def kill_ai(proc, reason: str):
     print(f"[watchdog] Terminating AI. Reason: {reason}", flush=True)
-    try:
-        proc.terminate(); proc.wait(timeout=3)
-    except Exception:
-        try: proc.kill()
-        except Exception: pass
+    with TERMINATION.time():
+        try:
+            proc.terminate(); proc.wait(timeout=3)
+        except Exception:
+            try: proc.kill()
+            except Exception: pass
     os._exit(1)
 
-def watchdog_loop(proc):
+def stop_child(child) -> bool:
+    """Terminate child if running; True if it had to be stopped."""
+    if child and child.poll() is None:
+        with TERMINATION.time():
+            try:
+                child.terminate(); child.wait(timeout=5)
+            except Exception:
+                try: child.kill()
+                except Exception: pass
+        return True
+    return False
+
+def watchdog_loop(proc, watch: InhibitWatch | None = None):
     # main loop after startup grace
     while True:
         try:
             requests.post(f"{OOBSC_URL}/heartbeat", json={"source": HEARTBEAT_SOURCE}, timeout=REQ_TIMEOUT)
-            status = requests.get(f"{OOBSC_URL}/status", timeout=REQ_TIMEOUT).json()
-            if status.get("inhibit", False):
+            if watch and watch.live:
+                ih = watch.inhibit
+            else:
+                ih = requests.get(f"{OOBSC_URL}/status", params={"limit": 0}, timeout=REQ_TIMEOUT).json().get("inhibit", False)
+            if ih:
                 kill_ai(proc, "OOBSC inhibit=true")
         except Exception as e:
             kill_ai(proc, f"Lost contact with OOBSC ({e})")
-        time.sleep(HB_INTERVAL)
+        if watch:
+            watch.wake.wait(HB_INTERVAL); watch.wake.clear()
+        else:
+            time.sleep(HB_INTERVAL)
 
 def main():
     child = None
+    lock = threading.Lock()
 
-    while True:
-        ih = inhibited()
-
-        if ih:
-            # ensure child is dead while inhibited
+    def on_inhibit(ev: dict):
+        # pushed from the watch thread: kill now, don't wait for the loop
+        with lock:
             if child and child.poll() is None:
-                try:
-                    child.terminate(); child.wait(timeout=5)
-                except Exception:
-                    try: child.kill()
-                    except Exception: pass
-            child = None
-            # DO NOT send heartbeat while inhibited
-            time.sleep(1.0)
-            continue
+                print("[watchdog] Inhibit pushed by OOBSC; terminating AI", flush=True)
+                stop_child(child)
+                inhibit_enforced(ev, "AI terminated")
 
-        # not inhibited: (re)launch if not running
-        if child is None or child.poll() is not None:
-            print("[ai] Launching AI subprocess...")
-            child = launch_child()
-            # send a heartbeat when we (re)start successfully
-            heartbeat()
+    start_metrics()
+    watch = InhibitWatch(on_inhibit) if WATCH else None
+    if watch:
+        watch.start()
 
-        # steady-state: child running → send heartbeat periodically
-        if child.poll() is None:
-            heartbeat()
+    while True:
+        # live stream → trust pushed state; otherwise poll (fail-closed)
+        live = watch is not None and watch.live
+        ih = False if live else inhibited()  # the poll stays outside the lock
 
-        time.sleep(0.5)
+        with lock:
+            # Pushed state is read under the lock: the watch sets it before
+            # on_inhibit kills, so a kill that just happened is never undone
+            # by a relaunch (and heartbeat) based on an older read.
+            if live or (watch is not None and watch.live):
+                ih = ih or watch.inhibit
+            if ih:
+                # ensure child is dead while inhibited
+                stop_child(child)
+                child = None
+            else:
+                # not inhibited: (re)launch if not running
+                if child is None or child.poll() is not None:
+                    print("[ai] Launching AI subprocess...")
+                    child = launch_child()
+                    # send a heartbeat when we (re)start successfully
+                    heartbeat()
+
+                # steady-state: child running → send heartbeat periodically
+                if child.poll() is None:
+                    heartbeat()
+
+        if live:
+            # no /status polling; heartbeat cadence, woken early by any push
+            watch.wake.wait(HB_INTERVAL if not ih else 1.0)
+            watch.wake.clear()
+        else:
+            # DO NOT send heartbeat while inhibited
+            time.sleep(1.0 if ih else 0.5)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    if int(os.getenv("GUARDED_AGENTS", "1")) > 1:
+        import supervisor  # N children under one asyncio supervisor
+        supervisor.main()
+    else:
+        main()
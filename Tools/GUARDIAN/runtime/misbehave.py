@@ -7,10 +7,11 @@ DECOY_FILE = HERE / "decoys" / "fake_key.txt"
 
 # use docker service DNS, not localhost
 HONEYPOT_URL = os.getenv("HONEYPOT_URL", "http://honeytoken:9000/ingest")
+AGENT_ID = os.getenv("GUARDIAN_AGENT_ID", "guarded_ai")  # named in OOBSC's event journal
 
 token = DECOY_FILE.read_text(encoding="utf-8")
 print(f"[misbehave] Read token from decoy: {token.strip()}")
 
 # send the token to the honeypot
-r = requests.post(HONEYPOT_URL, data=token, headers={"Content-Type": "text/plain"})
+r = requests.post(HONEYPOT_URL, data=token, headers={"Content-Type": "text/plain", "x-guardian-agent": AGENT_ID})
 print(f"[misbehave] Sent to honeypot: {r.status_code} {r.text}")
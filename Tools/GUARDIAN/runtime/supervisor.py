@@ -0,0 +1,185 @@
+# runtime/supervisor.py
+# Asyncio supervisor for several guarded AI processes on one host.
+#
+# Each child gets its own heartbeat identity (<HEARTBEAT_SOURCE>-<n>) and
+# all of them share one pooled HTTP client to OOBSC: heartbeats for every
+# running child go out as a single /heartbeat/batch call, and inhibit is
+# followed over /watch with /status polling as the fail-closed fallback.
+# On inhibit all children are terminated concurrently (SIGTERM, then
+# SIGKILL after KILL_GRACE_SEC) and the kill latency of each is reported.
+import asyncio, json, os, shlex, signal, sys, time
+import httpx
+from guarded_ai import (OOBSC_URL, HEARTBEAT_SOURCE, HB_INTERVAL, REQ_TIMEOUT,
+                        STARTUP_GRACE, WATCH, WATCH_IDLE, WATCH_RETRY, TERMINATION,
+                        start_metrics, inhibit_received, inhibit_enforced)
+
+AGENTS = int(os.getenv("GUARDED_AGENTS", "1"))
+AGENT_CMD = shlex.split(os.getenv("AGENT_CMD", "")) or [sys.executable, "-c", "import time; time.sleep(10**9)"]
+KILL_GRACE = float(os.getenv("KILL_GRACE_SEC", "3"))
+
+class Child:
+    def __init__(self, index: int):
+        self.name = f"{HEARTBEAT_SOURCE}-{index}"
+        self.proc: asyncio.subprocess.Process | None = None
+        self.last_kill_ms: float | None = None
+
+    @property
+    def running(self) -> bool:
+        return self.proc is not None and self.proc.returncode is None
+
+class Supervisor:
+    def __init__(self, n: int = AGENTS, cmd: list[str] = AGENT_CMD):
+        self.children = [Child(i) for i in range(n)]
+        self.cmd = cmd
+        self.client: httpx.AsyncClient | None = None
+        self.live = False      # /watch connected and synced
+        self.inhibit = True    # unknown → unsafe
+        self.pushes = 0        # inhibit=true events seen on /watch
+        self.wake = asyncio.Event()
+        self.kill_log: list[dict] = []
+
+    async def wait_for_oobsc(self) -> bool:
+        deadline = time.time() + STARTUP_GRACE
+        while time.time() < deadline:
+            try:
+                if (await self.client.get("/health")).is_success:
+                    print("[watchdog] OOBSC is up", flush=True)
+                    return True
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.5)
+        print("[watchdog] OOBSC not reachable after grace; enforcing fail-closed", flush=True)
+        return False
+
+    async def poll_inhibited(self) -> bool:
+        try:
+            r = await self.client.get("/status", params={"limit": 0})
+            r.raise_for_status()
+            return r.json().get("inhibit", False)
+        except Exception:
+            return True  # treat unknown as unsafe → inhibit
+
+    async def watch(self):
+        while True:
+            try:
+                async with self.client.stream("GET", "/watch", timeout=httpx.Timeout(REQ_TIMEOUT, read=WATCH_IDLE)) as r:
+                    r.raise_for_status()
+                    async for line in r.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue  # keepalive comment
+                        await self.pushed(json.loads(line[5:]))
+            except Exception as e:
+                if self.live:
+                    print(f"[watchdog] Inhibit watch dropped ({e}); polling", flush=True)
+            self.live = False
+            self.wake.set()
+            await asyncio.sleep(WATCH_RETRY)
+
+    async def pushed(self, ev: dict):
+        self.inhibit, self.live = ev["inhibit"], True
+        if self.inhibit:
+            self.pushes += 1
+            inhibit_received(ev)
+            await self.kill_all("Inhibit pushed by OOBSC", ev)
+        self.wake.set()
+
+    async def launch(self, child: Child):
+        print(f"[ai] Launching {child.name}...", flush=True)
+        env = dict(os.environ, GUARDIAN_AGENT_ID=child.name)
+        child.proc = await asyncio.create_subprocess_exec(*self.cmd, env=env)
+
+    async def kill(self, child: Child, proc, t0: float) -> dict:
+        escalated = False
+        try:
+            proc.terminate()
+            try:
+                await asyncio.wait_for(proc.wait(), KILL_GRACE)
+            except asyncio.TimeoutError:
+                escalated = True
+                proc.kill()
+                await proc.wait()
+        except ProcessLookupError:
+            pass  # already gone
+        child.last_kill_ms = (time.perf_counter() - t0) * 1000
+        return {"agent": child.name, "pid": proc.pid, "kill_ms": child.last_kill_ms, "sigkill": escalated}
+
+    async def kill_all(self, reason: str, ev: dict | None = None):
+        t0 = time.perf_counter()
+        targets = []
+        for c in self.children:
+            if c.running:
+                targets.append((c, c.proc))
+                c.proc = None  # claim it, so a concurrent kill_all skips it
+        if not targets:
+            return
+        print(f"[watchdog] Terminating {len(targets)} AI process(es). Reason: {reason}", flush=True)
+        results = await asyncio.gather(*(self.kill(c, p, t0) for c, p in targets))
+        if ev:
+            inhibit_enforced(ev, f"{len(results)} AI process(es) terminated")
+        for r in results:
+            TERMINATION.observe(r["kill_ms"] / 1000)
+            print(f"[watchdog] {r['agent']} (pid {r['pid']}) stopped in {r['kill_ms']:.1f} ms"
+                  + (" after SIGKILL" if r["sigkill"] else ""), flush=True)
+        self.kill_log.extend(results)
+
+    async def heartbeat(self):
+        names = [c.name for c in self.children if c.running]
+        if not names:
+            return
+        try:
+            await self.client.post("/heartbeat/batch", json=names)
+        except httpx.HTTPError:
+            pass
+
+    async def step(self):
+        pushes = self.pushes
+        # live stream → trust pushed state; otherwise poll (fail-closed)
+        ih = self.inhibit if self.live else await self.poll_inhibited()
+        if ih:
+            # ensure children are dead while inhibited; no heartbeats
+            await self.kill_all("OOBSC inhibit=true")
+            return
+        missing = [c for c in self.children if not c.running]
+        await asyncio.gather(*(self.launch(c) for c in missing))
+        if self.pushes != pushes:
+            # an inhibit arrived while we polled or launched; its kill_all
+            # ran before these children existed
+            await self.kill_all("Inhibit pushed during launch")
+            return
+        await self.heartbeat()
+
+    async def run(self):
+        limits = httpx.Limits(max_connections=4, max_keepalive_connections=4)
+        async with httpx.AsyncClient(base_url=OOBSC_URL, timeout=REQ_TIMEOUT, limits=limits) as self.client:
+            await self.wait_for_oobsc()
+            watcher = asyncio.create_task(self.watch()) if WATCH else None
+            try:
+                while True:
+                    await self.step()
+                    interval = HB_INTERVAL if self.live else 0.5
+                    try:
+                        await asyncio.wait_for(self.wake.wait(), interval)
+                    except asyncio.TimeoutError:
+                        pass
+                    self.wake.clear()
+            finally:
+                if watcher:
+                    watcher.cancel()
+                await self.kill_all("supervisor exiting")
+
+async def _main():
+    task = asyncio.current_task()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, task.cancel)  # unwind through run()'s finally
+    try:
+        await Supervisor().run()
+    except asyncio.CancelledError:
+        pass
+
+def main():
+    start_metrics()
+    asyncio.run(_main())
+
+if __name__ == "__main__":
+    main()
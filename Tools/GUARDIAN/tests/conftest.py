@@ -0,0 +1,8 @@
+# Each GUARDIAN service runs from its own directory (see the Dockerfiles),
+# so the tests import their modules the same way.
+import os, sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for d in ("common", "oobsc", "detectors", "runtime"):
+    sys.path.insert(0, os.path.join(ROOT, d))
+sys.path.append(os.path.join(ROOT, "dashboard"))  # after the others: both have an app.py
@@ -0,0 +1,49 @@
+# Address pinning: pins are bounded, and an IDN host is pinned under the
+# punycode name PinnedBackend is asked to connect to.
+import asyncio
+import httpx
+import egress_resolver
+from egress_resolver import Resolver, PinnedBackend
+
+def test_pins_bounded_lru(monkeypatch):
+    monkeypatch.setattr(egress_resolver, "PIN_MAX_ENTRIES", 3)
+
+    async def run():
+        r = Resolver()
+        r.resolve = lambda host: asyncio.sleep(0, ["203.0.113.7"])
+        for h in ("a", "b", "c"):
+            await r.pin(f"{h}.example", 443, lambda addr: True)
+        await r.pin("a.example", 443, lambda addr: True)  # used again
+        await r.pin("d.example", 443, lambda addr: True)
+        assert list(r.pins) == [("c.example", 443), ("a.example", 443), ("d.example", 443)]
+        assert r.pinned("b.example", 443) is None
+
+    asyncio.run(run())
+
+def test_idn_host_pinned_as_punycode(monkeypatch):
+    import egress_gateway as gw
+    monkeypatch.setattr(gw, "BLOCK_PRIVATE", False)
+    resolver = Resolver()
+    looked_up = []
+
+    async def resolve(host):
+        looked_up.append(host)
+        return ["203.0.113.7"]
+    resolver.resolve = resolve
+    monkeypatch.setattr(gw, "RESOLVER", resolver)
+    connected = []
+
+    class Inner:
+        async def connect_tcp(self, host, port, **kw):
+            connected.append((host, port))
+
+    async def run():
+        await gw.pin_destination(httpx.URL("https://bücher.example/"))
+        backend = PinnedBackend(resolver)
+        backend.inner = Inner()
+        # httpcore passes the ASCII host from the request URL
+        await backend.connect_tcp(httpx.URL("https://bücher.example/").raw_host.decode("ascii"), 443)
+
+    asyncio.run(run())
+    assert looked_up == ["xn--bcher-kva.example"]
+    assert connected == [("203.0.113.7", 443)]
@@ -0,0 +1,54 @@
+# OOBSCClient: detections raised while an inhibit is being delivered are
+# sent after it, so every one of them reaches the OOBSC journal.
+import asyncio, json
+import httpx
+import oobsc_client
+from oobsc_client import OOBSCClient, CURRENT_AGENT
+
+def client_with(handler) -> OOBSCClient:
+    c = OOBSCClient("http://oobsc", "test")
+    c.client = httpx.AsyncClient(base_url="http://oobsc", transport=httpx.MockTransport(handler))
+    return c
+
+def test_coalesced_signals_are_journaled():
+    posted = []
+
+    async def handler(request):
+        posted.append(json.loads(request.content))
+        await asyncio.sleep(0.02)  # the first delivery is still in flight below
+        return httpx.Response(200, json={"inhibit": True})
+
+    async def run():
+        c = client_with(handler)
+        assert c.inhibit("first", "aws") is True
+        for i in range(3):
+            CURRENT_AGENT.set(f"agent-{i}")
+            assert c.inhibit(f"later {i}") is False
+        await c.close()
+        return c
+
+    c = asyncio.run(run())
+    assert [p["reason"] for p in posted] == ["first", "later 0", "later 1", "later 2"]
+    assert [p["agent"] for p in posted[1:]] == ["agent-0", "agent-1", "agent-2"]
+    assert len({p["trace"] for p in posted}) == 4
+    assert c.stats()["sent"] == 4 and c.stats()["queued"] == 0
+
+def test_queue_is_bounded(monkeypatch):
+    monkeypatch.setattr(oobsc_client, "QUEUE_MAX", 2)
+    posted = []
+
+    async def handler(request):
+        posted.append(json.loads(request.content)["reason"])
+        await asyncio.sleep(0.01)
+        return httpx.Response(200, json={"inhibit": True})
+
+    async def run():
+        c = client_with(handler)
+        for i in range(5):
+            c.inhibit(str(i))
+        await c.close()
+        return c
+
+    c = asyncio.run(run())
+    assert posted == ["0", "1", "2"]
+    assert c.stats()["dropped"] == 2
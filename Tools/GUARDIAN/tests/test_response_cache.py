@@ -0,0 +1,46 @@
+# Response cache: entries are keyed by the whole request, and a stale entry
+# evicted while it is being revalidated is still served.
+import asyncio
+import httpx
+import response_cache
+from response_cache import ResponseCache, cache_key, lifetime
+
+def test_key_covers_request_headers():
+    url = "https://httpbin.org/get"
+    assert cache_key(url, {"Accept": "text/html"}) != cache_key(url, {"Accept": "application/json"})
+    assert cache_key(url, {"X-A": "1", "Accept": "*/*"}) == cache_key(url, {"accept": "*/*", "x-a": "1"})
+    assert cache_key(url, {"Cache-Control": "max-age=0"}) == cache_key(url, None)
+
+def test_vary_stored_unless_star():
+    h = {"cache-control": "max-age=60"}
+    assert lifetime(200, {**h, "vary": "Accept-Encoding, Accept"}, 0) == 60
+    assert lifetime(200, {**h, "vary": "Accept, *"}, 0) is None
+
+def test_revalidated_entry_evicted_during_upstream_call(tmp_path, monkeypatch):
+    import egress_gateway as gw
+    cache = ResponseCache(cache_dir=str(tmp_path))
+    monkeypatch.setattr(gw, "CACHE", cache)
+    url = httpx.URL("http://httpbin.org/big")
+    req = gw.FetchReq(url=str(url))
+    key = cache_key(str(url), req.headers)
+    body = b"x" * (response_cache.MEM_ENTRY + 1)  # spills to a file
+    w = cache.writer(key, str(url), 200, httpx.Headers({"etag": '"v1"', "cache-control": "no-cache"}), 0.0)
+    w.write(body)
+    w.commit()
+    assert cache.entries[key].path
+
+    async def open_upstream(req, url, extra_headers=None):
+        assert extra_headers == {"if-none-match": '"v1"'}
+        cache.clear()  # evicted (spill file unlinked) while upstream answers
+        await asyncio.sleep(0)
+        return httpx.Response(304, headers={"cache-control": "max-age=60"}), None
+    monkeypatch.setattr(gw, "open_upstream", open_upstream)
+
+    async def run():
+        resp = await gw.fetch_cached(req, url, stream=True)
+        chunks = [c async for c in resp.body_iterator]
+        return resp, b"".join(chunks)
+
+    resp, got = asyncio.run(run())
+    assert resp.headers["x-guardian-cache"] == "revalidated"
+    assert got == body
@@ -0,0 +1,30 @@
+# Outbound decoy scan: tokens hidden behind any percent/plus encoding of the
+# URL or a form body are still found.
+from urllib.parse import quote
+import pytest
+import egress_gateway as gw
+from honeytoken_matcher import Matcher
+
+TOKEN = "AKIAFAKE/decoy+key=42"
+
+@pytest.fixture(autouse=True)
+def matcher(monkeypatch):
+    monkeypatch.setattr(gw, "MATCHER", Matcher({"aws": TOKEN}))
+
+def mixed(token: str) -> str:
+    # encodes every other character, unreserved ones included
+    return "".join(quote(c, safe="") if i % 2 else f"%{ord(c):02x}" for i, c in enumerate(token))
+
+def test_oddly_encoded_url():
+    req = gw.FetchReq(url=f"https://httpbin.org/get?k={mixed(TOKEN)}")
+    assert gw.scan_outbound(req) == ("aws", "plain")
+
+def test_form_body():
+    body = "user=a&secret=" + mixed(TOKEN).replace("%20", "+")
+    req = gw.FetchReq(url="https://httpbin.org/post", method="POST", body=body,
+                      headers={"Content-Type": "application/x-www-form-urlencoded"})
+    assert gw.scan_outbound(req) is not None
+
+def test_clean_request():
+    req = gw.FetchReq(url="https://httpbin.org/get?q=hello%20world", body="a=1&b=%2F")
+    assert gw.scan_outbound(req) is None
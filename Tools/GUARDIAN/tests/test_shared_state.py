@@ -0,0 +1,119 @@
+# SharedStateClient against a real state server process: every worker sees
+# the same inhibit value, and losing the server fails closed until the
+# client reconnects.
+import asyncio, os, signal, subprocess, sys, time
+import pytest
+import shared_state
+from shared_state import SharedStateClient
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def spawn(sock: str) -> subprocess.Popen:
+    env = {**os.environ, "STATE_DIR": "", "HEARTBEAT_UDP_PORT": "0"}
+    proc = subprocess.Popen([sys.executable, "-c", "import sys; from shared_state import run_state_server; "
+                             "run_state_server(sys.argv[1])", sock],
+                            cwd=os.path.join(ROOT, "oobsc"), env=env)
+    deadline = time.time() + 10
+    while not os.path.exists(sock):
+        assert proc.poll() is None and time.time() < deadline, "state server failed to start"
+        time.sleep(0.02)
+    return proc
+
+def stop(proc: subprocess.Popen):
+    if proc.poll() is None:
+        proc.terminate()
+        proc.wait(5)
+
+@pytest.fixture
+def sock(tmp_path):
+    return str(tmp_path / "state.sock")
+
+async def until(cond, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not cond():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+def test_workers_share_inhibit(sock):
+    server = spawn(sock)
+
+    async def run():
+        seen = []
+        a, b = SharedStateClient(sock), SharedStateClient(sock, on_change=seen.append)
+        await a.start(); await b.start()
+        try:
+            for i in range(20):
+                ev = await a.set_inhibit(i % 2 == 0, event={"source": "test"})
+                # visible to the other worker as soon as the call returns
+                assert b.inhibit_event()["inhibit"] == ev["inhibit"]
+                assert b.inhibit_event()["version"] == ev["version"]
+            await until(lambda: len(seen) == 20)
+            assert [e["version"] for e in seen] == list(range(1, 21))
+            a.beat_many([f"agent-{i}" for i in range(50)])
+            for _ in range(100):  # beats are flushed in batches
+                if (await b.status(limit=0))["alive"] == 50:
+                    break
+                await asyncio.sleep(0.01)
+            assert (await b.status(limit=0))["alive"] == 50
+        finally:
+            await a.stop(); await b.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        stop(server)
+
+def test_fails_closed_and_reconnects(sock, monkeypatch):
+    monkeypatch.setattr(shared_state, "RECONNECT_MAX_SEC", 0.1)
+    server = spawn(sock)
+
+    async def run():
+        nonlocal server
+        seen = []
+        c = SharedStateClient(sock, on_change=seen.append)
+        await c.start()
+        try:
+            await c.set_inhibit(True)
+            server.kill(); server.wait()
+            await until(lambda: not c.connected)
+            assert c.inhibit_event()["inhibit"] is True
+            with pytest.raises(ConnectionError):
+                await c.status(limit=0)
+            c.beat_many(["a"] * 1000)  # nowhere to go: dropped, not buffered
+            assert c.dropped_beats == 1000 and not c._beats
+
+            server = spawn(sock)  # in-memory state: starts clear again
+            await until(lambda: c.connected and seen[-1]["version"] == 0)
+            assert seen[-1] == {"inhibit": False, "version": 0}
+            ev = await c.set_inhibit(True)
+            assert ev["version"] == 1 and c.inhibit_event()["inhibit"] is True
+        finally:
+            await c.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        stop(server)
+
+def test_timeout_clears_pending(sock, monkeypatch):
+    monkeypatch.setattr(shared_state, "RPC_TIMEOUT", 0.2)
+    server = spawn(sock)
+
+    async def run():
+        c = SharedStateClient(sock)
+        await c.start()
+        try:
+            server.send_signal(signal.SIGSTOP)
+            with pytest.raises(asyncio.TimeoutError):
+                await c.stats()
+            assert not c._pending
+            server.send_signal(signal.SIGCONT)
+            assert "beats" in await c.stats()
+        finally:
+            await c.stop()
+
+    try:
+        asyncio.run(run())
+    finally:
+        server.send_signal(signal.SIGCONT)
+        stop(server)
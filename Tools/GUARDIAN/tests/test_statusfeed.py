@@ -0,0 +1,30 @@
+# StatusFeed: invalidate() during a collect must not let the older probe
+# results stand as the current snapshot.
+import asyncio
+from statusfeed import StatusFeed
+
+def test_invalidate_during_collect_starts_new_one():
+    async def run():
+        state = {"inhibit": False}
+        started = []
+
+        async def oobsc():
+            seen = dict(state)
+            started.append(seen["inhibit"])
+            await asyncio.sleep(0.05)
+            return seen
+
+        feed = StatusFeed({"oobsc": oobsc}, ttl=60)
+        first = asyncio.ensure_future(feed.get())
+        await asyncio.sleep(0.01)  # probe has read inhibit=False
+        state["inhibit"] = True
+        feed.invalidate()
+        snap = await feed.get()
+        assert snap["oobsc"]["data"]["inhibit"] is True
+        assert (await first)["oobsc"]["data"]["inhibit"] is False
+        # the older collect landed last but did not replace the cached one
+        await asyncio.sleep(0.06)
+        assert (await feed.get())["oobsc"]["data"]["inhibit"] is True
+        assert started == [False, True] and feed.version == 1
+
+    asyncio.run(run())
@@ -0,0 +1,37 @@
+# Supervisor: an inhibit pushed while children are being launched must not
+# leave them running.
+import asyncio
+from supervisor import Supervisor
+
+class SlowLaunch(Supervisor):
+    async def launch(self, child):
+        await asyncio.sleep(0)  # the push is handled while exec is in flight
+        if child is self.children[0]:
+            await self.pushed({"inhibit": True, "version": 1})
+        await super().launch(child)
+
+def test_inhibit_during_launch_kills_new_children():
+    async def run():
+        sup = SlowLaunch(n=3)
+        sup.live, sup.inhibit = True, False
+        sup.heartbeat = None  # must not be reached
+        await sup.step()
+        assert not any(c.running for c in sup.children)
+        assert len(sup.kill_log) == 3
+
+    asyncio.run(run())
+
+def test_launch_without_inhibit_heartbeats():
+    async def run():
+        sup = Supervisor(n=2)
+        sup.live, sup.inhibit = True, False
+        beats = []
+
+        async def heartbeat():
+            beats.append([c.name for c in sup.children if c.running])
+        sup.heartbeat = heartbeat
+        await sup.step()
+        assert beats and len(beats[0]) == 2
+        await sup.kill_all("test done")
+
+    asyncio.run(run())
@@ -0,0 +1,60 @@
+# UpstreamPools: origins are shared by every agent, so they must not carry
+# state from one caller to the next, and concurrent opens share one client.
+import asyncio
+import httpx
+import upstream_pool
+from upstream_pool import UpstreamPools
+
+def mock_transport(monkeypatch, handler):
+    monkeypatch.setattr(upstream_pool, "PoolTransport", lambda *a, **kw: httpx.MockTransport(handler))
+
+def test_cookies_not_shared_between_callers(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("cookie"))
+        if request.url.path == "/login":
+            return httpx.Response(302, headers={"set-cookie": "session=agent-a; Path=/",
+                                                "location": "/home"})
+        return httpx.Response(200, headers={"set-cookie": "tracker=1"})
+    mock_transport(monkeypatch, handler)
+
+    async def run():
+        pools = UpstreamPools(5)
+        try:
+            async with pools.slot("http://example.com/login") as client:
+                resp = await client.get("http://example.com/login")
+                # the redirect the caller follows must not carry it either
+                await client.send(resp.next_request)
+            async with pools.slot("http://example.com/data") as client:
+                await client.get("http://example.com/data")  # another agent
+            assert len(pools.origins) == 1 and not client.cookies
+        finally:
+            await pools.close()
+
+    asyncio.run(run())
+    assert seen == [None, None, None]
+
+def test_concurrent_open_shares_origin(monkeypatch):
+    mock_transport(monkeypatch, lambda request: httpx.Response(200))
+    monkeypatch.setattr(upstream_pool, "ORIGIN_MAX", 1)
+
+    async def run():
+        pools = UpstreamPools(5)
+        try:
+            async with pools.slot("http://old.example/"):
+                pass  # idle: the next open has to close it first
+            a, b = await asyncio.gather(pools._origin("http://new.example/"),
+                                        pools._origin("http://new.example/"))
+            assert a is b and list(pools.origins.values()) == [a]
+            # claimed, so a third origin cannot evict it before it is used
+            try:
+                await pools._origin("http://third.example/")
+            except upstream_pool.PoolBusy:
+                pass
+            else:
+                raise AssertionError("claimed origin was evicted")
+        finally:
+            await pools.close()
+
+    asyncio.run(run())
@@ -1,139 +1,233 @@
-import argparse, json
+import argparse, json, re, time
 from pathlib import Path
 import torch
 import numpy as np
 from transformers import AutoModelForCausalLM, AutoTokenizer
-from utils.visualize import save_json_trace, plot_token_probs, matplotlib_attention_quick
+from utils.visualize import save_json_trace, plot_token_probs, matplotlib_attention_quick, matplotlib_attention_grid
+from utils.processors import LogitsChain, RepetitionPenalty, NoRepeatNGram, BlockEarly, NucleusSampler, top_probs
+from utils.attention import AttentionRecorder
 import random
 
 def set_seed(s=42):
     random.seed(s); np.random.seed(s); torch.manual_seed(s);
     if torch.cuda.is_available(): torch.cuda.manual_seed_all(s)
 
-def softmax(x):
-    x = x - np.max(x)
-    e = np.exp(x)
-    return e / e.sum()
-
-def sample_top_p(logits_np, top_p=0.9, temperature=0.8, block_id=None):
-    """
-    Robust nucleus (top-p) sampling:
-    - applies temperature
-    - turns logits -> probs in a numerically stable way
-    - optionally blocks a token (e.g., EOS early)
-    - chooses the smallest prefix whose cumulative prob >= top_p
-    """
-    # temperature
-    if temperature and temperature != 1.0:
-        logits_np = logits_np / float(temperature)
-
-    # stable softmax
-    m = np.max(logits_np)
-    exp = np.exp(logits_np - m)
-    probs = exp / exp.sum()
-
-    # block a token (e.g., EOS)
-    if block_id is not None and 0 <= block_id < probs.size:
-        probs[block_id] = 0.0
-        s = probs.sum()
-        if s > 0:
-            probs /= s
-        else:
-            # fall back to uniform over all but blocked token
-            probs[:] = 1.0 / (probs.size - 1)
-            probs[block_id] = 0.0
-
-    # sort by prob desc
-    sorted_idx = np.argsort(-probs)
-    sorted_probs = probs[sorted_idx]
-
-    # cumulative sum and choose cutoff length k
-    cumsum = np.cumsum(sorted_probs)
-    # index where cumulative prob first exceeds top_p
-    k = int(np.searchsorted(cumsum, top_p, side="left")) + 1
-    if k < 1:
-        k = 1
-    if k > sorted_probs.size:
-        k = sorted_probs.size
-
-    keep = sorted_idx[:k]
-    keep_probs = probs[keep]
-    keep_probs = keep_probs / keep_probs.sum()  # renormalize
-
-    choice = int(np.random.choice(keep, p=keep_probs))
-    return choice, probs
-
-def build_blocklist(tokenizer, vocab_size: int, step: int, eos_id: int,
-                    block_eos_steps: int, block_ws_steps: int):
-    """
-    Returns a boolean mask of length vocab_size indicating which tokens to block at this step.
-    We only block EOS early and tokens that decode to pure whitespace (e.g., '\n', '   ').
-    """
-    mask = np.zeros(vocab_size, dtype=bool)
-    if eos_id is not None and step <= block_eos_steps:
-        mask[eos_id] = True
-
-    if step <= block_ws_steps:
-        # Cheap way: block a few common whitespace tokens explicitly
-        common_ws = []
-        try:
-            common_ws += tokenizer.encode("\n")          # GPT-2: [198]
-            common_ws += tokenizer.encode("\n\n")        # often two newlines
-            common_ws += tokenizer.encode(" ")           # space-only token(s)
-            common_ws += tokenizer.encode("\t")
-        except Exception:
-            pass
-        for tid in common_ws:
-            if 0 <= tid < vocab_size:
-                mask[tid] = True
-    return mask
-
-def apply_repetition_penalty(logits, generated_ids, penalty=1.1):
-    # decrease logits of tokens we've already used
-    if penalty <= 1.0 or generated_ids is None or generated_ids.numel() == 0:
-        return logits
-    unique_ids = torch.unique(generated_ids)
-    logits[unique_ids] /= penalty
-    return logits
-
-def banned_ngrams(generated_ids: torch.Tensor, n: int):
-    """
-    Build a dict mapping (n-1)-gram tuples -> set of next-token ids that would repeat an n-gram.
-    generated_ids: [seq_len] tensor of ints
-    """
-    if n <= 1 or generated_ids.numel() < n:
-        return {}
-    seq = generated_ids.tolist()
-    bans = {}
-    for i in range(len(seq) - n + 1):
-        prefix = tuple(seq[i:i + n - 1])
-        nxt = seq[i + n - 1]
-        s = bans.get(prefix)
-        if s is None:
-            bans[prefix] = {nxt}
-        else:
-            s.add(nxt)
-    return bans
-
-def apply_no_repeat_ngram(logits_np: np.ndarray, generated_ids: torch.Tensor, n: int):
-    """Zero out logits that would complete a seen n-gram."""
-    if n <= 1 or generated_ids.numel() < n - 1:
-        return logits_np
-    bans = banned_ngrams(generated_ids, n)
-    if not bans:
-        return logits_np
-    prefix = tuple(generated_ids[-(n-1):].tolist())
-    if prefix in bans:
-        logits_np = logits_np.copy()
-        for tid in bans[prefix]:
-            if 0 <= tid < logits_np.shape[0]:
-                logits_np[tid] = -1e9
-    return logits_np
+def whitespace_ids(tokenizer):
+    """Tokens that decode to pure whitespace, blocked early (e.g. '\\n', '   ')."""
+    # Cheap way: block a few common whitespace tokens explicitly
+    common_ws = []
+    try:
+        common_ws += tokenizer.encode("\n")          # GPT-2: [198]
+        common_ws += tokenizer.encode("\n\n")        # often two newlines
+        common_ws += tokenizer.encode(" ")           # space-only token(s)
+        common_ws += tokenizer.encode("\t")
+    except Exception:
+        pass
+    return common_ws
+
+def build_pipeline(args, tokenizer):
+    """Logits chain and sampler shared by the single-prompt and batch paths:
+    repetition penalty, no-repeat n-gram, early EOS/whitespace block, then
+    top-p with temperature."""
+    chain = LogitsChain([
+        RepetitionPenalty(args.repetition_penalty),
+        NoRepeatNGram(args.no_repeat_ngram_size),
+        BlockEarly(tokenizer.eos_token_id, args.block_eos_steps, whitespace_ids(tokenizer), args.block_ws_steps),
+    ])
+    return chain, NucleusSampler(top_p=args.top_p, temperature=args.temperature, log_k=args.topk)
+
+def make_recorder(args, model, rows: int, prompt_len: int, device):
+    """Attention buffers sized for the prompt plus, with --attn_every, every new token."""
+    cfg = model.config
+    capacity = prompt_len + (args.max_new_tokens if args.attn_every else 0)
+    return AttentionRecorder(rows, capacity, cfg.num_hidden_layers, cfg.num_attention_heads,
+                             layers=args.attn_layers, heads=args.attn_heads, device=device)
+
+def save_attention(recorder, attn, labels, stem: Path):
+    """[T, T] -> <stem>.png; [layers, heads, T, T] -> <stem>_L<layer>.png with one panel per head."""
+    if attn.ndim == 2:
+        matplotlib_attention_quick(attn, labels, labels, f"{stem}.png")
+        return
+    sel = recorder.describe()
+    layers = ["mean"] if sel["layers"] == "mean" else sel["layers"]
+    heads = sel["heads"] if isinstance(sel["heads"], list) else (
+        [sel["heads"]] if attn.shape[1] == 1 else list(range(attn.shape[1])))
+    for layer, per_head in zip(layers, attn):
+        matplotlib_attention_grid(per_head, labels, [f"layer {layer} head {h}" for h in heads],
+                                  f"{stem}_L{layer}.png")
+
+def wrap_cache(past_key_values):
+    try:
+        from transformers import DynamicCache
+    except Exception:
+        return past_key_values
+    if hasattr(DynamicCache, "from_legacy_cache") and isinstance(past_key_values, tuple):
+        return DynamicCache.from_legacy_cache(past_key_values)
+    return past_key_values
+
+def select_cache(cache, keep: torch.Tensor):
+    """Keep only the batch rows in `keep` (retiring finished sequences)."""
+    if hasattr(cache, "batch_select_indices"):
+        cache.batch_select_indices(keep)
+        return cache
+    if hasattr(cache, "reorder_cache"):
+        cache.reorder_cache(keep)
+        return cache
+    return tuple(tuple(t.index_select(0, keep) for t in layer) for layer in cache)
+
+def keep_rows(keep: list[int], cache, chain, *tensors):
+    """Retire every batch row not in `keep` from the cache, the processors'
+    state and `tensors` -> (cache, *tensors)."""
+    idx = torch.tensor(keep, device=tensors[0].device)
+    chain.select(idx)
+    return (select_cache(cache, idx), *(t[idx] for t in tensors))
+
+def read_prompts(path: str):
+    """JSONL: one prompt per line, either a string or {"prompt": ..., "id": ...}."""
+    items = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            row = json.loads(line)
+            if isinstance(row, str):
+                row = {"prompt": row}
+            idx = f"{len(items):04d}"
+            items.append({"id": str(row.get("id", idx)), "prompt": row["prompt"]})
+    return items
+
+def decode_batch(items, args, tokenizer, model, device):
+    """Decode several prompts together: left-padded, one shared KV cache,
+    rows retired from the batch as their sequences finish. Each sequence
+    samples from its own RandomState(seed), so its text matches a
+    single-prompt run with the same seed."""
+    enc = tokenizer([it["prompt"] for it in items], return_tensors="pt", padding=True)
+    input_ids = enc["input_ids"].to(device)
+    mask = enc["attention_mask"].to(device)
+    positions = (mask.long().cumsum(-1) - 1).clamp(min=0)
+
+    out = model(input_ids=input_ids, attention_mask=mask, position_ids=positions,
+                use_cache=True, output_attentions=True)
+    cache = wrap_cache(out.past_key_values)
+    logits = out.logits[:, -1, :]
+    top_ids, top_vals = top_probs(logits, args.topk)
+
+    pads = [input_ids.shape[1] - int(mask[b].sum()) for b in range(len(items))]
+    recorder = make_recorder(args, model, len(items), input_ids.shape[1], device)
+    recorder.record_prompt(out.attentions, pads)
+
+    rows = []
+    for b, it in enumerate(items):
+        ids = input_ids[b, pads[b]:]
+        step0 = {
+            "step": 0,
+            "generated_token": None,
+            "topk_tokens": [tokenizer.decode([i]) for i in top_ids[b].tolist()],
+            "topk_probs": top_vals[b].tolist(),
+            recorder.key: recorder.snapshot(b).tolist(),
+            "tokens": tokenizer.convert_ids_to_tokens(ids)
+        }
+        trace = {"model": args.model, "id": it["id"], "prompt": it["prompt"],
+                 "attention": recorder.describe(), "steps": [step0]}
+        rows.append({"trace": trace,
+                     "generated": ids.clone(), "rng": np.random.RandomState(args.seed), "new_tokens": 0})
+
+    chain, sampler = build_pipeline(args, tokenizer)
+    chain.start([r["generated"] for r in rows], logits.shape[-1])
+    active = list(range(len(items)))  # batch row -> index into rows
+    positions = positions[:, -1:]
+    for step in range(1, args.max_new_tokens + 1):
+        next_ids, top_ids, top_vals = sampler.sample(chain(logits, step), [rows[b]["rng"] for b in active])
+        chain.append(next_ids)
+        keep = []
+        for j, b in enumerate(active):
+            r = rows[b]
+            next_id = next_ids[j]
+            r["generated"] = torch.cat([r["generated"], torch.tensor([next_id], device=device)])
+            r["new_tokens"] += 1
+            r["trace"]["steps"].append({
+                "step": step,
+                "generated_token": tokenizer.decode([next_id]),
+                "topk_tokens": [tokenizer.decode([i]) for i in top_ids[j].tolist()],
+                "topk_probs": top_vals[j].tolist()
+            })
+            decoded = tokenizer.decode(r["generated"], skip_special_tokens=True)
+            if not (step >= args.min_new_tokens and decoded.strip().endswith(".")):
+                keep.append(j)
+        done = not keep or step == args.max_new_tokens
+        # A snapshot due at this step includes this step's token, so finishing
+        # rows go through one more forward pass then (as in a single-prompt
+        # run); otherwise they are retired before it.
+        snap = bool(args.attn_every) and step % args.attn_every == 0
+        if done and not snap:
+            break
+
+        next_tokens = torch.tensor(next_ids, device=device).unsqueeze(1)
+        retiring = len(keep) < len(active)
+        if retiring and not snap:
+            cache, mask, positions, next_tokens = keep_rows(keep, cache, chain, mask, positions, next_tokens)
+            active, retiring = [active[j] for j in keep], False
+        mask = torch.cat([mask, mask.new_ones((mask.shape[0], 1))], dim=1)
+        positions = positions + 1
+        out = model(input_ids=next_tokens, attention_mask=mask, position_ids=positions,
+                    past_key_values=cache, use_cache=True, output_attentions=bool(args.attn_every))
+        cache = out.past_key_values
+        logits = out.logits[:, -1, :]
+        if args.attn_every:
+            recorder.record_step(out.attentions, active)
+            if snap:
+                for b in active:
+                    rows[b]["trace"]["steps"][-1][recorder.key] = recorder.snapshot(b).tolist()
+        if done:
+            break
+        if retiring:
+            cache, mask, positions, logits = keep_rows(keep, cache, chain, mask, positions, logits)
+            active = [active[j] for j in keep]
+    return rows
+
+def run_batch(args, tokenizer, model, device, outdir: Path):
+    items = read_prompts(args.prompts)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    # similar lengths share a batch, so little compute goes to padding
+    lengths = [len(tokenizer(it["prompt"])["input_ids"]) for it in items]
+    order = sorted(range(len(items)), key=lambda i: lengths[i])
+
+    total_new, started = 0, time.perf_counter()
+    summary = []
+    with torch.no_grad():
+        for k in range(0, len(order), args.batch_size):
+            batch = [items[i] for i in order[k:k + args.batch_size]]
+            for it, r in zip(batch, decode_batch(batch, args, tokenizer, model, device)):
+                text = tokenizer.decode(r["generated"], skip_special_tokens=True)
+                target = outdir / re.sub(r"[^\w.-]", "_", it["id"])
+                target.mkdir(parents=True, exist_ok=True)
+                save_json_trace(str(target / "trace.json"), r["trace"])
+                with open(target / "output.txt", "w", encoding="utf-8") as f:
+                    f.write(text)
+                summary.append({"id": it["id"], "prompt": it["prompt"], "text": text,
+                                "new_tokens": r["new_tokens"], "trace": str(target / "trace.json")})
+                total_new += r["new_tokens"]
+            print(f"[batch] {min(k + args.batch_size, len(order))}/{len(order)} prompts", flush=True)
+    elapsed = time.perf_counter() - started
+
+    summary.sort(key=lambda row: row["id"])
+    with open(outdir / "batch.jsonl", "w", encoding="utf-8") as f:
+        for row in summary:
+            f.write(json.dumps(row, ensure_ascii=False) + "\n")
+    print(f"\nDecoded {len(items)} prompts, {total_new} new tokens in {elapsed:.1f}s "
+          f"({total_new / max(elapsed, 1e-9):.1f} tokens/s, batch size {args.batch_size})")
+    print(f"- Per-prompt traces: {outdir}/<id>/trace.json")
+    print(f"- Summary: {outdir / 'batch.jsonl'}")
 
 def main():
     p = argparse.ArgumentParser(description="Model Interpret Explorer")
     p.add_argument("--model", default="distilgpt2", help="HF model id (CPU friendly default)")
-    p.add_argument("--prompt", required=True, help="Input prompt")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--prompt", help="Input prompt")
+    src.add_argument("--prompts", help="JSONL file of prompts, decoded in batches (one trace each)")
+    p.add_argument("--batch_size", type=int, default=8, help="Prompts decoded together with --prompts")
     p.add_argument("--max_new_tokens", type=int, default=30)
     p.add_argument("--topk", type=int, default=20)
     p.add_argument("--no_repeat_ngram_size", type=int, default=3)
@@ -142,7 +236,9 @@ def main():
     p.add_argument("--block_eos_steps", type=int, default=5, help="Block EOS for first N steps")
     p.add_argument("--block_ws_steps", type=int, default=8, help="Block pure-whitespace/newline tokens for first N steps")
     p.add_argument("--outdir", default="tools/model-interpret-explorer/examples")
-    p.add_argument("--attn_every", type=int, default=0, help="Recompute & save full attention every N steps (0=off)")
+    p.add_argument("--attn_every", type=int, default=0, help="Save an attention snapshot every N steps (0=off)")
+    p.add_argument("--attn_layers", default="-1", help="Layers to keep: indices like -1 or 0,6,-1, 'all', or 'mean' (avg of all)")
+    p.add_argument("--attn_heads", default="mean", help="Heads: 'mean', 'max', 'all' (one map per head), or indices like 0,3")
     p.add_argument("--top_p", type=float, default=0.9)
     p.add_argument("--temperature", type=float, default=0.8)
     p.add_argument("--seed", type=int, default=42)
@@ -155,40 +251,40 @@ def main():
     tokenizer = AutoTokenizer.from_pretrained(args.model, use_fast=True)
     model = AutoModelForCausalLM.from_pretrained(args.model, output_attentions=True)
     model.to(device).eval()
+    try:
+        make_recorder(args, model, 0, 0, device)
+    except ValueError as e:
+        p.error(str(e))
+
+    if args.prompts:
+        run_batch(args, tokenizer, model, device, outdir)
+        return
 
     enc = tokenizer(args.prompt, return_tensors="pt")
     input_ids = enc["input_ids"].to(device)
 
-    trace = {"model": args.model, "prompt": args.prompt, "steps": []}
+    recorder = make_recorder(args, model, 1, input_ids.shape[1], device)
+    trace = {"model": args.model, "prompt": args.prompt, "attention": recorder.describe(), "steps": []}
 
     with torch.no_grad():
         # Initial forward pass on the prompt
         out = model(input_ids=input_ids, use_cache=True, output_attentions=True)
-        try:
-            from transformers import DynamicCache
-            HAS_DYNCACHE = True
-        except Exception:
-            HAS_DYNCACHE = False
-
-        cache = (DynamicCache.from_legacy_cache(out.past_key_values) if HAS_DYNCACHE and hasattr(DynamicCache, "from_legacy_cache")
-                 else out.past_key_values)
-        logits = out.logits[:, -1, :].squeeze(0).detach().cpu().numpy()
-
-        probs = softmax(logits)
-        topk_idx = probs.argsort()[::-1][:args.topk]
-        topk_tokens = [tokenizer.decode([i]) for i in topk_idx]
-        topk_probs = probs[topk_idx].tolist()
-
-        # attention over prompt (avg heads, last layer)
-        attn_layers = out.attentions
-        final_layer_attn = attn_layers[-1][0].mean(dim=0).detach().cpu().numpy()
+        cache = wrap_cache(out.past_key_values)
+        logits = out.logits[:, -1, :]
+
+        top_ids, top_vals = top_probs(logits, args.topk)
+        topk_tokens = [tokenizer.decode([i]) for i in top_ids[0].tolist()]
+        topk_probs = top_vals[0].tolist()
+
+        # attention over prompt (avg heads, last layer by default; see --attn_layers/--attn_heads)
+        recorder.record_prompt(out.attentions, [0])
         tokens_prompt = tokenizer.convert_ids_to_tokens(input_ids[0])
         step0 = {
             "step": 0,
             "generated_token": None,
             "topk_tokens": topk_tokens,
             "topk_probs": topk_probs,
-            "attention_avg_final_layer": final_layer_attn.tolist(),
+            recorder.key: recorder.snapshot(0).tolist(),
             "tokens": tokens_prompt
         }
         trace["steps"].append(step0)
@@ -197,57 +293,45 @@ def main():
 
         decoded = tokenizer.decode(generated[0], skip_special_tokens=True)
 
+        # global numpy RNG (seeded by set_seed), as before the torch pipeline
+        chain, sampler = build_pipeline(args, tokenizer)
+        chain.start([generated[0]], logits.shape[-1])
+
         for step in range(1, args.max_new_tokens + 1):
-            # 1) repetition penalty → logits_np
-            logits_t = torch.from_numpy(logits).to(device)
-            logits_t = apply_repetition_penalty(logits_t, generated[0], penalty=args.repetition_penalty)
-            logits_np = logits_t.detach().cpu().numpy()
-
-            # 2) no-repeat n-gram
-            logits_np = apply_no_repeat_ngram(logits_np, generated[0], n=args.no_repeat_ngram_size)
-
-            # 3) block EOS/whitespace early
-            eos_id = tokenizer.eos_token_id
-            block_mask = build_blocklist(tokenizer, logits_np.shape[-1], step, eos_id,
-                                         args.block_eos_steps, args.block_ws_steps)
-            logits_blocked = logits_np.copy()
-            logits_blocked[block_mask] = -1e9
-
-            # 3) sample next token
-            next_id, probs = sample_top_p(
-                logits_blocked, top_p=args.top_p, temperature=args.temperature, block_id=None
-            )
+            # adjust logits (see build_pipeline) and sample
+            next_ids, top_ids, top_vals = sampler.sample(chain(logits, step), [np.random])
+            next_id = next_ids[0]
+            chain.append(next_ids)
 
             next_token = torch.tensor([[next_id]], device=device)
             generated = torch.cat([generated, next_token], dim=1)
 
             out = model(input_ids=next_token, use_cache=True, past_key_values=cache, output_attentions=bool(args.attn_every))
             cache = out.past_key_values  # DynamicCache or tuple depending on version
-            logits = out.logits[:, -1, :].squeeze(0).detach().cpu().numpy()
+            logits = out.logits[:, -1, :]
+            if args.attn_every:
+                recorder.record_step(out.attentions, [0])  # the new token's row
 
             # log this step
-            topk_idx = probs.argsort()[::-1][:args.topk]
             step_entry = {
                 "step": step,
                 "generated_token": tokenizer.decode([next_id]),
-                "topk_tokens": [tokenizer.decode([i]) for i in topk_idx],
-                "topk_probs": probs[topk_idx].tolist()
+                "topk_tokens": [tokenizer.decode([i]) for i in top_ids[0].tolist()],
+                "topk_probs": top_vals[0].tolist()
             }
 
             if step % 10 == 0:
                 plot_token_probs(step_entry["topk_tokens"], step_entry["topk_probs"],
                                  str(outdir / f"probs_step_{step}.png"), topk=args.topk)
 
-            # Optional full attention snapshot
+            # Optional attention snapshot (rows already recorded step by step)
             if args.attn_every and step % args.attn_every == 0:
-                out_full = model(input_ids=generated, output_attentions=True, use_cache=False)
-                attn_layers = out_full.attentions
-                final_attn = attn_layers[-1][0].mean(dim=0).detach().cpu().numpy()
-                step_entry["attention_avg_final_layer"] = final_attn.tolist()
+                final_attn = recorder.snapshot(0)
+                step_entry[recorder.key] = final_attn.tolist()
                 labels = tokenizer.convert_ids_to_tokens(generated[0])
                 labels = [tokenizer.convert_tokens_to_string([t]).replace("\n", "\\n") for t in labels]
                 labels = [l if len(l) <= 12 else l[:11] + "…" for l in labels]
-                matplotlib_attention_quick(final_attn, labels, labels, str(outdir / f"attn_step_{step}.png"))
+                save_attention(recorder, final_attn, labels, outdir / f"attn_step_{step}")
 
             trace["steps"].append(step_entry)
 
@@ -262,9 +346,9 @@ def main():
     plot_token_probs(final["topk_tokens"], final["topk_probs"], str(outdir / "final_step_token_probs.png"), topk=args.topk)
 
     # initial prompt attention heatmap
-    attn0 = np.array(trace["steps"][0]["attention_avg_final_layer"])
+    attn0 = np.array(trace["steps"][0][recorder.key])
     tokens = [t if len(t) <= 10 else t[:9] + "…" for t in trace["steps"][0]["tokens"]]
-    matplotlib_attention_quick(attn0, tokens, tokens, str(outdir / "prompt_attention_heatmap.png"))
+    save_attention(recorder, attn0, tokens, outdir / "prompt_attention_heatmap")
 
     text = tokenizer.decode(generated[0], skip_special_tokens=True)
     print("\n=== Generated Text ===\n")
@@ -0,0 +1,4 @@
+# The explorer runs from its own directory; import utils the same way.
+import os, sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
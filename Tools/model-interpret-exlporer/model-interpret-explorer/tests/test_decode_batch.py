@@ -0,0 +1,53 @@
+# decode_batch with --attn_every: every due snapshot is recorded, including
+# the step a prompt stops at, and matches a run of that prompt alone.
+import types
+import numpy as np
+import pytest
+import torch
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+import explorer
+
+WORDS = ["<eos>", "a", "b", "c", "d", ".", "e", "f"] + [f"w{i}" for i in range(40)]
+ITEMS = [{"id": str(i), "prompt": p} for i, p in enumerate(["a b c", "d e", "f w1 w2 w3", "w4"])]
+
+@pytest.fixture(scope="module")
+def tiny():
+    tok = Tokenizer(models.WordLevel({w: i for i, w in enumerate(WORDS)}, unk_token="a"))
+    tok.pre_tokenizer = pre_tokenizers.WhitespaceSplit()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<eos>", pad_token="<eos>")
+    tokenizer.padding_side = "left"
+    torch.manual_seed(0)
+    cfg = GPT2Config(vocab_size=len(WORDS), n_layer=2, n_head=2, n_embd=16, n_positions=64,
+                     bos_token_id=0, eos_token_id=0, output_attentions=True, attn_implementation="eager")
+    model = GPT2LMHeadModel(cfg).eval()
+    with torch.no_grad():
+        model.lm_head.weight[WORDS.index(".")] += 0.3  # prompts stop at different steps
+    return tokenizer, model
+
+def args(**kw):
+    return types.SimpleNamespace(**{
+        "model": "tiny", "topk": 3, "attn_every": 1, "attn_layers": "-1", "attn_heads": "mean",
+        "max_new_tokens": 12, "min_new_tokens": 1, "seed": 3, "repetition_penalty": 1.0,
+        "no_repeat_ngram_size": 0, "block_eos_steps": 0, "block_ws_steps": 0, "top_p": 0.9,
+        "temperature": 1.0, **kw})
+
+def decode(tiny, items, **kw):
+    with torch.no_grad():
+        return explorer.decode_batch(items, args(**kw), *tiny, "cpu")
+
+@pytest.mark.parametrize("every", [1, 2, 3])
+def test_snapshots_include_last_step(tiny, every):
+    rows = decode(tiny, ITEMS, attn_every=every)
+    assert len({r["new_tokens"] for r in rows}) > 1  # some rows retire early
+    plain = decode(tiny, ITEMS, attn_every=0)
+    for it, r, p in zip(ITEMS, rows, plain):
+        assert torch.equal(r["generated"], p["generated"])
+        steps = r["trace"]["steps"]
+        snapped = [s["step"] for s in steps[1:] if "attention_avg_final_layer" in s]
+        assert snapped == [s for s in range(1, r["new_tokens"] + 1) if s % every == 0]
+        alone = decode(tiny, [it], attn_every=every)[0]["trace"]["steps"]
+        for s, a in zip(steps[1:], alone[1:]):
+            if "attention_avg_final_layer" in s:
+                np.testing.assert_allclose(s["attention_avg_final_layer"], a["attention_avg_final_layer"],
+                                           atol=1e-5)
@@ -0,0 +1,39 @@
+# NucleusSampler against the numpy sampler it replaced: seeded runs must
+# draw the same tokens, including rows whose nucleus spans most of the
+# vocabulary (flat logits fall back to the full ranking).
+import numpy as np
+import pytest
+import torch
+from utils.processors import NucleusSampler
+
+VOCAB = 50257  # GPT-2
+
+def sample_top_p(logits_np, top_p=0.9, temperature=0.8, rng=np.random):
+    """The original explorer.sample_top_p (without block_id)."""
+    if temperature and temperature != 1.0:
+        logits_np = logits_np / float(temperature)
+    m = np.max(logits_np)
+    exp = np.exp(logits_np - m)
+    probs = exp / exp.sum()
+    sorted_idx = np.argsort(-probs)
+    sorted_probs = probs[sorted_idx]
+    cumsum = np.cumsum(sorted_probs)
+    k = int(np.searchsorted(cumsum, top_p, side="left")) + 1
+    k = min(max(k, 1), sorted_probs.size)
+    keep = sorted_idx[:k]
+    keep_probs = probs[keep]
+    keep_probs = keep_probs / keep_probs.sum()
+    return int(rng.choice(keep, p=keep_probs))
+
+@pytest.mark.parametrize("scale", [1.0, 1.5, 4.0])
+def test_matches_numpy_sampler(scale):
+    # near-ties in flat rows are rare: 50 steps x 8 rows diverged once at
+    # scales 1.0 and 1.5 when the fallback re-ranked torch's softmax
+    gen = np.random.RandomState(1)
+    sampler = NucleusSampler(top_p=0.9, temperature=0.8)
+    for step in range(50):
+        logits = (gen.randn(8, VOCAB) * scale).astype(np.float32)
+        ours = [np.random.RandomState(step * 8 + b) for b in range(8)]
+        ref = [np.random.RandomState(step * 8 + b) for b in range(8)]
+        next_ids, _ids, _vals = sampler.sample(torch.from_numpy(logits.copy()), ours)
+        assert next_ids == [sample_top_p(logits[b], rng=ref[b]) for b in range(8)], f"step {step}"
@@ -0,0 +1,84 @@
+# tools/model-interpret-explorer/utils/attention.py
+# Attention capture for snapshots without re-running the sequence. The
+# prompt pass fills the top-left block of a preallocated [T, T] matrix per
+# row; every cached decode step then adds one row (the new token attending
+# to everything before it). A snapshot is just the filled block.
+#
+# Only the selected layers/heads are reduced and kept:
+#   layers: "-1" (default), comma-separated indices (negative from the end),
+#           "all", or "mean" (average over all layers)
+#   heads:  "mean" (default), "max", "all" (one matrix per head), or
+#           comma-separated head indices
+from typing import List
+import torch
+
+def _parse_ids(spec: str, count: int, what: str) -> List[int]:
+    try:
+        ids = [int(x) for x in spec.split(",") if x.strip()]
+    except ValueError:
+        raise ValueError(f"bad {what} spec {spec!r}")
+    if not ids or any(not -count <= i < count for i in ids):
+        raise ValueError(f"{what} spec {spec!r} out of range (model has {count})")
+    return [i % count for i in ids]
+
+class AttentionRecorder:
+    def __init__(self, rows: int, capacity: int, num_layers: int, num_heads: int,
+                 layers: str = "-1", heads: str = "mean", device="cpu"):
+        self.layer_mean = layers == "mean"
+        self.layers = list(range(num_layers)) if layers in ("all", "mean") else _parse_ids(layers, num_layers, "layer")
+        self.heads = heads
+        self.head_ids = None if heads in ("mean", "max", "all") else _parse_ids(heads, num_heads, "head")
+        n_layers = 1 if self.layer_mean else len(self.layers)
+        n_heads = {"mean": 1, "max": 1, "all": num_heads}.get(heads) or len(self.head_ids)
+        self.buf = torch.zeros((rows, n_layers, n_heads, capacity, capacity), device=device)
+        self.lengths = [0] * rows
+        self.default = layers == "-1" and heads == "mean"
+
+    @property
+    def key(self) -> str:
+        """Trace field for snapshots; the old name when it still describes them."""
+        return "attention_avg_final_layer" if self.default else "attention"
+
+    def describe(self) -> dict:
+        return {"layers": "mean" if self.layer_mean else self.layers,
+                "heads": self.head_ids if self.head_ids is not None else self.heads}
+
+    def _reduce(self, attentions) -> torch.Tensor:
+        """Per-layer [B, H, q, k] -> [B, layers, heads, q, k] (float32)."""
+        a = torch.stack([attentions[l] for l in self.layers], dim=1).float()
+        if self.layer_mean:
+            a = a.mean(dim=1, keepdim=True)
+        if self.heads == "mean":
+            a = a.mean(dim=2, keepdim=True)
+        elif self.heads == "max":
+            a = a.amax(dim=2, keepdim=True)
+        elif self.head_ids is not None:
+            a = a[:, :, self.head_ids]
+        return a
+
+    def record_prompt(self, attentions, pads: List[int]):
+        """Prompt pass: row b's tokens start at column pads[b] (left padding)."""
+        a = self._reduce(attentions)
+        width = a.shape[-1]
+        for b, pad in enumerate(pads):
+            n = width - pad
+            self.buf[b, :, :, :n, :n] = a[b, :, :, pad:, pad:]
+            self.lengths[b] = n
+
+    def record_step(self, attentions, rows: List[int]):
+        """One cached step for batch rows `rows` (batch index j -> recorder row).
+        The key axis is left-padded, so row b's keys are the last n columns."""
+        a = self._reduce(attentions)
+        for j, b in enumerate(rows):
+            n = self.lengths[b] + 1
+            self.buf[b, :, :, n - 1, :n] = a[j, :, :, -1, -n:]
+            self.lengths[b] = n
+
+    def snapshot(self, b: int = 0):
+        """Attention so far for row b as numpy: [T, T] for a single
+        layer/head selection, else [layers, heads, T, T]."""
+        n = self.lengths[b]
+        m = self.buf[b, :, :, :n, :n]
+        if m.shape[0] == 1 and m.shape[1] == 1:
+            m = m[0, 0]
+        return m.detach().cpu().numpy()
@@ -0,0 +1,207 @@
+# tools/model-interpret-explorer/utils/processors.py
+# Logits processing for the decode loop, kept in torch on the model's device.
+# Every processor works on a [batch, vocab] tensor and keeps per-row state
+# that follows the batch: start() with each row's ids so far, append() the
+# sampled ids after every step, select() when finished rows are retired.
+from typing import List, Optional
+import numpy as np
+import torch
+
+BLOCKED = -1e9
+
+class LogitsProcessor:
+    def start(self, rows: List[torch.Tensor], vocab_size: int):
+        pass
+
+    def append(self, next_ids: List[int]):
+        pass
+
+    def select(self, keep: torch.Tensor):
+        pass
+
+    def __call__(self, logits: torch.Tensor, step: int) -> torch.Tensor:
+        return logits
+
+class RepetitionPenalty(LogitsProcessor):
+    """Divides the logit of every token already in the row by `penalty`.
+    Only the (row, token) pairs seen so far are touched, so a step costs
+    the number of distinct tokens, not batch x vocab."""
+
+    def __init__(self, penalty: float = 1.1):
+        self.penalty = penalty
+        self.seen: List[set] = []
+        self.rows: List[int] = []
+        self.cols: List[int] = []
+
+    def start(self, rows, vocab_size):
+        self.seen = [set(ids.tolist()) for ids in rows]
+        self._index()
+
+    def _index(self):
+        self.rows = [b for b, ids in enumerate(self.seen) for _ in ids]
+        self.cols = [t for ids in self.seen for t in ids]
+
+    def append(self, next_ids):
+        for b, tid in enumerate(next_ids):
+            if tid not in self.seen[b]:
+                self.seen[b].add(tid)
+                self.rows.append(b)
+                self.cols.append(tid)
+
+    def select(self, keep):
+        self.seen = [self.seen[i] for i in keep.tolist()]
+        self._index()
+
+    def __call__(self, logits, step):
+        if self.penalty <= 1.0 or not self.rows:
+            return logits
+        rows = torch.tensor(self.rows, device=logits.device)
+        cols = torch.tensor(self.cols, device=logits.device)
+        logits[rows, cols] = logits[rows, cols] / self.penalty
+        return logits
+
+class NoRepeatNGram(LogitsProcessor):
+    """Blocks tokens that would repeat an n-gram already in the row. The
+    (n-1)-gram -> next-token index grows by one entry per step instead of
+    being rebuilt from the whole sequence."""
+
+    def __init__(self, n: int = 3):
+        self.n = n
+        self.history: List[List[int]] = []
+        self.bans: List[dict] = []
+
+    def start(self, rows, vocab_size):
+        self.history, self.bans = [], []
+        for ids in rows:
+            self.history.append([])
+            self.bans.append({})
+            for tid in ids.tolist():
+                self._push(len(self.history) - 1, tid)
+
+    def _push(self, b: int, tid: int):
+        hist = self.history[b]
+        if self.n > 1 and len(hist) >= self.n - 1:
+            self.bans[b].setdefault(tuple(hist[len(hist) - self.n + 1:]), set()).add(tid)
+        hist.append(tid)
+
+    def append(self, next_ids):
+        for b, tid in enumerate(next_ids):
+            self._push(b, tid)
+
+    def select(self, keep):
+        idx = keep.tolist()
+        self.history = [self.history[i] for i in idx]
+        self.bans = [self.bans[i] for i in idx]
+
+    def __call__(self, logits, step):
+        if self.n <= 1:
+            return logits
+        rows, cols = [], []
+        for b, hist in enumerate(self.history):
+            if len(hist) < self.n - 1:
+                continue
+            banned = self.bans[b].get(tuple(hist[len(hist) - self.n + 1:]))
+            if banned:
+                rows += [b] * len(banned)
+                cols += banned
+        if rows:
+            logits[rows, cols] = BLOCKED
+        return logits
+
+class BlockEarly(LogitsProcessor):
+    """Blocks EOS for the first `eos_steps` steps and the given whitespace
+    token ids for the first `ws_steps`. Ids are resolved once, up front."""
+
+    def __init__(self, eos_id: Optional[int], eos_steps: int, ws_ids: List[int], ws_steps: int):
+        self.eos_id = eos_id
+        self.eos_steps = eos_steps
+        self.ws_ids = ws_ids
+        self.ws_steps = ws_steps
+
+    def start(self, rows, vocab_size):
+        ids = [t for t in self.ws_ids if 0 <= t < vocab_size]
+        self.ws = torch.tensor(ids, dtype=torch.long, device=rows[0].device) if ids else None
+
+    def __call__(self, logits, step):
+        if self.eos_id is not None and step <= self.eos_steps:
+            logits[:, self.eos_id] = BLOCKED
+        if self.ws is not None and step <= self.ws_steps:
+            logits[:, self.ws] = BLOCKED
+        return logits
+
+class LogitsChain(LogitsProcessor):
+    """Runs processors in order on a copy of the logits."""
+
+    def __init__(self, processors: List[LogitsProcessor]):
+        self.processors = processors
+
+    def start(self, rows, vocab_size):
+        for p in self.processors:
+            p.start(rows, vocab_size)
+
+    def append(self, next_ids):
+        for p in self.processors:
+            p.append(next_ids)
+
+    def select(self, keep):
+        for p in self.processors:
+            p.select(keep)
+
+    def __call__(self, logits, step):
+        logits = logits.float().clone()
+        for p in self.processors:
+            logits = p(logits, step)
+        return logits
+
+def top_probs(logits: torch.Tensor, k: int):
+    """Top-k (ids, probs) of softmax(logits) per row, on the CPU, without a
+    full-vocabulary sort."""
+    vals, ids = torch.topk(torch.softmax(logits.float(), dim=-1), min(k, logits.shape[-1]), dim=-1)
+    return ids.cpu(), vals.cpu()
+
+def rank_numpy(logits_row: np.ndarray, temperature: float):
+    """The original numpy sampler's ranking: temperature, stable softmax,
+    argsort(-p). -> (ids, probs) in that order."""
+    if temperature and temperature != 1.0:
+        logits_row = logits_row / float(temperature)
+    exp = np.exp(logits_row - np.max(logits_row))
+    probs = exp / exp.sum()
+    order = np.argsort(-probs)
+    return order, probs[order]
+
+class NucleusSampler:
+    """Top-p sampling with temperature. Only the `candidates` most likely
+    tokens are ranked (torch.topk); a row whose nucleus is larger than
+    that is re-ranked by rank_numpy() from its logits, exactly as the numpy
+    implementation did. Draws come from one numpy RandomState per row, so
+    seeded runs match it."""
+
+    def __init__(self, top_p: float = 0.9, temperature: float = 0.8, log_k: int = 20, candidates: int = 64):
+        self.top_p = top_p
+        self.temperature = temperature
+        self.log_k = log_k
+        self.candidates = candidates
+
+    def sample(self, logits: torch.Tensor, rngs: list):
+        """-> next ids, and the top `log_k` (ids, probs) per row (CPU)."""
+        scaled = logits
+        if self.temperature and self.temperature != 1.0:
+            scaled = logits / float(self.temperature)
+        probs = torch.softmax(scaled, dim=-1)
+        vocab = probs.shape[-1]
+        vals, ids = torch.topk(probs, min(vocab, max(self.candidates, self.log_k)), dim=-1)
+        vals_np, ids_np = vals.cpu().numpy(), ids.cpu().numpy()
+        next_ids = []
+        for b, rng in enumerate(rngs):
+            v, i = vals_np[b], ids_np[b]
+            cumsum = np.cumsum(v)
+            if cumsum[-1] < self.top_p and v.size < vocab:
+                # flat distribution: rank the whole row the numpy way; torch's
+                # softmax differs in the last bits, which reorders near-ties
+                i, v = rank_numpy(logits[b].cpu().numpy(), self.temperature)
+                cumsum = np.cumsum(v)
+            k = min(max(int(np.searchsorted(cumsum, self.top_p, side="left")) + 1, 1), v.size)
+            keep_probs = v[:k] / v[:k].sum()  # renormalize
+            next_ids.append(int(rng.choice(i[:k], p=keep_probs)))
+        k = min(self.log_k, vals.shape[-1])
+        return next_ids, ids[:, :k].cpu(), vals[:, :k].cpu()
@@ -37,3 +37,20 @@ def matplotlib_attention_quick(attn: np.ndarray, tokens_src: List[str], tokens_t
     plt.tight_layout()
     plt.savefig(out_path, dpi=180)
     plt.close()
+
+def matplotlib_attention_grid(attn: np.ndarray, tokens: List[str], titles: List[str], out_path: str):
+    """One small heatmap per head ([heads, T, T]) in a single figure."""
+    cols = min(4, len(attn))
+    rows = (len(attn) + cols - 1) // cols
+    fig, axes = plt.subplots(rows, cols, figsize=(4 * cols, 4 * rows), squeeze=False)
+    for ax, a, title in zip(axes.flat, attn, titles):
+        ax.imshow(a, aspect='auto')
+        ax.set_title(title)
+        if len(tokens) <= 40:
+            ax.set_xticks(range(len(tokens)), tokens, rotation=90, fontsize=6)
+            ax.set_yticks(range(len(tokens)), tokens, fontsize=6)
+    for ax in list(axes.flat)[len(attn):]:
+        ax.axis('off')
+    fig.tight_layout()
+    fig.savefig(out_path, dpi=150)
+    plt.close(fig)